@@ -44,6 +44,17 @@ DEF_INPUT = "Dialog_test.txt"
 DEF_OUTPUT = "Dialog_dialogues.txt"
 DEF_LEGEND = "Legenda_test.txt"
 
+# Потоковий режим: у вікні — лише початок результату (повністю він у вихідному файлі)
+STREAM_PREVIEW_CHARS = 200_000
+
+# Сортування таблиці профілю правил у зведенні: (підпис, ключ рядка профілю)
+PROFILE_SORTS = [
+    ("за часом", "time_ms"),
+    ("за змінами рядків", "lines_changed"),
+    ("за пам'яттю", "mem_delta_kb"),
+    ("за порядком", "order"),
+]
+
 # --------------------- Евристики діалогу для пре-тегу --------------------- #GPT
 # Діалог = рядок, що починається з тире/лапок
 DASHES = "-\u2012\u2013\u2014\u2015"
@@ -70,6 +81,11 @@ class DialogGUI(tk.Tk):
         self._crit_history = ["#g?"]
         self._crit_idx = 0
         self._autosave_after_id = None
+        # Інкрементальна обробка: кеш регіонів між запусками F5
+        self._incr_state = None
+        self._incr_path = None
+        # Останні дані зведення — щоб перемальовувати таблицю профілю при зміні сортування
+        self._last_summary_args = None
 
         self._build_style()
         self._build_layout()
@@ -209,6 +225,21 @@ class DialogGUI(tk.Tk):
         btns.pack(side="left", fill="y")
         self.btn_run = ttk.Button(btns, text="▶ Запустити обробку", command=self._run_processing)
         self.btn_run.pack(fill="x", pady=(0, 8))
+        self.incremental_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(btns, text="Інкрементально (лише змінені блоки)",
+                        variable=self.incremental_var).pack(fill="x", pady=(0, 8))
+        self.result_cache_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(btns, text="Кеш результатів (та сама книга/легенда/правила)",
+                        variable=self.result_cache_var).pack(fill="x", pady=(0, 8))
+        self.profile_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(btns, text="Профіль правил (час кожного правила)",
+                        variable=self.profile_var).pack(fill="x", pady=(0, 4))
+        ttk.Label(btns, text="Сортування профілю:").pack(fill="x")
+        self.profile_sort_var = tk.StringVar(value=PROFILE_SORTS[0][0])
+        self.cmb_profile_sort = ttk.Combobox(btns, textvariable=self.profile_sort_var, state="readonly",
+                                             values=[label for label, _ in PROFILE_SORTS], width=18)
+        self.cmb_profile_sort.pack(fill="x", pady=(0, 12))
+        self.cmb_profile_sort.bind("<<ComboboxSelected>>", lambda _e=None: self._refresh_summary())
         self.btn_zeroshot = ttk.Button(btns, text="Обробити #g? (ML_model)", command=self._run_zeroshot)
         self.btn_zeroshot.pack(fill="x", pady=(0, 12))
         #GPT: нова кнопка — пре-тег #g1/#g? і одразу ML
@@ -415,24 +446,62 @@ class DialogGUI(tk.Tk):
             self._start_worker(self._mock_process, args=(in_path, legend, out_path))
             return
 
-        self._start_worker(self._real_process, args=(in_path, legend, out_path, auto_workers))
+        incremental = bool(self.incremental_var.get()) and hasattr(logic, "process_dialogs_incremental")
+        use_cache = bool(self.result_cache_var.get())
+        profile_rules = bool(self.profile_var.get())
+        self._start_worker(self._real_process,
+                           args=(in_path, legend, out_path, auto_workers, incremental, use_cache, profile_rules))
 
-    def _real_process(self, in_path, legend, out_path, workers):
+    def _real_process(self, in_path, legend, out_path, workers, incremental=False, use_cache=True,
+                      profile_rules=False):
         # Працює у фоні
         self._log_q_put(f"Працює | процесів: {workers}")
+        if hasattr(logic, "PROFILE_RULES"):
+            logic.PROFILE_RULES = profile_rules  # профіль коштує часу — лише на вимогу
+        # Старі improved_logic без кешу результатів не знають use_cache
+        cache_kw = {"use_cache": use_cache} if hasattr(logic, "RESULT_CACHE") else {}
         try:
-            output_text, logs = logic.process_dialogs(in_path, legend, workers=workers)
+            streamed = False
+            counts = None
+            if os.path.getsize(in_path) >= getattr(logic, "STREAM_MIN_BYTES", float("inf")):
+                # Дуже великий файл: правила йдуть регіонами прямо у out_path, без кількох копій книги.
+                # Перевіряється раніше за інкрементальний режим — той читає книгу в пам'ять цілком.
+                self._log_q_put("Великий файл — потоковий режим")
+                _, logs = logic.process_dialogs(in_path, legend, output_path=out_path, streaming=True)
+                with open(out_path, "r", encoding="utf-8") as f:
+                    counts = self._count_tags(f)
+                    f.seek(0)
+                    output_text = f.read(STREAM_PREVIEW_CHARS)
+                if os.path.getsize(out_path) > len(output_text.encode("utf-8")):
+                    output_text += f"\n\n… показано початок; повний результат — у файлі {out_path}\n"
+                streamed = True
+            elif incremental:
+                # Той самий файл → перераховуються лише змінені регіони
+                if os.path.abspath(in_path) != self._incr_path:
+                    self._incr_state, self._incr_path = None, os.path.abspath(in_path)
+                with open(in_path, "r", encoding="utf-8") as f:
+                    src = f.read()
+                output_text, logs, self._incr_state = logic.process_dialogs_incremental(
+                    src, legend, state=self._incr_state, **cache_kw
+                )
+            else:
+                output_text, logs = logic.process_dialogs(in_path, legend, workers=workers, **cache_kw)
 
             # Запис результату у файл
-            try:
-                with open(out_path, "w", encoding="utf-8") as f:
-                    f.write(output_text or "")
+            if not streamed:
+                try:
+                    with open(out_path, "w", encoding="utf-8") as f:
+                        f.write(output_text or "")
+                    self._log_q_put(f"Записано: {out_path}")
+                except Exception as e:
+                    self._log_q_put(f"Помилка запису: {e}")
+            else:
                 self._log_q_put(f"Записано: {out_path}")
-            except Exception as e:
-                self._log_q_put(f"Помилка запису: {e}")
 
             # Побудувати зведений лог і оновити UI у головному потоці
-            summary = self._build_summary(output_text or "", legend or "", logs)
+            profile = logic.last_rule_profile() if hasattr(logic, "last_rule_profile") else None
+            self._last_summary_args = (output_text or "", legend or "", logs, profile, counts)
+            summary = self._build_summary(output_text or "", legend or "", logs, profile=profile, counts=counts)
             self.after(0, lambda: self._set_log_summary(summary))
             self.after(0, lambda: self._set_output_text(output_text or ""))
             self.after(0, lambda: self._set_status("Завершено"))
@@ -463,12 +532,9 @@ class DialogGUI(tk.Tk):
         self._log_q_put("Завершено")
 
     # ----------------- Зведення ----------------- #GPT
-    def _build_summary(self, output_text: str, legend_text: str, logs):
-        # 1) Розбір легенди
-        narrator_tag, narrator_name, mains = self._parse_legend(legend_text)
-
-        # 2) Підрахунки за обробленим текстом
-        lines = [ln for ln in output_text.splitlines() if ln.strip()]
+    @staticmethod
+    def _count_tags(lines):
+        """(рядків з тегом, з них #g?, {#gN: кількість}) — рядки можна читати з файлу по одному."""
         total_dialogs = 0
         unknown_dialogs = 0
         per_group = {}
@@ -488,6 +554,16 @@ class DialogGUI(tk.Tk):
                 if g:
                     tag = g.group(1)
                     per_group[tag] = per_group.get(tag, 0) + 1
+        return total_dialogs, unknown_dialogs, per_group
+
+    def _build_summary(self, output_text: str, legend_text: str, logs, profile=None, counts=None):
+        # 1) Розбір легенди
+        narrator_tag, narrator_name, mains = self._parse_legend(legend_text)
+
+        # 2) Підрахунки за обробленим текстом (counts — уже пораховані, напр. по файлу потокового режиму)
+        if counts is None:
+            counts = self._count_tags(output_text.splitlines())
+        total_dialogs, unknown_dialogs, per_group = counts
 
         narrator_count = per_group.get(narrator_tag, 0) if narrator_tag else 0
 
@@ -537,6 +613,9 @@ class DialogGUI(tk.Tk):
             for name, cnt in sorted(rule_counts.items(), key=lambda kv: (-kv[1], kv[0])):
                 lines_out.append(f"  {name} — {cnt}")
 
+        if profile:
+            lines_out.extend(self._render_rule_profile(profile))
+
         return "\n".join(lines_out) if lines_out else "Немає даних для зведення. Перевірте легенду та вихідний текст."
 
     # ----------------- Оновлення UI: статус/вихід/теги ----------------- #GPT
@@ -683,6 +762,31 @@ class DialogGUI(tk.Tk):
 
         return narrator_tag, narrator_name, mains
 
+    def _render_rule_profile(self, profile):
+        """Таблиця профілю правил (з improved_logic.last_rule_profile()) у вибраному сортуванні."""
+        label = self.profile_sort_var.get() if hasattr(self, "profile_sort_var") else PROFILE_SORTS[0][0]
+        key = dict(PROFILE_SORTS).get(label, "time_ms")
+        if key == "order":
+            rows = list(profile)
+        else:
+            rows = sorted(profile, key=lambda r: -(r.get(key) or 0))
+        total = sum(r.get("time_ms") or 0 for r in profile)
+        out = ["", f"Профіль правил ({label}), всього {total:.0f} мс:",
+               f"  {'правило':<44}{'мс':>9}{'%':>6}{'рядків':>8}{'пам.КБ':>9}"]
+        for r in rows:
+            mem = r.get("mem_delta_kb")
+            mem_s = f"{mem:>9.0f}" if mem is not None else f"{'—':>9}"
+            share = (100.0 * r["time_ms"] / total) if total else 0.0
+            err = "  !" if r.get("errors") else ""
+            out.append(f"  {r['name'][:43]:<44}{r['time_ms']:>9.1f}{share:>6.1f}{r['lines_changed']:>8}{mem_s}{err}")
+        return out
+
+    def _refresh_summary(self):
+        if not self._last_summary_args:
+            return
+        output_text, legend, logs, profile, counts = self._last_summary_args
+        self._set_log_summary(self._build_summary(output_text, legend, logs, profile=profile, counts=counts))
+
     # ----------------- Оновлення UI ----------------- #GPT
     def _set_log_summary(self, text: str):
         self.txt_log.configure(state="normal")
@@ -842,26 +946,42 @@ class DialogGUI(tk.Tk):
             log_path = os.path.join(os.getcwd(), "ml_zeroshot_log.tsv")
 
         ok = False
+        # 0) через запущений сервіс (python zeroshot_service.py --serve) — модель уже завантажена
+        try:
+            import zeroshot_service as zss  # type: ignore
+            if zss.service_available():
+                zss.process_file(input_path=out_path, legend_path=legend_path, output_path=out_path,
+                                 only_unknown=True, log_path=log_path)
+                ok = True
+                self._log_q_put("ML_model: оброблено сервісом")
+        except Exception as e:
+            self._log_q_put(f"ML_model: сервіс не відповів ({e})")
+
         # 1) через import
         zsf = None
-        try:
-            import zeroshot_speaker_models as zsf  # type: ignore
-        except Exception:
+        if not ok:
             try:
-                import ukrroberta_zeroshot_from_files as zsf  # type: ignore
+                import zeroshot_speaker_models as zsf  # type: ignore
             except Exception:
-                zsf = None
-        if zsf and hasattr(zsf, "process_file"):
+                try:
+                    import ukrroberta_zeroshot_from_files as zsf  # type: ignore
+                except Exception:
+                    zsf = None
+        if not ok and zsf and hasattr(zsf, "process_file"):
+            # модель тримається «теплою» у модулі між запусками (див. zsf.get_embedder)
             try:
-                zsf.process_file(input_path=out_path, legend_path=legend_path, output_path=out_path,
-                                 only_unknown=True, log_path=log_path)  # type: ignore
-                ok = True
-                self._log_q_put("ML_model: модульний виклик успішний")
-            except TypeError:
-                zsf.process_file(input_path=out_path, legend_path=legend_path, output_path=out_path,
-                                 only_unknown=True)  # type: ignore
-                ok = True
-                self._log_q_put("ML_model: модульний виклик (сумісність) успішний")
+                try:
+                    zsf.process_file(input_path=out_path, legend_path=legend_path, output_path=out_path,
+                                     only_unknown=True, log_path=log_path)  # type: ignore
+                    ok = True
+                    self._log_q_put("ML_model: модульний виклик успішний")
+                except TypeError:
+                    zsf.process_file(input_path=out_path, legend_path=legend_path, output_path=out_path,
+                                     only_unknown=True)  # type: ignore
+                    ok = True
+                    self._log_q_put("ML_model: модульний виклик (сумісність) успішний")
+            except Exception as e:
+                self._log_q_put(f"ML_model: модульний виклик не вдався ({e}), запуск процесом")
 
         # 2) як процес
         if not ok:
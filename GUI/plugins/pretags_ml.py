@@ -38,10 +38,21 @@ def _run_zeroshot_like_original(app, out_path, legend_text):
 
     ok = False
     try:
-        import zeroshot_speaker_models as zsf  # type: ignore
-    except Exception:
-        zsf = None
-    if zsf and hasattr(zsf, "process_file"):
+        import zeroshot_service as zss  # type: ignore
+        if zss.service_available():
+            zss.process_file(input_path=out_path, legend_path=legend_path, output_path=out_path, only_unknown=True)
+            ok = True
+            app._log_q_put("ML_model: оброблено сервісом (plugin)")
+    except Exception as e:
+        app._log_q_put(f"ML service call failed: {e}")
+
+    zsf = None
+    if not ok:
+        try:
+            import zeroshot_speaker_models as zsf  # type: ignore
+        except Exception:
+            zsf = None
+    if not ok and zsf and hasattr(zsf, "process_file"):
         try:
             zsf.process_file(input_path=out_path, legend_path=legend_path, output_path=out_path, only_unknown=True)
             ok = True
@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+batch_dialogs.py — пакетна обробка багатьох книг конвеєром improved_logic (без GUI)
+
+• Вхід: тека з книгами (*.txt) або маніфест пар «книга ⇥ легенда»
+    - тека: легенда книги X.txt — X.legend.txt або Legenda_X.txt поруч (інакше --legend)
+    - маніфест (.tsv/.txt): рядок «книга<TAB>легенда» (легенда необов'язкова, # — коментар);
+      (.json): [{"book": "...", "legend": "..."}, ...]; відносні шляхи — від теки маніфесту
+• Книги обробляються пулом процесів (--jobs), кожна — process_dialogs(workers=1);
+  книги від improved_logic.STREAM_MIN_BYTES — потоковим режимом, як у GUI (вихід і метрики ті самі).
+• Прогрес у консоль, лог кожної книги — OUT/logs/<книга>.log (разом із друком і трасами правил).
+• Контрольна точка OUT/batch_checkpoint.json: книга, легенда й правила не змінились —
+  книга пропускається при повторному запуску (--force — обробити все заново). Завдання — пара
+  «книга, легенда»: одна книга з різними легендами — окремі рядки підсумку.
+• Підсумок: таблиця з метриками 099_metrics_report (покриття, #g?, точність за gold)
+  + OUT/batch_summary.json; код виходу 1, якщо якась книга впала.
+
+Приклади:
+  python batch_dialogs.py books/ -o out/ --jobs 4
+  python batch_dialogs.py nightly.tsv -o out/ --legend Legenda_test.txt
+  python batch_dialogs.py books/ -o out/ --force --no-cache
+"""
+import io
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import traceback
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CHECKPOINT_NAME = "batch_checkpoint.json"
+SUMMARY_NAME = "batch_summary.json"
+_CHECKPOINT_VERSION = 2
+
+
+# ---- Завдання ----
+
+def _legend_for(book):
+    """Легенда поруч із книгою: X.legend.txt або Legenda_X.txt."""
+    folder, name = os.path.split(book)
+    stem = os.path.splitext(name)[0]
+    for cand in (f"{stem}.legend.txt", f"Legenda_{stem}.txt"):
+        path = os.path.join(folder, cand)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _is_legend_file(name):
+    return name.endswith(".legend.txt") or name.startswith("Legenda_")
+
+
+def jobs_from_dir(folder, default_legend=None):
+    books = sorted(
+        os.path.join(folder, n) for n in os.listdir(folder)
+        if n.lower().endswith(".txt") and not _is_legend_file(n) and os.path.isfile(os.path.join(folder, n))
+    )
+    return [(b, _legend_for(b) or default_legend) for b in books]
+
+
+def jobs_from_manifest(path, default_legend=None):
+    base = os.path.dirname(os.path.abspath(path))
+    resolve = lambda p: p if os.path.isabs(p) else os.path.join(base, p)
+    pairs = []
+    with open(path, "r", encoding="utf-8-sig") as f:
+        if path.lower().endswith(".json"):
+            for item in json.load(f):
+                legend = item.get("legend")
+                pairs.append((resolve(item["book"]), resolve(legend) if legend else default_legend))
+        else:
+            for raw in f:
+                line = raw.strip()
+                if not line or line.startswith("#"):
+                    continue
+                cols = [c.strip() for c in line.split("\t")]
+                legend = cols[1] if len(cols) > 1 and cols[1] else None
+                pairs.append((resolve(cols[0]), resolve(legend) if legend else default_legend))
+    return pairs
+
+
+def _output_names(books):
+    """<ім'я книги>.txt для кожної книги; однакові імена з різних тек → _2, _3…"""
+    used, names = {}, []
+    for book in books:
+        stem = os.path.splitext(os.path.basename(book))[0]
+        n = used.get(stem, 0) + 1
+        used[stem] = n
+        names.append(stem if n == 1 else f"{stem}_{n}")
+    return names
+
+
+# ---- Контрольна точка ----
+
+def _rules_fingerprint():
+    """sha1 модулів конвеєра (improved_logic.PIPELINE_MODULES) і всіх файлів правил —
+    зміна будь-якого скидає контрольну точку."""
+    sys.path.insert(0, HERE)
+    from improved_logic import PIPELINE_MODULES
+
+    h = hashlib.sha1()
+    rules_dir = os.path.join(HERE, "rules")
+    files = [os.path.join(HERE, name) for name in PIPELINE_MODULES] + sorted(
+        os.path.join(rules_dir, n) for n in os.listdir(rules_dir) if n.endswith(".py")
+    )
+    for path in files:
+        h.update(os.path.basename(path).encode("utf-8") + b"\0")
+        with open(path, "rb") as f:
+            h.update(hashlib.sha1(f.read()).digest())
+    return h.hexdigest()
+
+
+def _job_id(book, legend):
+    """Запис контрольної точки — пара «книга, легенда»: та сама книга з іншою легендою — окреме завдання."""
+    return os.path.abspath(book) + "\t" + (os.path.abspath(legend) if legend else "")
+
+
+def _job_key(book, legend, fingerprint):
+    h = hashlib.sha1(fingerprint.encode("ascii"))
+    for path in (book, legend):
+        h.update(b"\0")
+        if path:
+            with open(path, "rb") as f:
+                h.update(f.read())
+    return h.hexdigest()
+
+
+def _load_checkpoint(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get("version") != _CHECKPOINT_VERSION:
+        return {}
+    return data.get("done") or {}
+
+
+def _save_json(path, data):
+    tmp = path + ".part"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+# ---- Обробка однієї книги (у процесі пулу) ----
+
+def _metrics_row(metrics):
+    cov = (metrics or {}).get("coverage") or {}
+    acc = (metrics or {}).get("accuracy") or {}
+    return {
+        "dialog_total": cov.get("dialog_total"),
+        "assigned": cov.get("assigned"),
+        "unknown": cov.get("unknown"),
+        "coverage": cov.get("coverage"),
+        "unknown_rate": cov.get("unknown_rate"),
+        "gold_lines": acc.get("gold_lines"),
+        "accuracy": acc.get("accuracy"),
+        "micro_f1": (acc.get("micro") or {}).get("f1"),
+        "macro_f1": (acc.get("macro") or {}).get("f1"),
+    }
+
+
+def run_book(book, legend, out_path, log_path, use_cache=True):
+    """Обробляє одну книгу; повертає рядок підсумку. Увесь друк правил іде в log_path."""
+    sys.path.insert(0, HERE)
+    import improved_logic as il
+
+    il.ECHO_LOGS_TO_CONSOLE = False
+    row = {"book": book, "legend": legend, "output": out_path, "log": log_path, "status": "ok"}
+    buf = io.StringIO()
+    t0 = time.perf_counter()
+    logs = ""
+    try:
+        with contextlib.redirect_stdout(buf), contextlib.redirect_stderr(buf):
+            legend_text = ""
+            if legend:
+                with open(legend, "r", encoding="utf-8") as f:
+                    legend_text = f.read()
+            streaming = os.path.getsize(book) >= il.STREAM_MIN_BYTES
+            _, logs = il.process_dialogs(book, legend_text=legend_text, workers=1, output_path=out_path,
+                                         streaming=streaming, use_cache=use_cache)
+        row.update(_metrics_row(il.last_run_metadata().get("metrics")))
+    except Exception:
+        row["status"] = "error"
+        row["error"] = traceback.format_exc().strip().splitlines()[-1]
+        logs = "\n".join([logs, traceback.format_exc()])
+    row["seconds"] = round(time.perf_counter() - t0, 3)
+    with open(log_path, "w", encoding="utf-8") as f:
+        f.write(buf.getvalue())
+        f.write("\n=== LOG (improved_logic) ===\n")
+        f.write(logs or "")
+        f.write("\n")
+    return row
+
+
+# ---- Звіт ----
+
+def _pct(v):
+    return f"{v * 100:.1f}%" if isinstance(v, (int, float)) else "—"
+
+
+def _progress_line(k, total, row):
+    name = os.path.basename(row["book"])
+    if row["status"] == "error":
+        return f"[{k}/{total}] ПОМИЛКА  {name}: {row.get('error')}"
+    tail = f"покриття {_pct(row.get('coverage'))}, #g? {row.get('unknown') if row.get('unknown') is not None else '—'}"
+    if row.get("gold_lines"):
+        tail += f", точність {_pct(row.get('accuracy'))}"
+    return f"[{k}/{total}] {row['status']:<7} {name}  {row.get('seconds', 0):.1f} с  ({tail})"
+
+
+def print_summary(rows):
+    print()
+    print(f"{'книга':<32} {'стан':<7} {'с':>7} {'діал.':>6} {'покриття':>9} {'#g?':>5} {'точність':>9}")
+    for r in rows:
+        print(f"{os.path.basename(r['book'])[:32]:<32} {r['status']:<7} {r.get('seconds') or 0:>7.1f} "
+              f"{r.get('dialog_total') if r.get('dialog_total') is not None else '—':>6} "
+              f"{_pct(r.get('coverage')):>9} {r.get('unknown') if r.get('unknown') is not None else '—':>5} "
+              f"{_pct(r.get('accuracy')) if r.get('gold_lines') else '—':>9}")
+    done = [r for r in rows if r["status"] != "error"]
+    tot = sum(r.get("dialog_total") or 0 for r in done)
+    asg = sum(r.get("assigned") or 0 for r in done)
+    print(f"Разом: книг {len(rows)}, помилок {len(rows) - len(done)}, "
+          f"діалогових рядків {tot}, покриття {_pct(asg / tot) if tot else '—'}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Пакетна розстановка #gN-тегів у багатьох книгах")
+    ap.add_argument("input", help="тека з книгами (*.txt) або маніфест (.tsv/.txt/.json)")
+    ap.add_argument("-o", "--out", required=True, help="тека для результатів, логів і контрольної точки")
+    ap.add_argument("--legend", default=None, help="легенда для книг без власної")
+    ap.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="процесів (книг одночасно)")
+    ap.add_argument("--force", action="store_true", help="ігнорувати контрольну точку")
+    ap.add_argument("--no-cache", action="store_true", help="не брати/не класти результат у кеш результатів")
+    args = ap.parse_args(argv)
+
+    if os.path.isdir(args.input):
+        pairs = jobs_from_dir(args.input, args.legend)
+    elif os.path.isfile(args.input):
+        pairs = jobs_from_manifest(args.input, args.legend)
+    else:
+        print(f"Не знайдено: {args.input}")
+        return 1
+    missing = [p for pair in pairs for p in pair if p and not os.path.isfile(p)]
+    if missing:
+        print("Файли не знайдено:\n  " + "\n  ".join(missing))
+        return 1
+    if not pairs:
+        print("Немає книг для обробки")
+        return 0
+
+    log_dir = os.path.join(args.out, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+    ckpt_path = os.path.join(args.out, CHECKPOINT_NAME)
+    done = {} if args.force else _load_checkpoint(ckpt_path)
+    fingerprint = _rules_fingerprint()
+
+    # рядки підсумку — за позицією в маніфесті (одна книга може йти кілька разів з різними легендами)
+    todo, total = [], len(pairs)
+    rows = [None] * total
+    for i, ((book, legend), name) in enumerate(zip(pairs, _output_names([b for b, _ in pairs]))):
+        key = _job_key(book, legend, fingerprint)
+        out_path = os.path.join(args.out, name + ".txt")
+        prev = done.get(_job_id(book, legend))
+        if prev and prev.get("key") == key and os.path.isfile(prev["row"].get("output") or ""):
+            rows[i] = dict(prev["row"], status="skip")
+            continue
+        todo.append((book, legend, out_path, os.path.join(log_dir, name + ".log"), key, i))
+    print(f"Книг: {total}, з контрольної точки: {total - len(todo)}, до обробки: {len(todo)} (процесів: {args.jobs})")
+
+    def finish(k, job, row):
+        rows[job[5]] = row
+        if row["status"] == "ok":
+            done[_job_id(job[0], job[1])] = {"key": job[4], "row": row}
+            _save_json(ckpt_path, {"version": _CHECKPOINT_VERSION, "done": done})
+        print(_progress_line(k, len(todo), row), flush=True)
+
+    use_cache = not args.no_cache
+    if args.jobs <= 1 or len(todo) <= 1:
+        for k, job in enumerate(todo, 1):
+            finish(k, job, run_book(*job[:4], use_cache=use_cache))
+    else:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            futs = {pool.submit(run_book, *job[:4], use_cache=use_cache): job for job in todo}
+            for k, fut in enumerate(as_completed(futs), 1):
+                job = futs[fut]
+                try:
+                    row = fut.result()
+                except Exception as e:  # процес пулу впав (пам'ять тощо)
+                    row = {"book": job[0], "legend": job[1], "output": job[2], "log": job[3],
+                           "status": "error", "error": repr(e)}
+                finish(k, job, row)
+
+    ordered = [r for r in rows if r is not None]
+    _save_json(os.path.join(args.out, SUMMARY_NAME), ordered)
+    print_summary(ordered)
+    return 1 if any(r["status"] == "error" for r in ordered) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
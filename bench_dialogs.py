@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+bench_dialogs.py — бенчмарк конвеєра розстановки діалогів (improved_logic)
+
+• Генерує синтетичні «українські» корпуси потрібного розміру (100 КБ, 1 МБ, 10 МБ…)
+  з тих шаблонів, на які розраховані правила: заголовки глав (038), лід-іни
+  «Тато сказав: …» (073), ремарки після лапок «…», — сказала мама (072),
+  вокативи «Мамо, …» (074/076), репліки від 1-ї особи (073a), «голі» репліки (#g?).
+• Проганяє improved_logic.process_dialogs_in_memory від початку до кінця
+  і бере профіль по кожному правилу з improved_logic.last_rule_profile().
+• Звітує: рядків/с, МБ/с, пікова RSS (кожен розмір — в окремому процесі),
+  найдовші правила; порівнює з базовою лінією (JSON) і позначає регресії.
+
+Приклади:
+  python bench_dialogs.py                               # 100k,1m
+  python bench_dialogs.py --sizes 100k,1m,10m --repeat 3
+  python bench_dialogs.py --save-baseline               # записати bench_baseline.json
+  python bench_dialogs.py --out bench_output.txt        # звіт ще й у файл
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEF_LEGEND = os.path.join(HERE, "Legenda_test.txt")
+DEF_BASELINE = os.path.join(HERE, "bench_baseline.json")
+
+# ---- Синтетичний корпус ----
+# (ім'я, рід, кличний відмінок) — узгоджено з Legenda_test.txt
+CAST = [
+    ("Мама", "F", "мамо"),
+    ("Тато", "M", "тату"),
+    ("Пеґґі", "F", "Пеґґі"),
+    ("Горас", "M", "Горасе"),
+]
+SAY = {"M": ["сказав", "відповів", "спитав", "крикнув", "прошепотів"],
+       "F": ["сказала", "відповіла", "спитала", "крикнула", "прошепотіла"]}
+ACT = {"M": ["підійшов до вікна", "сів біля вогню", "довго мовчав", "поставив кошик на стіл"],
+       "F": ["підійшла до вікна", "сіла біля вогню", "довго мовчала", "поставила кошик на стіл"]}
+UTTER = [
+    "Я нічого не знаю", "Де ти була весь ранок", "Ходи сюди", "Це вже не має значення",
+    "Ми поїдемо завтра", "Не кажи так", "Хто це зробив", "Вогонь майже згас",
+    "Я забула", "Просто скажи правду", "Нам треба поговорити", "Звідки в тебе цей кошик",
+]
+NARR = [
+    "Надворі вже смеркло, і в хаті пахло димом та свіжим хлібом.",
+    "Вітер гнав сніг через подвір'я, засипаючи стежку до курника.",
+    "Ніхто не пам'ятав, коли востаннє в домі було так тихо.",
+    "Горщик на гачку повільно закипав, і вода ледь помітно тремтіла.",
+    "Крізь щілини у віконницях пробивалося бліде світло.",
+]
+SIZES = {"100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+
+
+def _dialog_paragraph(rnd: random.Random) -> str:
+    name, g, voc = rnd.choice(CAST)
+    other = rnd.choice([c for c in CAST if c[0] != name])
+    utt = rnd.choice(UTTER)
+    kind = rnd.randrange(6)
+    if kind == 0:   # ремарка після лапок (072)
+        return f"«{utt}», — {rnd.choice(SAY[g])} {name}."
+    if kind == 1:   # тире + ремарка
+        return f"— {utt}, — {rnd.choice(SAY[g])} {name}."
+    if kind == 2:   # лід-ін із двокрапкою (073)
+        return f"{name} {rnd.choice(SAY[g])}: «{utt}»."
+    if kind == 3:   # вокатив (074/076)
+        return f"«{other[2].capitalize()}, {utt.lower()}?»"
+    if kind == 4:   # перша особа (073a)
+        return f"«Я {rnd.choice(['кажу', 'прошу', 'хочу'])} тобі: {utt.lower()}»."
+    return f"«{utt}!»"  # без атрибуції → #g?
+
+
+def generate_corpus(target_bytes: int, seed: int = 42) -> str:
+    """Детермінований корпус ≈target_bytes байтів UTF-8 (глави по ~40 абзаців)."""
+    rnd = random.Random(seed)
+    out, size, chapter, para_in_ch = [], 0, 0, 40
+    while size < target_bytes:
+        if para_in_ch >= 40:
+            chapter += 1
+            para_in_ch = 0
+            block = f"Глава {chapter}"
+        elif rnd.random() < 0.35:
+            name, g, _ = rnd.choice(CAST)
+            block = f"{name} {rnd.choice(ACT[g])}. {rnd.choice(NARR)}"
+        else:
+            block = _dialog_paragraph(rnd)
+        para_in_ch += 1
+        out.append(block + "\n\n")
+        size += len(block.encode("utf-8")) + 2
+    return "".join(out)
+
+
+def parse_size(tok: str) -> int:
+    tok = tok.strip().lower()
+    if tok in SIZES:
+        return SIZES[tok]
+    m = re.match(r"^(\d+(?:\.\d+)?)\s*([km]?)b?$", tok)
+    if not m:
+        raise ValueError(f"Невідомий розмір: {tok}")
+    return int(float(m.group(1)) * {"": 1, "k": 1_000, "m": 1_000_000}[m.group(2)])
+
+
+# ---- Вимір (у дочірньому процесі — щоб пікова RSS стосувалася одного розміру) ----
+def _peak_rss_mb():
+    try:
+        import resource  # Unix
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+    except Exception:
+        pass
+    try:
+        import psutil  # Windows (якщо встановлено)
+        mi = psutil.Process().memory_info()
+        return getattr(mi, "peak_wset", mi.rss) / (1024 * 1024)
+    except Exception:
+        return None
+
+
+def run_one(size_key: str, legend_path: str, repeat: int, workers: int, seed: int) -> dict:
+    sys.path.insert(0, HERE)
+    import improved_logic as il
+    il.DEBUG_RULES_PRINT = False
+    il.ECHO_LOGS_TO_CONSOLE = False
+    il.PROFILE_RULES = True  # час кожного правила для звіту й порівняння з базовою лінією
+
+    text = generate_corpus(parse_size(size_key), seed=seed)
+    legend = ""
+    if legend_path and os.path.isfile(legend_path):
+        with open(legend_path, "r", encoding="utf-8") as f:
+            legend = f.read()
+
+    best, profile = None, []
+    devnull = open(os.devnull, "w", encoding="utf-8")
+    for _ in range(max(1, repeat)):
+        # правила друкують трейсбеки/відладку — глушимо, щоб не міряти консоль
+        old_out, old_err = sys.stdout, sys.stderr
+        sys.stdout = sys.stderr = devnull
+        try:
+            il.clear_rule_memo()  # кожен повтор — холодний прогін правил
+            t0 = time.perf_counter()
+            il.process_dialogs_in_memory(text, legend, workers=workers, use_cache=False)
+            dt = time.perf_counter() - t0
+        finally:
+            sys.stdout, sys.stderr = old_out, old_err
+        if best is None or dt < best:
+            best, profile = dt, il.last_rule_profile()
+    devnull.close()
+
+    n_lines = text.count("\n")
+    n_mb = len(text.encode("utf-8")) / 1e6
+    return {
+        "size": size_key,
+        "bytes": int(n_mb * 1e6),
+        "lines": n_lines,
+        "seconds": best,
+        "lines_per_s": n_lines / best if best else None,
+        "mb_per_s": n_mb / best if best else None,
+        "peak_rss_mb": _peak_rss_mb(),
+        "rules": {r["name"]: r["time_ms"] for r in profile},
+    }
+
+
+def run_isolated(size_key: str, args) -> dict:
+    cmd = [sys.executable, os.path.abspath(__file__), "--_child", size_key,
+           "--legend", args.legend, "--repeat", str(args.repeat),
+           "--workers", str(args.workers), "--seed", str(args.seed)]
+    res = subprocess.run(cmd, capture_output=True, text=True, encoding="utf-8")
+    if res.returncode != 0:
+        raise RuntimeError(f"{size_key}: дочірній процес завершився з кодом {res.returncode}\n{res.stderr}")
+    return json.loads(res.stdout.strip().splitlines()[-1])
+
+
+# ---- Звіт і порівняння з базовою лінією ----
+def compare(cur: dict, base: dict, tol: float, min_rule_ms: float):
+    """Повертає список рядків-попереджень про регресії."""
+    out = []
+    if not base:
+        return out
+    if base.get("seconds") and cur["seconds"] > base["seconds"] * (1 + tol):
+        out.append(f"  РЕГРЕСІЯ {cur['size']}: {base['seconds']:.2f} с → {cur['seconds']:.2f} с "
+                   f"(+{(cur['seconds'] / base['seconds'] - 1) * 100:.0f}%)")
+    brules = base.get("rules") or {}
+    for name, ms in cur["rules"].items():
+        b = brules.get(name)
+        if b and ms >= min_rule_ms and ms > b * (1 + tol):
+            out.append(f"  РЕГРЕСІЯ {cur['size']} · {name}: {b:.0f} мс → {ms:.0f} мс")
+    return out
+
+
+def format_result(r: dict, top: int) -> list:
+    rss = f"{r['peak_rss_mb']:.0f} МБ" if r.get("peak_rss_mb") is not None else "n/a"
+    lines = [f"[{r['size']}] {r['bytes'] / 1e6:.2f} МБ, {r['lines']} рядків: "
+             f"{r['seconds']:.2f} с | {r['lines_per_s']:.0f} рядків/с | {r['mb_per_s']:.3f} МБ/с | пік RSS {rss}"]
+    total = sum(r["rules"].values()) or 1.0
+    for name, ms in sorted(r["rules"].items(), key=lambda kv: -kv[1])[:top]:
+        lines.append(f"    {name:<44}{ms:>10.1f} мс {100 * ms / total:>5.1f}%")
+    return lines
+
+
+def main():
+    p = argparse.ArgumentParser(description="Бенчмарк improved_logic на синтетичних корпусах")
+    p.add_argument("--sizes", default="100k,1m", help="через кому: 100k,1m,10m або довільні (500k, 2m)")
+    p.add_argument("--repeat", type=int, default=1, help="повторів на розмір (береться найкращий час)")
+    p.add_argument("--workers", type=int, default=1)
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--legend", default=DEF_LEGEND)
+    p.add_argument("--baseline", default=DEF_BASELINE)
+    p.add_argument("--save-baseline", action="store_true", help="записати результати як нову базову лінію")
+    p.add_argument("--tolerance", type=float, default=0.20, help="допуск регресії (0.20 = +20%%)")
+    p.add_argument("--min-rule-ms", type=float, default=50.0, help="ігнорувати регресії правил коротших за це")
+    p.add_argument("--top", type=int, default=8, help="скільки найдовших правил показувати")
+    p.add_argument("--out", default=None, help="дублювати звіт у файл (напр. bench_output.txt)")
+    p.add_argument("--dump-corpus", default=None, help="лише згенерувати корпус першого розміру у файл")
+    p.add_argument("--_child", default=None, help=argparse.SUPPRESS)
+    args = p.parse_args()
+
+    if args._child:
+        res = run_one(args._child, args.legend, args.repeat, args.workers, args.seed)
+        print(json.dumps(res, ensure_ascii=False))
+        return
+
+    sizes = [s.strip() for s in args.sizes.split(",") if s.strip()]
+    if args.dump_corpus:
+        with open(args.dump_corpus, "w", encoding="utf-8") as f:
+            f.write(generate_corpus(parse_size(sizes[0]), seed=args.seed))
+        print(f"Корпус збережено: {args.dump_corpus}")
+        return
+
+    baseline = {}
+    if os.path.isfile(args.baseline):
+        try:
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                baseline = json.load(f).get("sizes", {})
+        except Exception as e:
+            print(f"[bench] не вдалося прочитати базову лінію: {e}")
+
+    report, results, regressions = [], {}, []
+    report.append(f"=== bench_dialogs · workers={args.workers} · repeat={args.repeat} · seed={args.seed} ===")
+    for size in sizes:
+        r = run_isolated(size, args)
+        results[size] = r
+        report.extend(format_result(r, args.top))
+        regressions.extend(compare(r, baseline.get(size), args.tolerance, args.min_rule_ms))
+
+    if baseline:
+        report.append("Регресії відносно базової лінії:" if regressions else "Регресій відносно базової лінії немає.")
+        report.extend(regressions)
+    else:
+        report.append(f"Базова лінія відсутня ({args.baseline}) — запустіть з --save-baseline.")
+
+    if args.save_baseline:
+        merged = dict(baseline)
+        merged.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"sizes": merged}, f, ensure_ascii=False, indent=2)
+        report.append(f"Базову лінію збережено: {args.baseline}")
+
+    text = "\n".join(report)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
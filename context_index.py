@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+context_index.py — префіксні індекси для запитів «назад/вперед від рядка i» без повторних сканувань.
+
+Правила, що йдуть по рядках зверху вниз і змінюють лише поточний рядок, раніше для
+кожної репліки знову проходили рядки вгору/вниз (останній явний мовець, найближчий
+мовець того ж роду, «інший» мовець, сусід через 1–2 порожні/#g1 рядки). На довгих
+ланцюжках #g? це квадратично. Тут:
+
+• SweepIndex — стан «до рядка i» (рядки, що вже остаточні); push() після кожного
+  рядка, запити за O(1): last_speaker / last_with(ключ) / last_other(gid) /
+  skipped_since(j) / block_run_start(blk)
+• ForwardIndex — те саме вперед по знімку ще не оброблених рядків: next_speaker(i)
+  + кількість «пропускних» рядків між i та j за O(1)
+"""
+from __future__ import annotations
+
+from typing import Any, Hashable, Iterable, List, Optional, Tuple
+
+_NO_BLOCK = object()
+_ANY = object()   # ключ «будь-який мовець»
+
+
+class SweepIndex:
+    """Інкрементальний індекс рядків 0..n-1 для запитів назад від поточного рядка n.
+
+    push(speaker, keys, skip, block) — додати наступний рядок:
+      speaker — явний мовець рядка ("#gN") або None;
+      keys    — додаткові ключі (наприклад, рід мовця), для яких пам'ятається останній рядок;
+      skip    — рядок «пропускний» (для skipped_since);
+      block   — ідентифікатор блоку (для block_run_start).
+    """
+
+    def __init__(self) -> None:
+        self.n = 0
+        self._last: dict = {}
+        self._recent: List[Tuple[int, str]] = []   # два останні різні мовці: [(j, gid) новіший, старший]
+        self._skips: List[int] = [0]                # префіксні суми skip
+        self._block: Any = _NO_BLOCK
+        self._run_start = 0
+
+    def push(self, speaker: Optional[str] = None, keys: Iterable[Hashable] = (),
+             skip: bool = False, block: Any = None) -> None:
+        j = self.n
+        if speaker is not None:
+            self._last[_ANY] = (j, speaker)
+            for key in keys:
+                if key is not None:
+                    self._last[key] = (j, speaker)
+            if self._recent and self._recent[0][1] == speaker:
+                self._recent[0] = (j, speaker)
+            else:
+                self._recent = [(j, speaker)] + self._recent[:1]
+        self._skips.append(self._skips[-1] + int(bool(skip)))
+        if block != self._block or j == 0:
+            self._block, self._run_start = block, j
+        self.n = j + 1
+
+    def last_speaker(self) -> Tuple[Optional[int], Optional[str]]:
+        return self._last.get(_ANY, (None, None))
+
+    def last_with(self, key: Hashable) -> Tuple[Optional[int], Optional[str]]:
+        """Останній рядок із мовцем, поданим разом із ключем key."""
+        return self._last.get(key, (None, None))
+
+    def last_other(self, gid: str) -> Tuple[Optional[int], Optional[str]]:
+        """Найближчий мовець, відмінний від gid."""
+        for j, g in self._recent:
+            if g != gid:
+                return j, g
+        return None, None
+
+    def skipped_since(self, j: int) -> int:
+        """Скільки «пропускних» рядків строго між j і поточним рядком n."""
+        return self._skips[self.n] - self._skips[j + 1]
+
+    def block_run_start(self, block: Any) -> Optional[int]:
+        """Початок неперервної серії рядків з block, що закінчується на n-1 (None — рядок n-1 не з block)."""
+        if self.n == 0 or self._block != block:
+            return None
+        return self._run_start
+
+
+class ForwardIndex:
+    """Статичний індекс вперед по знімку рядків: items[j] = (speaker або None, skip)."""
+
+    def __init__(self, items: Iterable[Tuple[Optional[str], bool]]):
+        items = list(items)
+        n = len(items)
+        self._skips = [0] * (n + 1)
+        for j, (_, skip) in enumerate(items):
+            self._skips[j + 1] = self._skips[j] + int(bool(skip))
+        self._next: List[Optional[int]] = [None] * (n + 1)
+        nxt: Optional[int] = None
+        for j in range(n - 1, -1, -1):
+            self._next[j + 1] = nxt
+            if items[j][0] is not None:
+                nxt = j
+        self._next[0] = nxt
+        self._speakers = [sp for sp, _ in items]
+
+    def next_speaker(self, i: int) -> Tuple[Optional[int], Optional[str]]:
+        """Найближчий рядок j > i з мовцем."""
+        j = self._next[i + 1]
+        return (j, self._speakers[j]) if j is not None else (None, None)
+
+    def skipped_between(self, i: int, j: int) -> int:
+        """Скільки «пропускних» рядків строго між i та j (i < j)."""
+        return self._skips[j] - self._skips[i + 1]
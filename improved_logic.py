@@ -4,24 +4,95 @@ improved_logic.py — основна логіка розстановки діа
 • Підтримує підвантаження правил з ./rules
 • Удосконалений fallback оповідача (враховує всі тире/лапки, NBSP/тонкі пробіли)
 • Демоція помилкових "#g1:" перед діалогом у "#g?:"
+• Постпроцеси (фолбек оповідача, демоція, згортання тегів) — один прохід (tests/test_postprocess.py звіряє з трьома)
 • Детальний лог завантаження правил
-• API: process_dialogs(input_path, legend_text, workers=1, output_path=None)
+• Профіль правил (час, змінені рядки, пам'ять) у ctx.metadata["rule_profile"] і last_rule_profile()
+• Інкрементальний режим (process_dialogs_incremental): повторно обробляються лише змінені регіони
+• Паралельний режим (workers > 1, текст від PARALLEL_MIN_CHARS): регіони обробляються у ProcessPoolExecutor —
+  вихід той самий, що й в одному процесі
+• Реєстр правил у межах процесу: модуль перезавантажується лише коли змінився файл (mtime/розмір/хеш)
+• Спільна модель рядків (ctx.lines) для правил із SCOPE="lines" — один розбір на весь конвеєр
+• Потоковий режим (streaming=True): книга читається й пишеться регіонами — пам'ять не росте з розміром файлу,
+  вихід і метрики 099 ті самі, що й у звичайному прогоні
+• Декларації правил (apply.reads / apply.writes): граф залежностей, мемоізація й потоки для правил «лише метадані»
+• Спільний автомат імен легенди (ctx.names, name_matcher.NameIndex) — усі згадки за один прохід рядка
+• Ознаки рядків (ctx.features, line_features.FeatureIndex): діалог, дієслово мовлення, рід, 1-ша особа, звертання
+• Банк регулярок (ctx.patterns, RegexBank): шаблон компілюється раз на процес; REGEX_DIAGNOSTIC
+  знаходить місця в правилах, що компілюють регулярки в циклах (профіль правил + лог)
+• Кеш результатів на диску (result_cache/): той самий текст + легенда + правила + налаштування → миттєва відповідь
+• Пам'ять блоків (result_cache/blocks.sqlite): незмінені регіони виправленого видання не обробляються повторно
+• API: process_dialogs(input_path, legend_text, workers=1, output_path=None, streaming=False, use_cache=True)
+• CLI: python improved_logic.py книга.txt [--legend L.txt] [-o out.txt] [--workers N] [--streaming | --incremental] [--no-cache]
+• Тести (python -m pytest tests): режими регіонів проти цілісного прогону, злитий постпроцес проти трьох проходів
 """
 from __future__ import annotations
 
 import os
 import re
+import copy
+import json
+import pickle
+import time
+import cProfile
+import hashlib
+import sqlite3
+import threading
 import traceback
+import tracemalloc
 import importlib.util
-from typing import Any, Callable, Dict, List, Optional, Tuple
+import sys
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from line_features import FeatureIndex
+from name_matcher import NameIndex
 
 # ---- Налаштування відладки ----
 DEBUG_RULES_PRINT = True          # друк списку завантажених правил у консоль
 DEBUG_FORCE_LOAD_ALL = False      # ігнорувати _should_skip_rule (увімкнути лише для діагностики)
 ECHO_LOGS_TO_CONSOLE = True       # дублювати агрегований лог у консоль
 
+# ---- Профілювання правил ----
+PROFILE_RULES = False             # True — час і змінені рядки кожного правила → ctx.metadata["rule_profile"]
+                                  # (вмикають bench_dialogs.py і перемикач «Профіль правил» у GUI)
+PROFILE_MEMORY = False            # + дельта/пік пам'яті через tracemalloc (помітно сповільнює)
+PROFILE_JSON_PATH: Optional[str] = None      # якщо задано — JSON-звіт після кожного запуску
+PROFILE_CPROFILE_PATH: Optional[str] = None  # якщо задано — cProfile-статистика (.prof) прогону правил
+
 RULES_DIR = os.path.join(os.path.dirname(__file__), "rules")
 
+# ---- Паралельний режим (workers > 1) ----
+SCENE_RULE_NAME = "038_detect_scenes"   # межі глав/сцен для розбиття книги
+SHARED_META_PHASES = (49, 52)           # 049–052b: аліаси/ролі/підказки — рахуються один раз на всю книгу
+PARALLEL_MIN_CHARS = 100_000            # коротші тексти швидше обробити в одному процесі
+INCREMENTAL_GAP = 2                     # регіони ріжуться лише всередині ≥2+2 наративних абзаців поспіль
+
+# ---- Потоковий режим (streaming=True) ----
+STREAM_READ_CHARS = 1 << 18             # шматок читання файлу / вікно пошуку сцен (символів)
+STREAM_MIN_BYTES = 8 * 1024 * 1024      # GUI вмикає потоковий режим для файлів від цього розміру
+
+# Правила з деклараціями reads/writes (див. load_rules)
+RULE_MEMO = False                       # True — повторний запуск на тих самих входах бере метадані з пам'яті
+RULE_MEMO_MAX = 256                     # скільки результатів тримати (найстаріші викидаються)
+RULE_THREADS = 1                        # >1: незалежні правила «лише метадані» поспіль — у потоках
+
+# ---- Банк регулярок (ctx.patterns) ----
+REGEX_BANK_MAX = 4096                   # скільки скомпільованих шаблонів тримати (найстаріші викидаються)
+REGEX_DIAGNOSTIC = False                # рахувати компіляції регулярок у кожному місці правил (сповільнює)
+REGEX_HOT_COMPILES = 100                # з такої кількості за прогін місце вважається «гарячим»
+
+# ---- Кеш результатів (увесь конвеєр) ----
+RESULT_CACHE = True                     # False — завжди рахувати заново (GUI/CLI: use_cache=False, --no-cache)
+RESULT_CACHE_DIR = os.path.join(os.path.dirname(__file__), "result_cache")
+RESULT_CACHE_MAX = 64                   # скільки результатів тримати (найдавніше використані видаляються)
+
+# ---- Пам'ять блоків (інкрементальний режим, між запусками) ----
+BLOCK_MEMO = True                       # результат регіону (діалоговий блок + контекст) за його вмістом → SQLite
+BLOCK_MEMO_PATH = os.path.join(RESULT_CACHE_DIR, "blocks.sqlite")
+BLOCK_MEMO_MAX = 50_000                 # скільки регіонів тримати (найдавніше використані видаляються)
+
 # --- Допоміжні для виявлення діалогів/пробілів ---
 DASHES = "\u002D\u2010\u2011\u2012\u2013\u2014\u2015"  # -, ‐, ‑, ‒, –, —, ―
 
@@ -37,11 +108,211 @@ def _normalize_ws(s: str) -> str:
     )
 
 
+# --- Спільна модель рядків (SCOPE="lines") ---
+# Тире/лапки на початку репліки — так само, як їх розпізнають правила у ./rules
+RULE_DASHES = r"\-\u2012\u2013\u2014\u2015"
+LINE_TAG_RE = re.compile(r"^(\s*)#g(\d+|\?)\s*:\s*(.*)$", re.DOTALL)
+LINE_DIALOG_RE = re.compile(rf"^\s*(?:[{RULE_DASHES}]|[«\"„“”'’])")
+NBSP = "\u00A0"
+
+
+class DocLine:
+    """Один рядок документа, розібраний один раз.
+
+    raw    — рядок як у тексті (з кінцем рядка)
+    core   — raw без кінця рядка; eol — сам кінець рядка ("", "\\n", "\\r\\n", …)
+    indent/gid/body — частини "#gN:" рядка (gid = "1" / "?" / "12"; None — рядок без тегу)
+    is_dialog — тіло (або весь рядок без тегу) починається з тире/лапок
+    scene  — індекс сцени у ctx.metadata["scenes"] (038_detect_scenes) або None
+    """
+
+    __slots__ = ("raw", "core", "eol", "indent", "gid", "body", "is_dialog", "scene")
+
+    def __init__(self, raw: str, scene: Optional[int] = None):
+        self.scene = scene
+        self._parse(raw)
+
+    def _parse(self, raw: str) -> None:
+        core = raw.splitlines()[0] if raw else ""
+        self.raw = raw
+        self.core = core
+        self.eol = raw[len(core):]
+        m = LINE_TAG_RE.match(core)
+        if m:
+            self.indent, self.gid, self.body = m.groups()
+            probe = self.body
+        else:
+            self.indent, self.gid, self.body = "", None, core
+            probe = core
+        self.is_dialog = bool(LINE_DIALOG_RE.match(probe.replace(NBSP, " ")))
+
+    @property
+    def tag(self) -> Optional[str]:
+        return f"#g{self.gid}" if self.gid is not None else None
+
+
+class LineModel:
+    """Документ як список DocLine: розбирається один раз і оновлюється точково.
+
+    Правила з SCOPE="lines" отримують цю модель замість рядка тексту і змінюють
+    її лише через методи нижче — так модель знає, що текст треба перезібрати.
+    """
+
+    def __init__(self, text: str, scene_by_line: Optional[Dict[int, int]] = None):
+        scene_by_line = scene_by_line or {}
+        self.lines: List[DocLine] = [
+            DocLine(raw, scene_by_line.get(i)) for i, raw in enumerate(text.splitlines(keepends=True))
+        ]
+        self._text: Optional[str] = text
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __getitem__(self, i: int) -> DocLine:
+        return self.lines[i]
+
+    def _touch(self) -> None:
+        self._text = None
+        self.version += 1
+
+    def text(self) -> str:
+        if self._text is None:
+            self._text = "".join(ln.raw for ln in self.lines)
+        return self._text
+
+    def set_gid(self, i: int, gid: str) -> None:
+        """Перетегувати рядок: "{indent}#gN: {body}{eol}" (gid як "#gN" або "N")."""
+        ln = self.lines[i]
+        short = gid[2:] if gid.startswith("#g") else gid
+        ln._parse(f"{ln.indent}#g{short}: {ln.body}{ln.eol}")
+        self._touch()
+
+    def set_raw(self, i: int, raw: str) -> None:
+        self.lines[i]._parse(raw)
+        self._touch()
+
+    def insert_before(self, positions, raw: str) -> int:
+        """Вставляє рядок raw перед кожним індексом із positions (за один прохід)."""
+        pos = set(positions)
+        if not pos:
+            return 0
+        out: List[DocLine] = []
+        for i, ln in enumerate(self.lines):
+            if i in pos:
+                out.append(DocLine(raw, ln.scene))
+            out.append(ln)
+        inserted = len(out) - len(self.lines)
+        self.lines = out
+        self._touch()
+        return inserted
+
+    def remove_where(self, pred: Callable[[DocLine], bool]) -> int:
+        kept = [ln for ln in self.lines if not pred(ln)]
+        removed = len(self.lines) - len(kept)
+        if removed:
+            self.lines = kept
+            self._touch()
+        return removed
+
+
+class RegexBank:
+    """Скомпільовані регулярки за (джерело, прапорці) — одна компіляція на процес.
+
+    Внутрішній кеш re спільний для всього процесу й обмежений 512 шаблонами: шаблони
+    з іменами легенди (по два-три на аліас) його витісняють, і правила, що будують
+    регулярку для кожного імені в циклі по рядках, компілюють заново. Банк тримає
+    REGEX_BANK_MAX шаблонів; правила беруть його як ctx.patterns.
+    """
+
+    def __init__(self, max_size: int = REGEX_BANK_MAX):
+        self.max_size = max_size
+        self.compiled = 0
+        self._cache: "OrderedDict[Tuple[Any, int], re.Pattern]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def compile(self, pattern: Any, flags: int = 0) -> "re.Pattern":
+        rx = self._cache.get((pattern, flags))
+        if rx is None:
+            rx = re.compile(pattern, flags)
+            with self._lock:
+                self._cache[(pattern, flags)] = rx
+                self.compiled += 1
+                while len(self._cache) > self.max_size:
+                    self._cache.popitem(last=False)
+        return rx
+
+    def search(self, pattern: Any, string: str, flags: int = 0) -> Optional["re.Match"]:
+        return self.compile(pattern, flags).search(string)
+
+    def match(self, pattern: Any, string: str, flags: int = 0) -> Optional["re.Match"]:
+        return self.compile(pattern, flags).match(string)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+
+REGEX_BANK = RegexBank()
+
+
 class ProcessingContext:
     def __init__(self, legend: Dict[str, str], narrator_tag: str = "#g1"):
         self.legend: Dict[str, str] = legend
         self.narrator_tag: str = narrator_tag
         self.metadata: Dict[str, Any] = {"legend": legend.copy()}
+        # Спільна модель рядків; актуальна, поки її не інвалідує fulltext-правило
+        self.lines: Optional[LineModel] = None
+        # Правила, що впали у цьому контексті (у порядку запуску) — див. _regions_stage
+        self.failed_rules: List[str] = []
+        # Правила, що змінили текст, модель рядків або metadata (у порядку запуску)
+        self.changed_rules: List[str] = []
+        self._names: Optional[NameIndex] = None
+        self._names_key: Optional[frozenset] = None
+        self._features: Optional[FeatureIndex] = None
+
+    @property
+    def names(self) -> NameIndex:
+        """Автомат імен для поточного metadata["legend"] (або ctx.legend).
+
+        Перебудовується лише коли легенда змінилась (049–051 доповнюють аліаси).
+        """
+        legend = self.metadata.get("legend") or self.legend or {}
+        key = frozenset((str(k), str(v)) for k, v in legend.items())
+        if self._names is None or key != self._names_key:
+            self._names, self._names_key = NameIndex({str(k): str(v) for k, v in legend.items()}), key
+        return self._names
+
+    @property
+    def patterns(self) -> RegexBank:
+        """Спільний банк регулярок процесу (REGEX_BANK)."""
+        return REGEX_BANK
+
+    @property
+    def features(self) -> FeatureIndex:
+        """Ознаки рядків за текстом тіла (кеш на весь конвеєр; скидається разом з ctx.names)."""
+        names = self.names
+        if self._features is None or self._features.names is not names:
+            self._features = FeatureIndex(names)
+        return self._features
+
+    def derive(self, metadata: Dict[str, Any]) -> "ProcessingContext":
+        """Контекст регіону: та сама легенда, свої metadata, спільні з цим автомат імен і ознаки рядків.
+
+        Значення metadata книги не копіюються — правила регіону їх лише читають,
+        а свої результати кладуть новими значеннями (не змінюють спільні на місці).
+        """
+        self.features  # будуються тут раз, а не в кожному регіоні
+        sub = ProcessingContext(self.legend, self.narrator_tag)
+        sub.metadata = metadata
+        sub._names, sub._names_key, sub._features = self._names, self._names_key, self._features
+        return sub
 
 
 def parse_legend_text(legend_text: str) -> Tuple[Dict[str, str], Optional[str]]:
@@ -78,8 +349,141 @@ def _should_skip_rule(mod_name: str, scope: str, phase: int) -> bool:
     return False
 
 
+# ---- Реєстр завантажених правил (кеш на весь процес) ----
+# abs шлях → {"mtime_ns", "size", "sha1", "module"}; GUI (F5) не платить за імпорт повторно
+_RULE_REGISTRY: Dict[str, Dict[str, Any]] = {}
+_RULE_REGISTRY_LOCK = threading.Lock()
+
+
+def _file_sha1(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        h.update(f.read())
+    return h.hexdigest()
+
+
+def _load_rule_module(mod_name: str, fpath: str) -> Tuple[Any, bool]:
+    """Повертає (module, з_кешу). Перевиконує модуль лише якщо файл змінився.
+
+    Швидка перевірка — mtime_ns + розмір; якщо вони інші, а вміст той самий
+    (touch, checkout), модуль теж береться з кешу.
+    """
+    key = os.path.abspath(fpath)
+    st = os.stat(key)
+    with _RULE_REGISTRY_LOCK:
+        entry = _RULE_REGISTRY.get(key)
+        if entry and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+            return entry["module"], True
+        digest = _file_sha1(key)
+        if entry and entry["sha1"] == digest:
+            entry["mtime_ns"], entry["size"] = st.st_mtime_ns, st.st_size
+            return entry["module"], True
+
+        spec = importlib.util.spec_from_file_location(mod_name, key)
+        module = importlib.util.module_from_spec(spec)  # type: ignore
+        assert spec and spec.loader
+        spec.loader.exec_module(module)  # type: ignore
+        _RULE_REGISTRY[key] = {
+            "mtime_ns": st.st_mtime_ns,
+            "size": st.st_size,
+            "sha1": digest,
+            "module": module,
+        }
+        return module, False
+
+
+def clear_rule_cache() -> None:
+    """Скидає реєстр правил — наступний load_rules() імпортує все заново."""
+    with _RULE_REGISTRY_LOCK:
+        _RULE_REGISTRY.clear()
+
+
+# ---- Декларації читання/запису ----
+# Ресурси: "text" — текст/модель рядків, "legend" — ctx.legend і ctx.narrator_tag,
+# "meta.<ключ>" — ctx.metadata[ключ], "lines.scene" — DocLine.scene, "*" — будь-що.
+# Правило без декларацій вважається бар'єром (reads = writes = {"*"}).
+# Режими регіонів (паралельний, інкрементальний, потоковий) проганяють правило по кожному
+# регіону окремо, тож його meta-ключі — це стан одного регіону; щоб отримати значення на всю
+# книгу, правило оголошує merge(parts): [{ключ: значення регіону}] → {ключ: значення книги}
+# (див. 099_metrics_report). Правило, що дивиться за межу регіону (вікна, пошук назад через
+# усю книгу), оголошує apply.local = False — тоді воно йде раз по склеєному тексту.
+_ANY = frozenset({"*"})
+
+
+def _declared(module: Any, func: Callable, attr: str) -> Optional[frozenset]:
+    value = getattr(module, attr, getattr(func, attr, None))
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.split(",")
+    return frozenset(str(v).strip() for v in value if str(v).strip())
+
+
+def _meta_only(rule: Dict[str, Any]) -> bool:
+    """Правило задеклароване і пише лише ctx.metadata[...] (текст і модель рядків не чіпає)."""
+    reads, writes = rule.get("reads"), rule.get("writes")
+    if reads is None or writes is None or "*" in reads:
+        return False
+    return all(w.startswith("meta.") and not w.endswith("*") for w in writes)
+
+
+def _overlap(a: frozenset, b: frozenset) -> bool:
+    if "*" in a or "*" in b:
+        return bool(a and b)
+    if a & b:
+        return True
+    for x in a:
+        for y in b:
+            if x.endswith("*") and y.startswith(x[:-1]) or y.endswith("*") and x.startswith(y[:-1]):
+                return True
+    return False
+
+
+def _conflicts(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    """Чи мусять правила a і b виконуватись у заданому порядку (W∩R, R∩W або W∩W)."""
+    ra, wa = a.get("reads") or _ANY, a.get("writes") or _ANY
+    rb, wb = b.get("reads") or _ANY, b.get("writes") or _ANY
+    if a.get("reads") is None or a.get("writes") is None:
+        ra = wa = _ANY
+    if b.get("reads") is None or b.get("writes") is None:
+        rb = wb = _ANY
+    return _overlap(wa, rb) or _overlap(ra, wb) or _overlap(wa, wb)
+
+
+def build_rule_graph(rules: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+    """Граф залежностей: ім'я правила → попередні правила, з якими воно конфліктує.
+
+    Порядок rules (phase, priority) лишається базовим; граф показує, які з
+    сусідніх правил насправді незалежні (їх можна рахувати паралельно/мемоізувати).
+    """
+    graph: Dict[str, List[str]] = {}
+    for i, rule in enumerate(rules):
+        graph[rule["name"]] = [prev["name"] for prev in rules[:i] if _conflicts(prev, rule)]
+    return graph
+
+
+def _check_rule_order(rules: List[Dict[str, Any]]) -> List[str]:
+    """Попередження: правило читає meta-ключ, який пишуть лише пізніші правила."""
+    warnings: List[str] = []
+    for i, rule in enumerate(rules):
+        for res in sorted(rule.get("reads") or ()):
+            if not res.startswith("meta.") or res in (rule.get("writes") or ()):
+                continue
+            earlier = any(res in (r.get("writes") or ()) for r in rules[:i])
+            later = [r["name"] for r in rules[i + 1:] if res in (r.get("writes") or ())]
+            if later and not earlier:
+                warnings.append(f"  ⚠ {rule['name']} читає {res}, але його пише пізніше {', '.join(later)}")
+    return warnings
+
+
 def load_rules(rules_path: str = RULES_DIR) -> Tuple[List[Dict[str, Any]], str]:
-    """Завантажує правила з rules_path і повертає (rules, logs)."""
+    """Завантажує правила з rules_path і повертає (rules, logs).
+
+    Окрім phase/priority/scope правило може задекларувати apply.reads / apply.writes
+    (кортежі ресурсів, див. вище) — тоді воно потрапляє у build_rule_graph(),
+    а правило «лише метадані» ще й мемоізується (RULE_MEMO) та може йти в потоці (RULE_THREADS);
+    apply.local = False — правило не ділиться на регіони (див. _plan_stages).
+    """
     logs: List[str] = []
     loaded: List[Dict[str, Any]] = []
     absdir = os.path.abspath(rules_path)
@@ -107,16 +511,17 @@ def load_rules(rules_path: str = RULES_DIR) -> Tuple[List[Dict[str, Any]], str]:
         print(f"[rules] каталог: {absdir}")
         print(f"[rules] файлів знайдено: {len(file_list)} → {file_list}")
 
+    seen_paths = set()
+    n_cached = 0
     for fname in file_list:
         if not (fname.lower().endswith(".py") and not fname.startswith("__")):
             continue
         mod_name = fname[:-3]
         fpath = os.path.join(rules_path, fname)
+        seen_paths.add(os.path.abspath(fpath))
         try:
-            spec = importlib.util.spec_from_file_location(mod_name, fpath)
-            module = importlib.util.module_from_spec(spec)  # type: ignore
-            assert spec and spec.loader
-            spec.loader.exec_module(module)  # type: ignore
+            module, cached = _load_rule_module(mod_name, fpath)
+            n_cached += int(cached)
 
             apply_func = getattr(module, "apply", None)
             if not callable(apply_func):
@@ -134,25 +539,48 @@ def load_rules(rules_path: str = RULES_DIR) -> Tuple[List[Dict[str, Any]], str]:
                 logs.append(f"  – {fname}: пропущено (scope={scope}, phase={phase})")
                 continue
 
-            loaded.append({
+            rule = {
                 "name": mod_name,
                 "func": apply_func,
                 "phase": int(phase),
                 "priority": int(priority),
                 "scope": scope,
-            })
-            logs.append(f"  ✓ {fname}: phase={phase}, priority={priority}, scope={scope}")
+                "reads": _declared(module, apply_func, "reads"),
+                "writes": _declared(module, apply_func, "writes"),
+                "sha1": _RULE_REGISTRY[os.path.abspath(fpath)]["sha1"],
+                "merge": getattr(module, "merge", getattr(apply_func, "merge", None)),
+                "local": bool(getattr(module, "local", getattr(apply_func, "local", True))),
+            }
+            rule["meta_only"] = _meta_only(rule)
+            loaded.append(rule)
+            decl = ""
+            if rule["reads"] is not None or rule["writes"] is not None:
+                decl = (f", reads={','.join(sorted(rule['reads'] or ())) or '-'}"
+                        f", writes={','.join(sorted(rule['writes'] or ())) or '-'}")
+            if not rule["local"]:
+                decl += ", local=False"
+            logs.append(f"  ✓ {fname}: phase={phase}, priority={priority}, scope={scope}{decl}")
         except Exception as exc:
             logs.append(f"  ✗ {fname}: помилка завантаження ({exc})")
             if DEBUG_RULES_PRINT:
                 print(f"[rules] помилка імпорту {fname}: {exc}")
                 traceback.print_exc()
 
+    # Видалені/перейменовані файли прибираємо з реєстру
+    with _RULE_REGISTRY_LOCK:
+        for key in [k for k in _RULE_REGISTRY if os.path.dirname(k) == absdir and k not in seen_paths]:
+            del _RULE_REGISTRY[key]
+    logs.append(f"Кеш правил: з кешу {n_cached}, імпортовано {len(seen_paths) - n_cached}")
+
     loaded.sort(key=lambda r: (r["phase"], r["priority"]))
     if loaded:
         logs.append("Порядок виконання правил:")
         for i, r in enumerate(loaded, start=1):
             logs.append(f"  {i}. {r['name']} (phase={r['phase']}, priority={r['priority']}, scope={r['scope']})")
+        order_warnings = _check_rule_order(loaded)
+        if order_warnings:
+            logs.append("Порядок правил суперечить деклараціям:")
+            logs.extend(order_warnings)
     else:
         logs.append("Жодних правил не завантажено.")
 
@@ -167,41 +595,877 @@ def load_rules(rules_path: str = RULES_DIR) -> Tuple[List[Dict[str, Any]], str]:
     return loaded, "\n".join(logs)
 
 
-def apply_rules_to_text(input_text: str, rules: List[Dict[str, Any]], ctx: ProcessingContext) -> str:
-    text = input_text
-    for rule in rules:
-        fn: Callable = rule["func"]
-        scope: str = rule["scope"]
+def _count_changed_lines(before: List[str], after: List[str]) -> int:
+    """Скільки рядків правило змінило/додало/видалило (без урахування порядку)."""
+    b, a = Counter(before), Counter(after)
+    return max(sum((a - b).values()), sum((b - a).values()))
+
+
+def _profile_row(rule: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "name": rule["name"],
+        "phase": rule["phase"],
+        "priority": rule["priority"],
+        "scope": rule["scope"],
+        "calls": 0,
+        "time_ms": 0.0,
+        "lines_changed": 0,
+        "mem_delta_kb": None,
+        "mem_peak_kb": None,
+        "errors": 0,
+        "memo_hits": 0,
+        "regex_compiles": 0,
+        "regex_sites": {},
+    }
+
+
+def _merge_rule_profile(dst: List[Dict[str, Any]], src: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Додає рядки профілю src до dst (за іменем правила) — для глав/регіонів."""
+    by_name = {row["name"]: row for row in dst}
+    for row in src:
+        cur = by_name.get(row["name"])
+        if cur is None:
+            cur = by_name[row["name"]] = dict(row)
+            dst.append(cur)
+            continue
+        for key in ("calls", "time_ms", "lines_changed", "errors", "memo_hits", "regex_compiles"):
+            cur[key] = cur.get(key, 0) + row.get(key, 0)
+        if row.get("regex_sites"):
+            sites = cur["regex_sites"] = dict(cur.get("regex_sites") or {})
+            for line, n in row["regex_sites"].items():
+                sites[line] = sites.get(line, 0) + n
+        for key in ("mem_delta_kb", "mem_peak_kb"):
+            if row[key] is not None:
+                cur[key] = row[key] if cur[key] is None else (
+                    cur[key] + row[key] if key == "mem_delta_kb" else max(cur[key], row[key])
+                )
+    return dst
+
+
+# ---- Мемоізація правил «лише метадані» ----
+# (ім'я, sha1 модуля, відбиток прочитаних ресурсів) → {meta-ключ: значення після правила}
+_RULE_MEMO: "OrderedDict[Tuple[str, str, str], Dict[str, Any]]" = OrderedDict()
+_RULE_MEMO_LOCK = threading.Lock()
+_MISSING = object()
+
+
+def clear_rule_memo() -> None:
+    with _RULE_MEMO_LOCK:
+        _RULE_MEMO.clear()
+
+
+def _snapshot(value: Any) -> Any:
+    return value if value is _MISSING else copy.deepcopy(value)
+
+
+def _rule_memo_key(rule: Dict[str, Any], text: str, ctx: ProcessingContext) -> Tuple[str, str, str]:
+    h = hashlib.sha1()
+    for res in sorted(rule["reads"]):
+        h.update(res.encode("utf-8") + b"\0")
+        if res == "text":
+            h.update(text.encode("utf-8", "surrogatepass"))
+        elif res == "legend":
+            h.update(repr((ctx.legend, ctx.narrator_tag)).encode("utf-8", "surrogatepass"))
+        elif res.startswith("meta."):
+            value = ctx.metadata.get(res[5:], _MISSING)
+            h.update(b"\1" if value is _MISSING else repr(value).encode("utf-8", "surrogatepass"))
+        h.update(b"\0")
+    return rule["name"], rule["sha1"], h.hexdigest()
+
+
+def _run_meta_rule(rule: Dict[str, Any], text: str, ctx: ProcessingContext,
+                   memo_store: bool = True, measure_mem: bool = False) -> Optional[Dict[str, Any]]:
+    """Виконує правило «лише метадані» (текст і ctx.lines лишаються як є) з мемоізацією.
+
+    Пам'ятаються лише ті meta-ключі з writes, що правило справді змінило, —
+    при влучанні вони накладаються на ctx.metadata так само, як це зробило б правило.
+    """
+    row = _profile_row(rule) if PROFILE_RULES else None
+    if row is not None:
+        if measure_mem:
+            tracemalloc.reset_peak()
+            mem0 = tracemalloc.get_traced_memory()[0]
+        t0 = time.perf_counter()
+    keys = [w[5:] for w in rule["writes"]]
+    memo_key = _rule_memo_key(rule, text, ctx) if RULE_MEMO else None
+    with _RULE_MEMO_LOCK:
+        hit = _RULE_MEMO.get(memo_key) if memo_key is not None else None
+        if hit is not None:
+            _RULE_MEMO.move_to_end(memo_key)
+    if hit is not None:
+        for k, v in hit.items():
+            if v is _MISSING:
+                ctx.metadata.pop(k, None)
+            else:
+                ctx.metadata[k] = copy.deepcopy(v)
+        if row is not None:
+            row["memo_hits"] = 1
+    else:
+        before = {k: _snapshot(ctx.metadata.get(k, _MISSING)) for k in keys} if memo_key else None
         try:
-            if scope == "fulltext":
-                text = fn(text, ctx)  # type: ignore
-            elif scope == "paragraph":
-                paragraphs = text.split("\n\n")
-                new_paras = []
-                for p in paragraphs:
+            if rule["scope"] == "lines":
+                # модель будується лише при промаху — влучання не платить за розбір
+                if ctx.lines is None:
+                    ctx.lines = LineModel(text, ctx.metadata.get("scene_index_by_line"))
+                rule["func"](ctx.lines, ctx)
+            elif rule["scope"] == "fulltext":
+                rule["func"](text, ctx)
+            elif rule["scope"] == "paragraph":
+                for p in text.split("\n\n"):
                     try:
-                        new_paras.append(fn(p, ctx))  # type: ignore
+                        rule["func"](p, ctx)
                     except Exception:
-                        new_paras.append(p)
-                text = "\n\n".join(new_paras)
+                        pass
             else:
-                lines = text.splitlines(keepends=True)
-                new_lines: List[str] = []
-                for ln in lines:
+                for ln in text.splitlines(keepends=True):
                     try:
-                        new_lines.append(fn(ln, ctx))  # type: ignore
+                        rule["func"](ln, ctx)
                     except Exception:
-                        new_lines.append(ln)
-                text = "".join(new_lines)
+                        pass
         except Exception:
-            # не валимо увесь конвеєр через одне правило
             traceback.print_exc()
+            before = None
+            ctx.failed_rules.append(rule["name"])
+            if row is not None:
+                row["errors"] += 1
+        if before is not None and memo_store:
+            delta = {}
+            for k in keys:
+                after = ctx.metadata.get(k, _MISSING)
+                if (after is _MISSING) != (before[k] is _MISSING) or (after is not _MISSING and after != before[k]):
+                    delta[k] = _snapshot(after)
+            with _RULE_MEMO_LOCK:
+                _RULE_MEMO[memo_key] = delta
+                while len(_RULE_MEMO) > RULE_MEMO_MAX:
+                    _RULE_MEMO.popitem(last=False)
+    if row is not None:
+        row["calls"] = 1
+        row["time_ms"] = (time.perf_counter() - t0) * 1000.0
+        if measure_mem:
+            cur, peak = tracemalloc.get_traced_memory()
+            row["mem_delta_kb"] = (cur - mem0) / 1024.0
+            row["mem_peak_kb"] = (peak - mem0) / 1024.0
+    return row
+
+
+def _meta_marks(meta: Dict[str, Any]) -> Dict[str, Tuple[int, Optional[int]]]:
+    """Відбиток metadata для ctx.changed_rules: ключ → (id значення, довжина).
+
+    Заміна значення чи дописування в список/словник його змінюють; правка
+    вкладеного значення на місці — ні (правила так метадані не пишуть).
+    """
+    return {k: (id(v), len(v) if isinstance(v, (dict, list, set, tuple, str)) else None)
+            for k, v in meta.items() if k != "rule_profile"}
+
+
+def _meta_batch(rules: List[Dict[str, Any]], start: int) -> List[Dict[str, Any]]:
+    """Найдовша серія правил «лише метадані» від start, що попарно не конфліктують."""
+    batch: List[Dict[str, Any]] = []
+    for rule in rules[start:]:
+        if not rule.get("meta_only") or any(_conflicts(prev, rule) for prev in batch):
+            break
+        batch.append(rule)
+    return batch
+
+
+# Перехоплювач re._compile один на процес: ставиться першим _count_regex_compiles і знімається
+# останнім (лічильник користувачів під замком), а рахує лише в потоці, що відкрив лічильник —
+# правила «лише метадані» в інших потоках не затирають re._compile і не потрапляють у чужий Counter.
+_RE_COMPILE = getattr(re, "_compile", None)
+_RE_FILE = re.__file__ or ""
+_RE_PREFIX = os.path.dirname(_RE_FILE) + os.sep if _RE_FILE.endswith("__init__.py") else _RE_FILE
+_REGEX_HOOK_LOCK = threading.Lock()
+_REGEX_HOOK_USERS = 0
+_REGEX_SINK = threading.local()  # .sink = (Counter, префікс теки правил) для поточного потоку
+
+
+def _counting_compile(pattern, flags, *args, **kwargs):
+    sink = getattr(_REGEX_SINK, "sink", None)
+    if sink is not None and isinstance(pattern, (str, bytes)):
+        sites, rules_prefix = sink
+        f = sys._getframe(1)
+        while f is not None and f.f_code.co_filename.startswith(_RE_PREFIX):
+            f = f.f_back
+        if f is not None and os.path.abspath(f.f_code.co_filename).startswith(rules_prefix):
+            name = os.path.splitext(os.path.basename(f.f_code.co_filename))[0]
+            sites[(name, f.f_lineno)] += 1
+    return _RE_COMPILE(pattern, flags, *args, **kwargs)
+
+
+@contextmanager
+def _count_regex_compiles() -> Iterator[Counter]:
+    """Рахує звернення до компілятора re з файлів правил у поточному потоці: Counter[(ім'я правила, рядок)].
+
+    Перехоплюється re._compile — через нього йдуть і re.compile, і re.search/match/sub
+    з рядком-шаблоном (влучання у внутрішній кеш re теж рахуються: форматування
+    шаблону й пошук у кеші на кожній ітерації — саме те, що треба винести з циклу).
+    """
+    global _REGEX_HOOK_USERS
+    sites: Counter = Counter()
+    if _RE_COMPILE is None:
+        yield sites
+        return
+    with _REGEX_HOOK_LOCK:
+        if _REGEX_HOOK_USERS == 0:
+            re._compile = _counting_compile
+        _REGEX_HOOK_USERS += 1
+    prev = getattr(_REGEX_SINK, "sink", None)
+    _REGEX_SINK.sink = (sites, os.path.abspath(RULES_DIR) + os.sep)
+    try:
+        yield sites
+    finally:
+        _REGEX_SINK.sink = prev
+        with _REGEX_HOOK_LOCK:
+            _REGEX_HOOK_USERS -= 1
+            if _REGEX_HOOK_USERS == 0:
+                re._compile = _RE_COMPILE
+
+
+def apply_rules_to_text(input_text: str, rules: List[Dict[str, Any]], ctx: ProcessingContext) -> str:
+    """Проганяє правила по черзі.
+
+    Текст і спільна модель рядків (ctx.lines) живуть паралельно: модель будується
+    лише коли її просить правило SCOPE="lines", а рядок тексту збирається з моделі
+    лише коли його просить fulltext/paragraph/line-правило. Правило, що повернуло
+    той самий текст (аналітичні 038/042/049–053…), модель не інвалідує.
+
+    Правила «лише метадані» (див. load_rules) ідуть через _run_meta_rule: при
+    RULE_MEMO — мемоізація, при RULE_THREADS > 1 незалежні сусіди рахуються в потоках.
+
+    При PROFILE_RULES кожне правило додає рядок у ctx.metadata["rule_profile"];
+    при REGEX_DIAGNOSTIC — ще й компіляції регулярок за місцями у файлі правила.
+    """
+    if not (REGEX_DIAGNOSTIC and PROFILE_RULES):
+        return _apply_rules(input_text, rules, ctx)
+    with _count_regex_compiles() as sites:
+        text = _apply_rules(input_text, rules, ctx)
+    rows = {row["name"]: row for row in ctx.metadata.get("rule_profile") or []}
+    for (name, line), n in sites.items():
+        row = rows.get(name)
+        if row is not None:
+            row["regex_compiles"] = row.get("regex_compiles", 0) + n
+            row.setdefault("regex_sites", {})[line] = row.get("regex_sites", {}).get(line, 0) + n
+    return text
+
+
+def _apply_rules(input_text: str, rules: List[Dict[str, Any]], ctx: ProcessingContext) -> str:
+    text: Optional[str] = input_text
+    ctx.lines = None
+    rows: List[Dict[str, Any]] = []
+    started_tracing = False
+    if PROFILE_RULES and PROFILE_MEMORY and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        started_tracing = True
+
+    i = 0
+    while i < len(rules):
+        rule = rules[i]
+        marks = _meta_marks(ctx.metadata)
+        if rule.get("meta_only"):
+            batch = _meta_batch(rules, i) if RULE_THREADS > 1 else [rule]
+            if text is None:
+                text = ctx.lines.text()  # type: ignore[union-attr]
+            if len(batch) > 1:
+                if ctx.lines is None and any(r["scope"] == "lines" for r in batch):
+                    ctx.lines = LineModel(text, ctx.metadata.get("scene_index_by_line"))
+                with ThreadPoolExecutor(max_workers=min(RULE_THREADS, len(batch))) as pool:
+                    batch_rows = list(pool.map(lambda r: _run_meta_rule(r, text, ctx, memo_store=False), batch))
+            else:
+                batch_rows = [_run_meta_rule(rule, text, ctx, measure_mem=PROFILE_MEMORY and tracemalloc.is_tracing())]
+            rows.extend(r for r in batch_rows if r is not None)
+            if _meta_marks(ctx.metadata) != marks:
+                ctx.changed_rules.extend(r["name"] for r in batch)
+            i += len(batch)
             continue
+        i += 1
+        fn: Callable = rule["func"]
+        scope: str = rule["scope"]
+        row = _profile_row(rule) if PROFILE_RULES else None
+        snapshot: Optional[List[str]] = None
+        changed = False
+        if row is not None:
+            if PROFILE_MEMORY:
+                tracemalloc.reset_peak()
+                mem0 = tracemalloc.get_traced_memory()[0]
+            t0 = time.perf_counter()
+        try:
+            if scope == "lines":
+                if ctx.lines is None:
+                    ctx.lines = LineModel(text or "", ctx.metadata.get("scene_index_by_line"))
+                version0 = ctx.lines.version
+                if row is not None:
+                    snapshot = [ln.raw for ln in ctx.lines]
+                # Правило змінює модель на місці; при винятку часткові зміни лишаються
+                text = None
+                fn(ctx.lines, ctx)  # type: ignore
+                changed = ctx.lines.version != version0
+                if row is not None and changed:
+                    row["lines_changed"] = _count_changed_lines(snapshot, [ln.raw for ln in ctx.lines])
+            else:
+                if text is None:
+                    text = ctx.lines.text()  # type: ignore[union-attr]
+                before = text
+                if scope == "fulltext":
+                    text = fn(text, ctx)  # type: ignore
+                elif scope == "paragraph":
+                    paragraphs = text.split("\n\n")
+                    new_paras = []
+                    for p in paragraphs:
+                        try:
+                            new_paras.append(fn(p, ctx))  # type: ignore
+                        except Exception:
+                            new_paras.append(p)
+                    text = "\n\n".join(new_paras)
+                else:
+                    lines = text.splitlines(keepends=True)
+                    new_lines: List[str] = []
+                    for ln in lines:
+                        try:
+                            new_lines.append(fn(ln, ctx))  # type: ignore
+                        except Exception:
+                            new_lines.append(ln)
+                    text = "".join(new_lines)
+                changed = text is not before and text != before
+                if changed and ctx.lines is not None:
+                    ctx.lines = None  # текст змінено поза моделлю → наступне lines-правило розбере заново
+                if changed and row is not None:
+                    row["lines_changed"] = _count_changed_lines(
+                        before.splitlines(keepends=True), text.splitlines(keepends=True)
+                    )
+        except Exception:
+            # не валимо увесь конвеєр через одне правило
+            traceback.print_exc()
+            ctx.failed_rules.append(rule["name"])
+            if row is not None:
+                row["errors"] += 1
+        if changed or _meta_marks(ctx.metadata) != marks:
+            ctx.changed_rules.append(rule["name"])
+        if row is not None:
+            row["calls"] = 1
+            row["time_ms"] = (time.perf_counter() - t0) * 1000.0
+            if PROFILE_MEMORY:
+                cur, peak = tracemalloc.get_traced_memory()
+                row["mem_delta_kb"] = (cur - mem0) / 1024.0
+                row["mem_peak_kb"] = (peak - mem0) / 1024.0
+            rows.append(row)
+
+    if started_tracing:
+        tracemalloc.stop()
+    if rows:
+        _merge_rule_profile(ctx.metadata.setdefault("rule_profile", []), rows)
+    if text is None:
+        text = ctx.lines.text()  # type: ignore[union-attr]
     return text
 
 
+# ---- Спільні правила й сцени ----
+
+def _detect_scenes_meta(doc: LineModel, rules: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Проганяє 038_detect_scenes на doc у чернетковому контексті й повертає його metadata."""
+    scene_rule = next((r for r in rules if r["name"] == SCENE_RULE_NAME), None)
+    probe = ProcessingContext(legend={})
+    if scene_rule is not None:
+        try:
+            scene_rule["func"](doc, probe)
+        except Exception:
+            traceback.print_exc()
+    return probe.metadata
+
+
+def _process_regions(payload: Dict[str, Any]) -> List[Tuple["_RegionOut", List[Dict[str, Any]]]]:
+    """Робота одного процесу паралельного режиму: _run_region для пачки регіонів.
+
+    Правила процес завантажує сам (реєстр правил — свій у кожному процесі);
+    payload["stage"] — номер етапу в _plan_stages, payload["regions"] — [(стан регіону, ключ)].
+    """
+    global DEBUG_RULES_PRINT, ECHO_LOGS_TO_CONSOLE, PROFILE_RULES, PROFILE_MEMORY
+    DEBUG_RULES_PRINT = payload["debug"]
+    ECHO_LOGS_TO_CONSOLE = False
+    PROFILE_RULES, PROFILE_MEMORY = payload["profile"]
+    rules, _ = load_rules(payload["rules_dir"])
+    _, stage = _plan_stages(rules)[payload["stage"]]
+    active = [r for r in stage if r["name"] not in payload["skip"]]
+    base = ProcessingContext(payload["legend"], payload["narrator_tag"])
+    base.metadata = payload["book_meta"]
+    return [_run_region(region, key, active, base) for region, key in payload["regions"]]
+
+
+def _run_rules(src: str, rules: List[Dict[str, Any]], ctx: ProcessingContext,
+               workers: int, logs_parts: List[str]) -> str:
+    """Правила по всьому тексту; workers > 1 (і текст від PARALLEL_MIN_CHARS) — по регіонах у процесах."""
+    profiler = cProfile.Profile() if PROFILE_CPROFILE_PATH else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        if workers > 1 and len(src) >= PARALLEL_MIN_CHARS:
+            result = _apply_rules_regions(src, rules, ctx, logs_parts, workers=workers)
+        else:
+            result = apply_rules_to_text(src, rules, ctx)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            try:
+                profiler.dump_stats(PROFILE_CPROFILE_PATH)
+                note = " (регіони в інших процесах не враховано)" if workers > 1 else ""
+                logs_parts.append(f"cProfile: {PROFILE_CPROFILE_PATH}{note}")
+            except Exception as e:
+                logs_parts.append(f"cProfile: помилка запису ({e})")
+    return result
+
+
+# Профіль останнього запуску (для GUI: зведення без доступу до ctx)
+_LAST_RULE_PROFILE: List[Dict[str, Any]] = []
+
+
+def last_rule_profile() -> List[Dict[str, Any]]:
+    """Рядки профілю правил останнього process_dialogs*/incremental (у порядку виконання)."""
+    return list(_LAST_RULE_PROFILE)
+
+
+# Метадані останнього запуску (метрики 099, сцени, …) — з ctx або з кешу результатів
+_LAST_METADATA: Dict[str, Any] = {}
+
+
+def last_run_metadata() -> Dict[str, Any]:
+    """ctx.metadata останнього process_dialogs*/incremental (без rule_profile)."""
+    return dict(_LAST_METADATA)
+
+
+def _remember_metadata(ctx: ProcessingContext) -> None:
+    global _LAST_METADATA
+    _LAST_METADATA = {k: v for k, v in ctx.metadata.items() if k != "rule_profile"}
+
+
+def _finish_rule_profile(ctx: ProcessingContext, logs_parts: List[str]) -> None:
+    """Зберігає профіль як last_rule_profile(), пише JSON (PROFILE_JSON_PATH) і топ-5 у лог."""
+    global _LAST_RULE_PROFILE
+    rows = ctx.metadata.get("rule_profile") or []
+    _LAST_RULE_PROFILE = rows
+    if not rows:
+        return
+    total = sum(r["time_ms"] for r in rows)
+    top = sorted(rows, key=lambda r: -r["time_ms"])[:5]
+    logs_parts.append(
+        f"Профіль правил: {total:.0f} мс; найдовші: "
+        + ", ".join(f"{r['name']} {r['time_ms']:.0f} мс" for r in top)
+    )
+    hot = sorted(
+        ((n, r["name"], line) for r in rows for line, n in (r.get("regex_sites") or {}).items()
+         if n >= REGEX_HOT_COMPILES),
+        reverse=True,
+    )
+    if hot:
+        logs_parts.append(
+            "Регулярки в гарячих циклах (винесіть на рівень модуля або ctx.patterns): "
+            + ", ".join(f"{name}.py:{line} ×{n}" for n, name, line in hot[:10])
+        )
+    if PROFILE_JSON_PATH:
+        try:
+            with open(PROFILE_JSON_PATH, "w", encoding="utf-8") as f:
+                json.dump({"total_ms": total, "rules": rows}, f, ensure_ascii=False, indent=2)
+            logs_parts.append(f"Профіль правил збережено: {PROFILE_JSON_PATH}")
+        except Exception as e:
+            logs_parts.append(f"Профіль правил: помилка запису ({e})")
+
+
+# ---- Режими регіонів: паралельний, інкрементальний, потоковий ----
+# Звичайний прогін — apply_rules_to_text по всьому тексту. Режими регіонів ріжуть книгу на
+# регіони (_split_regions) і ведуть їх через правила етапами (_plan_stages):
+#   «regions» — підряд локальні правила, по кожному регіону окремо (процеси, кеш, пам'ять блоків);
+#   «shared»  — спільні правила 049–052b, раз на рядки легенди з усіх регіонів;
+#   «book»    — правило з apply.local = False (074, 076), раз по склеєному тексту регіонів.
+# Тож вихід той самий, що й у цілісному прогоні (tests/test_modes.py). Метадані книги
+# (легенда, спільні, записані «book»-правилами) бачать усі регіони; власні метадані регіону
+# (сцени, блоки, …) переходять з етапу в етап у _RegionOut.meta.
+# Ознаки репліки всередині абзацу: лапки або тире, відокремлене пробілами
+_REGION_DIALOG_HINT = re.compile(rf"[«»„“”\"]|\s[{RULE_DASHES}]\s")
+# Спільні правила 049–052b читають із тексту лише легенду («Легенда:» + рядки "#gN - Ім'я", 050),
+# тож їм віддаються тільки такі рядки (і перший непорожній рядок після них — кінець блоку).
+_SHARED_META_LINE_RE = re.compile(r"^\s*(?:#g\d+\s*-|Легенда\s*:?\s*$)", re.IGNORECASE)
+
+
+class IncrementalState:
+    """Стан між запусками process_dialogs_incremental().
+
+    regions   — {ключ входу етапу (_stage_key): стан регіону після етапу} для останнього входу
+    signature — легенда/набір правил, за яких кеш дійсний
+    """
+
+    def __init__(self):
+        self.signature: Optional[Tuple[Any, ...]] = None
+        self.regions: Dict[str, "_RegionOut"] = {}
+
+
+def _iter_paragraphs(lines: Iterable[DocLine], heading_at: Dict[int, str]) -> Iterator[Tuple[int, List[str], bool]]:
+    """Абзаци потоку рядків: (індекс першого рядка, сирі рядки, діалоговий?).
+
+    Абзац — непорожні рядки разом із порожніми після них; заголовок сцени завжди
+    починає новий абзац.
+    """
+    cur: Optional[List[Any]] = None
+    prev_blank = True
+    for i, ln in enumerate(lines):
+        blank = not ln.core.strip()
+        if cur is None or (not blank and (prev_blank or i in heading_at)):
+            if cur is not None:
+                yield cur[0], cur[1], cur[2]
+            cur = [i, [], False]
+        cur[1].append(ln.raw)
+        if not blank and (ln.is_dialog or _REGION_DIALOG_HINT.search(ln.core)):
+            cur[2] = True
+        prev_blank = blank
+    if cur is not None:
+        yield cur[0], cur[1], cur[2]
+
+
+def _iter_regions(lines: Iterable[DocLine], heading_at: Dict[int, str],
+                  current: Optional[str]) -> Iterator[Tuple[str, Optional[str]]]:
+    """Регіони потоку рядків: (текст регіону, сцена на його початку).
+
+    Межа ставиться перед заголовком сцени (038) і посеред спокійної розповіді —
+    коли по INCREMENTAL_GAP абзаців з кожного боку не мають лапок/тире. Наперед
+    читається лише INCREMENTAL_GAP абзаців: у пам'яті один регіон + це перекриття.
+    current — сцена для тексту до першого заголовка.
+    """
+    paras = _iter_paragraphs(lines, heading_at)
+    first = next(paras, None)
+    if first is None:
+        return
+    if first[0] in heading_at:
+        current = heading_at[first[0]]
+    scene = current
+    parts: List[str] = list(first[1])
+    behind: deque = deque([first[2]], maxlen=INCREMENTAL_GAP)  # діалоговість попередніх абзаців
+    ahead: deque = deque()                                     # абзац-кандидат на межу + наступні
+    exhausted = False
+    while True:
+        while not exhausted and len(ahead) < INCREMENTAL_GAP:
+            para = next(paras, None)
+            if para is None:
+                exhausted = True
+            else:
+                ahead.append(para)
+        if not ahead:
+            break
+        p_start, p_raw, p_dialog = ahead[0]
+        calm = not any(behind) and not any(p[2] for p in ahead)
+        if p_start in heading_at or calm:
+            yield "".join(parts), scene
+            parts, scene = [], current
+        if p_start in heading_at:
+            current = scene = heading_at[p_start]
+        parts.extend(p_raw)
+        behind.append(p_dialog)
+        ahead.popleft()
+    if parts:
+        yield "".join(parts), scene
+
+
+def _split_regions(text: str, rules: List[Dict[str, Any]]) -> List[Tuple[str, Optional[str]]]:
+    """Ріже вхід на регіони, які локальні правила обробляють незалежно.
+
+    Повертає [(текст регіону, сцена на його початку)]; заголовок сцени завжди
+    відкриває регіон, тож уся сцена регіону — це сцена з ключа.
+    """
+    doc = LineModel(text)
+    scenes = _detect_scenes_meta(doc, rules).get("scenes") or []
+    heading_at = {sc["line"]: sc["label"] for sc in scenes}
+    # як у цілісному прогоні: до першого заголовка 053 бачить останню сцену книги
+    current = scenes[-1]["label"] if scenes else None
+    return list(_iter_regions(doc.lines, heading_at, current))
+
+
+class _RegionOut(NamedTuple):
+    """Стан регіону після етапу правил."""
+    text: str
+    meta: Dict[str, Any]              # власні метадані регіону (поверх метаданих книги)
+    key: str                          # ключ входів етапу (_stage_key) — для кешу й пам'яті блоків
+    failed: frozenset = frozenset()   # правила етапу, що впали в цьому регіоні
+    changed: frozenset = frozenset()  # правила етапу, що змінили текст або метадані регіону
+
+
+def _region_start(region: Tuple[str, Optional[str]]) -> _RegionOut:
+    """Регіон з _split_regions / _iter_regions → вхід першого етапу."""
+    text, scene = region
+    key = hashlib.sha1((scene or "").encode("utf-8", "surrogatepass")).hexdigest()
+    return _RegionOut(text, {"scene": scene} if scene is not None else {}, key)
+
+
+def _plan_stages(rules: List[Dict[str, Any]]) -> List[Tuple[str, List[Dict[str, Any]]]]:
+    """Етапи режимів регіонів у порядку правил: [("regions" | "shared" | "book", правила)]."""
+    lo, hi = SHARED_META_PHASES
+    stages: List[Tuple[str, List[Dict[str, Any]]]] = []
+    for rule in rules:
+        kind = "shared" if lo <= rule["phase"] <= hi else ("regions" if rule["local"] else "book")
+        if stages and stages[-1][0] == kind != "book":
+            stages[-1][1].append(rule)
+        else:
+            stages.append((kind, [rule]))
+    return stages
+
+
+def _book_meta(ctx: ProcessingContext) -> Dict[str, Any]:
+    """Метадані книги, які бачать усі регіони (ctx.metadata без профілю)."""
+    return {k: v for k, v in ctx.metadata.items() if k != "rule_profile"}
+
+
+def _stage_key(prev: str, book_sig: str, stage: int, skip: frozenset, text: str) -> str:
+    """Ключ входу етапу регіону: ключ попереднього етапу (сцена, тексти, вимкнені правила),
+    метадані книги, номер етапу, вимкнені правила етапу й текст регіону."""
+    h = hashlib.sha1(f"{prev}\0{book_sig}\0{stage}\0".encode("ascii"))
+    h.update("\0".join(sorted(skip)).encode("utf-8") + b"\0")
+    h.update(text.encode("utf-8", "surrogatepass"))
+    return h.hexdigest()
+
+
+def _run_region(region: _RegionOut, key: str, rules: List[Dict[str, Any]],
+                base: ProcessingContext) -> Tuple[_RegionOut, List[Dict[str, Any]]]:
+    """Правила етапу по одному регіону → (новий стан, профіль правил).
+
+    base.metadata — метадані книги: регіон бачить їх разом зі своїми, а назад
+    забирає лише те, що правила додали чи замінили.
+    """
+    book = base.metadata
+    rctx = base.derive({**book, **region.meta})
+    text = apply_rules_to_text(region.text, rules, rctx)
+    profile = rctx.metadata.pop("rule_profile", None) or []
+    meta = {k: v for k, v in rctx.metadata.items() if k not in book or book[k] is not v}
+    return _RegionOut(text, meta, key, frozenset(rctx.failed_rules), frozenset(rctx.changed_rules)), profile
+
+
+def _regions_stage(n: int, run: Callable[[List[int], frozenset], List[_RegionOut]],
+                   skip: frozenset) -> Tuple[List[_RegionOut], frozenset]:
+    """Етап «regions» для n регіонів; run(індекси, skip) → їхні нові стани.
+
+    Правило, що впало хоч в одному регіоні, вимикається для всієї книги — як у
+    цілісному прогоні, де виняток скасовує правило для всього тексту. Повторно
+    рахуються лише регіони, де воно впало або щось змінило: в інших його прогін
+    нічого не дав, тож і без нього стан той самий.
+    """
+    outs = run(list(range(n)), skip)
+    while True:
+        new = frozenset().union(*(out.failed for out in outs)) - skip
+        if not new:
+            return outs, skip
+        skip = skip | new
+        todo = [i for i, out in enumerate(outs) if (out.failed | out.changed) & new]
+        for i, out in zip(todo, run(todo, skip)):
+            outs[i] = out
+
+
+def _shape(part: str) -> Tuple[int, str]:
+    """(кількість рядків, перший рядок) шматка тексту — для _split_like."""
+    lines = part.splitlines(keepends=True)
+    return len(lines), (lines[0] if lines else "")
+
+
+def _split_like(text: str, shapes: List[Tuple[int, str]]) -> Optional[List[str]]:
+    """Вихід «book»-правила по склеєних регіонах (їхні _shape) → шматки тих самих регіонів.
+
+    Межа регіону — його перший рядок (початок спокійного абзацу чи заголовок сцени,
+    «book»-правила такі рядки не чіпають). Якщо правило змінило кількість рядків
+    (074 зливає рядок 1-ї особи з наступним), межа шукається біля очікуваного місця
+    на цю різницю. None — межу не знайдено.
+    """
+    lines = text.splitlines(keepends=True)
+    slack = abs(len(lines) - sum(n for n, _ in shapes))
+    out: List[str] = []
+    pos = 0
+    for (n, _), (_, first) in zip(shapes, shapes[1:]):
+        end = next((j for d in range(slack + 1) for j in (pos + n - d, pos + n + d)
+                    if pos < j < len(lines) and lines[j] == first), None)
+        if end is None:
+            return None
+        out.append("".join(lines[pos:end]))
+        pos = end
+    out.append("".join(lines[pos:]))
+    return out
+
+
+def _reset_context(ctx: ProcessingContext) -> None:
+    """ctx як щойно створений — для цілісного прогону після невдалої спроби по регіонах."""
+    ctx.metadata = {"legend": ctx.legend.copy()}
+    ctx.lines = None
+    ctx.failed_rules, ctx.changed_rules = [], []
+
+
+def _iter_shared_meta_lines(lines: Iterable[str]) -> Iterator[str]:
+    """Рядки, які зі спільних правил щось означають (_SHARED_META_LINE_RE + кінець блоку легенди)."""
+    after_legend = False
+    for raw in lines:
+        if _SHARED_META_LINE_RE.match(raw):
+            yield raw
+            after_legend = True
+        elif after_legend and raw.strip():
+            yield raw  # кінець блоку легенди для 050
+            after_legend = False
+
+
+def _merge_parts(rules: List[Dict[str, Any]], meta: Dict[str, Any]) -> Dict[str, Any]:
+    """Ключі регіону, які зводять merge() правил (099: метрики)."""
+    keys = {w[5:] for r in rules if r.get("merge") for w in (r.get("writes") or ()) if w.startswith("meta.")}
+    return {k: meta[k] for k in keys if k in meta}
+
+
+def _merge_region_meta(ctx: ProcessingContext, rules: List[Dict[str, Any]], parts: List[Dict[str, Any]],
+                       skip: frozenset) -> None:
+    """merge() правил: метадані регіонів (_merge_parts) → ctx.metadata на всю книгу."""
+    for rule in rules:
+        if not rule.get("merge") or rule["name"] in skip:
+            continue
+        keys = [w[5:] for w in (rule.get("writes") or ()) if w.startswith("meta.")]
+        try:
+            ctx.metadata.update(rule["merge"]([{k: part[k] for k in keys if k in part} for part in parts]))
+        except Exception:
+            traceback.print_exc()
+
+
+def _apply_rules_regions(src: str, rules: List[Dict[str, Any]], ctx: ProcessingContext, logs_parts: List[str],
+                         state: Optional[IncrementalState] = None, use_memo: bool = False,
+                         workers: int = 1) -> str:
+    """Правила етапами (_plan_stages) по регіонах тексту в пам'яті — вихід як у apply_rules_to_text.
+
+    З state — стан регіону на етапі, вхід якого не змінився з попереднього запуску,
+    береться з кешу, з use_memo — ще й з пам'яті блоків (BLOCK_MEMO_PATH). workers > 1 —
+    етапи «regions» рахуються в ProcessPoolExecutor. Якщо після «book»-правила межі
+    регіонів не знайшлися (_split_like), правила проганяються заново по всьому тексту.
+    """
+    regions = [_region_start(region) for region in _split_regions(src, rules)]
+    profile = ctx.metadata.setdefault("rule_profile", [])
+    stats = {"run": 0, "memo": 0, "total": 0}
+    cache: Dict[str, _RegionOut] = {}
+    used: Dict[str, _RegionOut] = {}
+    if state is not None:
+        signature = (tuple(sorted(ctx.legend.items())), ctx.narrator_tag,
+                     tuple((r["name"], id(r["func"])) for r in rules))
+        if signature != state.signature:
+            state.signature, state.regions = signature, {}
+        cache = state.regions
+    prefix = _block_memo_prefix(ctx, rules) if use_memo else None
+    pool: Optional[ProcessPoolExecutor] = None
+    n_proc = min(workers, len(regions))
+    if n_proc > 1:
+        pool = ProcessPoolExecutor(max_workers=n_proc)
+        logs_parts.append(f"Паралельний режим: регіонів {len(regions)}, процесів {n_proc}")
+
+    def run_many(stage: int, active: List[Dict[str, Any]], items: List[Tuple[_RegionOut, str]],
+                 book: Dict[str, Any], skip: frozenset) -> List[Tuple[_RegionOut, List[Dict[str, Any]]]]:
+        nonlocal pool
+        if pool is not None and len(items) > 1:
+            base_payload = {
+                "stage": stage,
+                "skip": skip,
+                "legend": ctx.legend,
+                "narrator_tag": ctx.narrator_tag,
+                "book_meta": book,
+                "rules_dir": RULES_DIR,
+                "debug": DEBUG_RULES_PRINT,
+                "profile": (PROFILE_RULES, PROFILE_MEMORY),
+            }
+            n_batches = min(len(items), n_proc * 4)
+            batches = [list(range(b, len(items), n_batches)) for b in range(n_batches)]
+            try:
+                done = list(pool.map(_process_regions,
+                                     [dict(base_payload, regions=[items[i] for i in b]) for b in batches]))
+            except Exception as e:
+                logs_parts.append(f"Паралельний режим недоступний ({e}) — обробка в одному процесі")
+                if DEBUG_RULES_PRINT:
+                    traceback.print_exc()
+                pool.shutdown()
+                pool = None
+            else:
+                by_index = {i: res for b, results in zip(batches, done) for i, res in zip(b, results)}
+                return [by_index[i] for i in range(len(items))]
+        base = ctx.derive(book)
+        return [_run_region(region, key, active, base) for region, key in items]
+
+    def compute(stage: int, stage_rules: List[Dict[str, Any]], inputs: List[_RegionOut],
+                book: Dict[str, Any], book_sig: str) -> Callable[[List[int], frozenset], List[_RegionOut]]:
+        names = frozenset(r["name"] for r in stage_rules)
+
+        def run(todo: List[int], skip: frozenset) -> List[_RegionOut]:
+            keys = {i: _stage_key(inputs[i].key, book_sig, stage, skip & names, inputs[i].text) for i in todo}
+            found = {i: cache[k] for i, k in keys.items() if k in cache}
+            if prefix is not None:
+                missing = {i: _block_memo_key(prefix, k) for i, k in keys.items() if i not in found}
+                hits = _block_memo_get(list(missing.values()))
+                for i, mk in missing.items():
+                    out = _block_memo_load(hits[mk], keys[i]) if mk in hits else None
+                    if out is not None:
+                        found[i] = out
+                        stats["memo"] += 1
+            first: Dict[str, int] = {}  # однакові входи рахуються раз
+            for i in todo:
+                if i not in found:
+                    first.setdefault(keys[i], i)
+            active = [r for r in stage_rules if r["name"] not in skip]
+            results = run_many(stage, active, [(inputs[i], keys[i]) for i in first.values()], book, skip)
+            computed: Dict[str, _RegionOut] = {}
+            for k, (out, rows) in zip(first, results):
+                _merge_rule_profile(profile, rows)
+                computed[k] = out
+            stats["run"] += len(computed)
+            stats["total"] += len(todo)
+            if prefix is not None:
+                _block_memo_put({_block_memo_key(prefix, k): _block_memo_dump(out) for k, out in computed.items()})
+            outs = [found[i] if i in found else computed[keys[i]] for i in todo]
+            cache.update(computed)
+            used.update(zip(keys.values(), outs))
+            return outs
+        return run
+
+    skip: frozenset = frozenset()
+    try:
+        for stage, (kind, stage_rules) in enumerate(_plan_stages(rules)):
+            if kind == "shared":
+                lines = _iter_split_lines(region.text for region in regions)
+                apply_rules_to_text("".join(_iter_shared_meta_lines(lines)), stage_rules, ctx)
+            elif kind == "book":
+                shapes = [_shape(region.text) for region in regions]
+                texts = _split_like(apply_rules_to_text("".join(r.text for r in regions), stage_rules, ctx), shapes)
+                if texts is None:
+                    logs_parts.append(f"{stage_rules[0]['name']}: межі регіонів не знайдено — правила "
+                                      "проганяються по всьому тексту")
+                    _reset_context(ctx)
+                    return apply_rules_to_text(src, rules, ctx)
+                regions = [region._replace(text=text) for region, text in zip(regions, texts)]
+            else:
+                book = _book_meta(ctx)
+                book_sig = hashlib.sha1(json.dumps(_json_safe(book), ensure_ascii=False, sort_keys=True)
+                                        .encode("utf-8", "surrogatepass")).hexdigest()
+                regions, skip = _regions_stage(len(regions), compute(stage, stage_rules, regions, book, book_sig),
+                                               skip)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    if state is not None:
+        # лише входи поточного тексту (з проміжними наборами skip) — кеш не росте
+        state.regions = used
+
+    _merge_region_meta(ctx, rules, [_merge_parts(rules, region.meta) for region in regions], skip)
+    if state is not None:
+        logs_parts.append(f"Інкрементально: регіонів {len(regions)}, етапів регіонів перераховано "
+                          f"{stats['run']} з {stats['total']}, з пам'яті блоків {stats['memo']}")
+    failed = skip.union(ctx.failed_rules)
+    if failed:
+        logs_parts.append("Правила впали й вимкнені для всієї книги: " + ", ".join(sorted(failed)))
+    return "".join(region.text for region in regions)
+
+
 # ---- Внутрішні постпроцеси ----
 
+# Скомпільовані один раз шаблони постпроцесів
+_TAGGED_LINE_RE = re.compile(r"^\s*#g(?:\d+|\?)\s*:")
+_FALLBACK_DIALOG_RE = re.compile(rf"^\s*(?:[{DASHES}]|[«\"„“”'’])")
+_DEMOTE_G1_RE = re.compile(rf"(?m)^(\s*)#g1\s*:\s*(?=[{DASHES}«\"„“”'’])")
+_G1_EMPTY_RE = re.compile(r"^\s*#g1\s*:\s*$")
+_COLLAPSE_TAG_RE = re.compile(r"^(\s*)(#g(?:\d+|\?))\s*:(\s*)(.*?)(\r?\n)?$", re.DOTALL)
+_COLLAPSE_DIALOG_RE = re.compile(r"^\s*(?:[-–—]|[«\"„“”'’])")
+# Лише голова тегу: лінивий "(.*?)(\r?\n)?$" з _COLLAPSE_TAG_RE перевіряє "$" на кожній
+# позиції рядка; решту (текст і кінець рядка) злитий прохід відрізає рядковими операціями.
+_COLLAPSE_HEAD_RE = re.compile(r"^(\s*)(#g(?:\d+|\?))\s*:(\s*)")
+
+
 def _narrator_fallback(text: str, narrator_tag: str) -> str:
     """Призначає тег оповідача для непозначених наративних рядків.
 
@@ -212,17 +1476,15 @@ def _narrator_fallback(text: str, narrator_tag: str) -> str:
     lines = text.splitlines(keepends=True)
     out: List[str] = []
     in_block = False
-    tagged_re = re.compile(r"^\s*#g(?:\d+|\?)\s*:")
-    dialog_start = re.compile(rf"^\s*(?:[{DASHES}]|[«\"„“”'’])")
 
     for line in lines:
         line_norm = _normalize_ws(line)
         stripped = line_norm.strip()
-        if not stripped or tagged_re.match(line_norm):
+        if not stripped or _TAGGED_LINE_RE.match(line_norm):
             in_block = False
             out.append(line)
             continue
-        if dialog_start.match(stripped):
+        if _FALLBACK_DIALOG_RE.match(stripped):
             in_block = False
             out.append(line)
             continue
@@ -236,8 +1498,7 @@ def _narrator_fallback(text: str, narrator_tag: str) -> str:
 
 def _demote_g1_dialogs(text: str) -> str:
     """Якщо після фолбеку зʼявилися #g1: перед діалогами — міняємо на #g?."""
-    pat = re.compile(rf"(?m)^(\s*)#g1\s*:\s*(?=[{DASHES}«\"„“”'’])")
-    return pat.sub(r"\1#g?: ", text)
+    return _DEMOTE_G1_RE.sub(r"\1#g?: ", text)
 
 
 def _collapse_same_tags(text: str) -> str:
@@ -245,11 +1506,9 @@ def _collapse_same_tags(text: str) -> str:
     lines = text.splitlines(keepends=True)
     out: List[str] = []
     prev_tag: Optional[str] = None
-    tag_re = re.compile(r"^(\s*)(#g(?:\d+|\?))\s*:(\s*)(.*?)(\r?\n)?$", re.DOTALL)
-    is_dialog = re.compile(r"^\s*(?:[-–—]|[«\"„“”'’])")
 
     for line in lines:
-        m = tag_re.match(line)
+        m = _COLLAPSE_TAG_RE.match(line)
         if not m:
             if line.strip():
                 prev_tag = None
@@ -261,7 +1520,7 @@ def _collapse_same_tags(text: str) -> str:
             out.append(line)
             prev_tag = tag
             continue
-        if is_dialog.match(rest.lstrip()):
+        if _COLLAPSE_DIALOG_RE.match(rest.lstrip()):
             out.append(line)
             prev_tag = tag
             continue
@@ -274,20 +1533,487 @@ def _collapse_same_tags(text: str) -> str:
     return "".join(out)
 
 
+def _iter_postprocess(lines: Iterable[str], narrator_tag: str) -> Iterator[str]:
+    """Усі три постпроцеси за один прохід по рядках.
+
+    Результат побайтово збігається з _collapse_same_tags(_demote_g1_dialogs(
+    _narrator_fallback(text))) — див. tests/test_postprocess.py. Тонкість демоції:
+    "\\s*" після "#g1:" переходить через кінці рядків, а "^" не спрацьовує після
+    \\u2028/\\x0b, тож такі рядки притримуються й замінюються разом із першим
+    рядком, на якому збіг уже не може тривати.
+    """
+    in_block = False                # фолбек оповідача: всередині наративного блоку
+    held: List[str] = []            # демоція: рядки, які ще не можна вирішити
+    prev_tag: Optional[str] = None  # згортання: тег попереднього тегованого рядка
+    tagged_match, dialog_match = _TAGGED_LINE_RE.match, _FALLBACK_DIALOG_RE.match
+    collapse_match, collapse_dialog = _COLLAPSE_HEAD_RE.match, _COLLAPSE_DIALOG_RE.match
+    g1_empty, demote = _G1_EMPTY_RE.match, _DEMOTE_G1_RE.sub
+
+    pending = iter(lines)
+    tail: List[str] = []  # рядки, які демоція склеїла/змінила — проходять згортання поодинці
+    while True:
+        if tail:
+            line = tail.pop()
+        else:
+            line = next(pending, None)
+            if line is None:
+                if not held:
+                    break
+                tail = demote(r"\1#g?: ", "".join(held)).splitlines(keepends=True)[::-1]
+                held = []
+                continue
+            # 1) фолбек оповідача
+            line_norm = _normalize_ws(line)
+            stripped = line_norm.strip()
+            if not stripped or tagged_match(line_norm) or dialog_match(stripped):
+                in_block = False
+            elif not in_block:
+                line = f"{narrator_tag}: {line}"
+                in_block = True
+            # 2) демоція #g1 перед діалогом
+            has_g1 = "#g1" in line
+            if not line.endswith("\n") or (has_g1 and g1_empty(line)) or (held and not line.strip()):
+                held.append(line)
+                continue
+            if held:
+                held.append(line)
+                tail = demote(r"\1#g?: ", "".join(held)).splitlines(keepends=True)[::-1]
+                held = []
+                continue
+            if has_g1:
+                line = demote(r"\1#g?: ", line)
+        # 3) згортання однакових тегів
+        m = collapse_match(line)
+        if not m:
+            if line.strip():
+                prev_tag = None
+            yield line
+            continue
+        indent, tag, post_ws = m.groups()
+        rest = line[m.end():]
+        if rest.endswith("\r\n"):
+            rest, nl = rest[:-2], "\r\n"
+        elif rest.endswith("\n"):
+            rest, nl = rest[:-1], "\n"
+        else:
+            nl = ""
+        if tag == "#g?" or collapse_dialog(rest.lstrip()):
+            prev_tag = tag
+            yield line
+        elif prev_tag and tag.lower() == prev_tag.lower():
+            yield f"{indent}{post_ws}{rest}{nl}"
+        else:
+            prev_tag = tag
+            yield line
+
+
+def _postprocess(text: str, narrator_tag: str) -> str:
+    """Фолбек оповідача + демоція #g1 + згортання тегів (один прохід)."""
+    return "".join(_iter_postprocess(text.splitlines(keepends=True), narrator_tag))
+
+
+# ---- Потоковий режим (великі файли) ----
+# Ті самі регіони й ті самі етапи, що й у _apply_rules_regions, але результати регіонів
+# лежать не в пам'яті, а у файлах записів поруч з output_path (_RegionRecords).
+
+
+def _iter_split_lines(chunks: Iterable[str]) -> Iterator[str]:
+    """Склеює шматки тексту й віддає рядки як text.splitlines(keepends=True) від їх суми."""
+    tail = ""
+    for chunk in chunks:
+        if not chunk:
+            continue
+        parts = (tail + chunk).splitlines(keepends=True)
+        tail = parts.pop() if parts[-1].splitlines()[0] == parts[-1] else ""
+        yield from parts
+    if tail:
+        yield tail
+
+
+def _iter_file_lines(path: str) -> Iterator[str]:
+    """Рядки файлу (як у f.read().splitlines(keepends=True)), читаючи по STREAM_READ_CHARS."""
+    with open(path, "r", encoding="utf-8") as f:
+        yield from _iter_split_lines(iter(lambda: f.read(STREAM_READ_CHARS), ""))
+
+
+def _stream_scenes(path: str, rules: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Заголовки сцен файлу: 038 по вікнах ~STREAM_READ_CHARS → [{"label", "line"}]."""
+    scenes: List[Dict[str, Any]] = []
+    window: List[str] = []
+    size = offset = 0
+
+    def scan_window() -> None:
+        meta = _detect_scenes_meta(LineModel("".join(window)), rules)
+        for sc in meta.get("scenes") or []:
+            scenes.append({"label": sc["label"], "line": sc["line"] + offset})
+
+    for raw in _iter_file_lines(path):
+        window.append(raw)
+        size += len(raw)
+        if size >= STREAM_READ_CHARS:
+            scan_window()
+            offset += len(window)
+            window, size = [], 0
+    if window:
+        scan_window()
+    return scenes
+
+
+class _RegionRecords:
+    """Стани регіонів у файлі (pickle-записи підряд): у пам'яті — один регіон за раз."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __iter__(self) -> Iterator[_RegionOut]:
+        with open(self.path, "rb") as f:
+            while True:
+                try:
+                    record = pickle.load(f)
+                except EOFError:
+                    return
+                yield _RegionOut(*record)
+
+    def write(self, outs: Iterable[_RegionOut]) -> None:
+        """Записує outs (їх можна читати з цього ж файлу — заміна після запису)."""
+        with open(self.path + ".next", "wb") as f:
+            for out in outs:
+                pickle.dump(tuple(out), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(self.path + ".next", self.path)
+
+    def remove(self) -> None:
+        for path in (self.path, self.path + ".next"):
+            if os.path.exists(path):
+                os.unlink(path)
+
+
+def _stream_regions_stage(inputs: _RegionRecords, outputs: _RegionRecords,
+                          run: Callable[[_RegionOut, frozenset], _RegionOut], skip: frozenset) -> frozenset:
+    """_regions_stage для потокового режиму: входи й результати етапу — файли записів.
+
+    Повтор читає входи й попередні результати поруч і перераховує лише ті регіони,
+    де нове вимкнене правило впало або щось змінило. Повертає остаточний skip.
+    """
+    failed: set = set()
+
+    def first() -> Iterator[_RegionOut]:
+        for region in inputs:
+            out = run(region, skip)
+            failed.update(out.failed)
+            yield out
+
+    outputs.write(first())
+    while True:
+        new = frozenset(failed) - skip
+        if not new:
+            return skip
+        skip = skip | new
+        failed.clear()
+
+        def again() -> Iterator[_RegionOut]:
+            for region, out in zip(inputs, outputs):
+                if (out.failed | out.changed) & new:
+                    out = run(region, skip)
+                failed.update(out.failed)
+                yield out
+
+        outputs.write(again())
+
+
+def _process_dialogs_streaming(input_path: str, output_path: str, ctx: ProcessingContext,
+                               rules: List[Dict[str, Any]], logs_parts: List[str]) -> None:
+    """Обробляє книгу регіонами з диска на диск — вихід той самий, що й у process_dialogs.
+
+    Ті самі етапи, що й у _apply_rules_regions, але стани регіонів лежать у файлах
+    записів поруч з output_path: у пам'яті один регіон, а склеєний текст — лише на час
+    «book»-правила (074, 076). Постпроцеси пишуть тимчасовий файл поруч з output_path,
+    який наприкінці замінює output_path (тож вхід і вихід можуть збігатися). merge()
+    правил (099) — по записах регіонів.
+    """
+    scenes = _stream_scenes(input_path, rules)
+    heading_at = {sc["line"]: sc["label"] for sc in scenes}
+    current = scenes[-1]["label"] if scenes else None
+    profile = ctx.metadata.setdefault("rule_profile", [])
+    cur, nxt = _RegionRecords(output_path + ".regions.part"), _RegionRecords(output_path + ".stage.part")
+    tmp_path = output_path + ".part"
+    n_regions = 0
+    skip: frozenset = frozenset()
+    try:
+        lines = (DocLine(raw) for raw in _iter_file_lines(input_path))
+        cur.write(_region_start(region) for region in _iter_regions(lines, heading_at, current))
+        for stage, (kind, stage_rules) in enumerate(_plan_stages(rules)):
+            if kind == "shared":
+                texts = (region.text for region in cur)
+                apply_rules_to_text("".join(_iter_shared_meta_lines(_iter_split_lines(texts))), stage_rules, ctx)
+            elif kind == "book":
+                shapes = [_shape(region.text) for region in cur]
+                joined = apply_rules_to_text("".join(region.text for region in cur), stage_rules, ctx)
+                texts = _split_like(joined, shapes)
+                del joined
+                if texts is None:
+                    logs_parts.append(f"{stage_rules[0]['name']}: межі регіонів не знайдено — правила "
+                                      "проганяються по всьому тексту")
+                    _reset_context(ctx)
+                    with open(input_path, "r", encoding="utf-8") as f:
+                        text = apply_rules_to_text(f.read(), rules, ctx)
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        f.write(_postprocess(text, ctx.narrator_tag))
+                    os.replace(tmp_path, output_path)
+                    return
+                cur.write(region._replace(text=text) for region, text in zip(cur, texts))
+            else:
+                book = _book_meta(ctx)
+                base = ctx.derive(book)
+
+                def run(region: _RegionOut, skip: frozenset) -> _RegionOut:
+                    active = [r for r in stage_rules if r["name"] not in skip]
+                    out, rows = _run_region(region, region.key, active, base)
+                    _merge_rule_profile(profile, rows)
+                    return out
+
+                skip = _stream_regions_stage(cur, nxt, run, skip)
+                cur, nxt = nxt, cur
+
+        parts: List[Dict[str, Any]] = []
+
+        def texts_out() -> Iterator[str]:
+            nonlocal n_regions
+            for region in cur:
+                n_regions += 1
+                parts.append(_merge_parts(rules, region.meta))  # у пам'яті — лише метадані для merge()
+                yield region.text
+
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for line in _iter_postprocess(_iter_split_lines(texts_out()), ctx.narrator_tag):
+                f.write(line)
+        os.replace(tmp_path, output_path)
+        _merge_region_meta(ctx, rules, parts, skip)
+    finally:
+        cur.remove()
+        nxt.remove()
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    logs_parts.append(f"Потоковий режим: сцен {len(scenes)}, регіонів {n_regions}")
+    failed = skip.union(ctx.failed_rules)
+    if failed:
+        logs_parts.append("Правила впали й вимкнені для всієї книги: " + ", ".join(sorted(failed)))
+
+
 # ---- Публічне API ----
 
+# ---- Кеш результатів на диску ----
+# Ключ — sha1(тексту, розібраної легенди, sha1 файлів правил і модулів конвеєра, налаштувань);
+# запис — JSON {"text", "logs", "metadata"} у RESULT_CACHE_DIR/<ключ>.json
+_RESULT_CACHE_VERSION = 2
+_LOGIC_SHA1: Optional[str] = None
+
+# Модулі поруч, які імпортує конвеєр (improved_logic і правила): зміна будь-якого скидає кеші.
+# Новий такий імпорт — дописати сюди (batch_dialogs бере цей самий список).
+PIPELINE_MODULES = ("improved_logic.py", "line_features.py", "name_matcher.py", "context_index.py")
+
+
+def pipeline_sha1() -> str:
+    """sha1 файлів PIPELINE_MODULES (ім'я + вміст кожного)."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    h = hashlib.sha1()
+    for name in PIPELINE_MODULES:
+        h.update(name.encode("utf-8") + b"\0" + _file_sha1(os.path.join(here, name)).encode("ascii"))
+    return h.hexdigest()
+
+
+def _result_cache_key(src: str, ctx: ProcessingContext, rules: List[Dict[str, Any]]) -> str:
+    global _LOGIC_SHA1
+    if _LOGIC_SHA1 is None:
+        _LOGIC_SHA1 = pipeline_sha1()
+    head = json.dumps([
+        _RESULT_CACHE_VERSION,
+        _LOGIC_SHA1,
+        [(r["name"], r.get("sha1"), r["phase"], r["priority"], r["scope"]) for r in rules],
+        sorted(ctx.legend.items()),
+        ctx.narrator_tag,
+        list(SHARED_META_PHASES),
+        SCENE_RULE_NAME,
+        DEBUG_FORCE_LOAD_ALL,
+    ], ensure_ascii=False)
+    h = hashlib.sha1(head.encode("utf-8"))
+    h.update(b"\0")
+    h.update(src.encode("utf-8", "surrogatepass"))
+    return h.hexdigest()
+
+
+def _json_safe(obj: Any) -> Any:
+    """Метадані правил → JSON (кортежі стають списками, ключі — рядками, решта — repr)."""
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        return obj
+    if isinstance(obj, dict):
+        return {str(k): _json_safe(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return [_json_safe(v) for v in obj]
+    return repr(obj)
+
+
+def _result_cache_get(key: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(RESULT_CACHE_DIR, key + ".json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        os.utime(path)  # «нещодавно використаний» — для витіснення
+    except (OSError, ValueError):
+        return None
+    if not isinstance(entry, dict) or entry.get("version") != _RESULT_CACHE_VERSION:
+        return None
+    return entry
+
+
+def _result_cache_put(key: str, text: str, logs: str, ctx: ProcessingContext) -> None:
+    entry = {
+        "version": _RESULT_CACHE_VERSION,
+        "text": text,
+        "logs": logs,
+        "metadata": _json_safe({k: v for k, v in ctx.metadata.items() if k != "rule_profile"}),
+    }
+    path = os.path.join(RESULT_CACHE_DIR, key + ".json")
+    tmp = f"{path}.{os.getpid()}.part"
+    try:
+        os.makedirs(RESULT_CACHE_DIR, exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        entries = sorted(
+            (e for e in os.scandir(RESULT_CACHE_DIR) if e.name.endswith(".json")),
+            key=lambda e: e.stat().st_mtime, reverse=True,
+        )
+        for old in entries[RESULT_CACHE_MAX:]:
+            os.remove(old.path)
+    except OSError as e:
+        if DEBUG_RULES_PRINT:
+            print(f"[improved_logic] кеш результатів: помилка запису ({e})")
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
+def _cached_result(src: str, ctx: ProcessingContext, rules: List[Dict[str, Any]],
+                   use_cache: bool) -> Tuple[Optional[str], Optional[Tuple[str, str]]]:
+    """(ключ або None, (текст, лог) при влучанні або None). Влучання оновлює last_run_metadata()."""
+    global _LAST_RULE_PROFILE, _LAST_METADATA
+    if not (use_cache and RESULT_CACHE):
+        return None, None
+    key = _result_cache_key(src, ctx, rules)
+    entry = _result_cache_get(key)
+    if entry is None:
+        return key, None
+    _LAST_RULE_PROFILE = []
+    _LAST_METADATA = dict(entry.get("metadata") or {})
+    logs_text = "\n".join([entry.get("logs") or "", f"Кеш результатів: збіг ({key[:12]}) — правила не запускались"])
+    return key, (entry.get("text") or "", logs_text)
+
+
+# ---- Пам'ять блоків на диску ----
+# Стан регіону після етапу визначається ключем входу етапу (_stage_key: сцена, тексти регіону на
+# всіх етапах до цього, метадані книги, вимкнені правила) разом із правилами, легендою й
+# налаштуваннями (_block_memo_prefix) — іншого стану між регіонами немає
+# (tests/test_modes.py це звіряє). Значення — pickle (текст, метадані, правила, що впали/змінили)
+# у таблиці SQLite BLOCK_MEMO_PATH (одна база на всі книги/видання, поруч із кодом).
+_BLOCK_MEMO_VERSION = 2
+
+
+def _block_memo_prefix(ctx: ProcessingContext, rules: List[Dict[str, Any]]) -> str:
+    """Частина ключа, спільна для всіх регіонів прогону (правила, легенда, налаштування)."""
+    return f"{_BLOCK_MEMO_VERSION}:{_result_cache_key('', ctx, rules)}"
+
+
+def _block_memo_key(prefix: str, key: str) -> str:
+    return hashlib.sha1(f"{prefix}\0{key}".encode("ascii")).hexdigest()
+
+
+def _block_memo_dump(out: _RegionOut) -> bytes:
+    return pickle.dumps((out.text, out.meta, sorted(out.failed), sorted(out.changed)),
+                        protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _block_memo_load(value: Any, key: str) -> Optional[_RegionOut]:
+    try:
+        text, meta, failed, changed = pickle.loads(value)
+        return _RegionOut(text, meta, key, frozenset(failed), frozenset(changed))
+    except Exception:
+        return None  # запис старого формату або пошкоджений — як промах
+
+
+def _block_memo_open() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(BLOCK_MEMO_PATH) or ".", exist_ok=True)
+    con = sqlite3.connect(BLOCK_MEMO_PATH, timeout=10)
+    con.execute("CREATE TABLE IF NOT EXISTS blocks (key TEXT PRIMARY KEY, out TEXT NOT NULL, used REAL NOT NULL)")
+    return con
+
+
+def _block_memo_get(keys: List[str]) -> Dict[str, bytes]:
+    """{ключ: оброблений регіон} для знайдених ключів; влучання оновлюють час використання."""
+    found: Dict[str, bytes] = {}
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        return found
+    try:
+        con = _block_memo_open()
+        try:
+            with con:
+                for k in range(0, len(keys), 500):
+                    part = keys[k:k + 500]
+                    marks = ",".join("?" * len(part))
+                    found.update(con.execute(f"SELECT key, out FROM blocks WHERE key IN ({marks})", part))
+                now = time.time()
+                con.executemany("UPDATE blocks SET used = ? WHERE key = ?", [(now, key) for key in found])
+        finally:
+            con.close()
+    except (sqlite3.Error, OSError) as e:
+        if DEBUG_RULES_PRINT:
+            print(f"[improved_logic] пам'ять блоків: помилка читання ({e})")
+        return {}
+    return found
+
+
+def _block_memo_put(items: Dict[str, bytes]) -> None:
+    if not items:
+        return
+    now = time.time()
+    try:
+        con = _block_memo_open()
+        try:
+            with con:
+                con.executemany("INSERT OR REPLACE INTO blocks (key, out, used) VALUES (?, ?, ?)",
+                                [(key, out, now) for key, out in items.items()])
+                con.execute("DELETE FROM blocks WHERE key IN "
+                            "(SELECT key FROM blocks ORDER BY used DESC LIMIT -1 OFFSET ?)", (BLOCK_MEMO_MAX,))
+        finally:
+            con.close()
+    except (sqlite3.Error, OSError, UnicodeEncodeError) as e:
+        if DEBUG_RULES_PRINT:
+            print(f"[improved_logic] пам'ять блоків: помилка запису ({e})")
+
+
 def process_dialogs(
     input_path: str,
     legend_text: str = "",
     workers: int = 1,
     output_path: Optional[str] = None,
+    streaming: bool = False,
+    use_cache: bool = True,
 ) -> Tuple[str, str]:
+    """Обробляє файл і повертає (текст, лог); з output_path — ще й записує результат.
+
+    streaming=True — потоковий режим для дуже великих книг: файл читається й
+    обробляється регіонами, результат (той самий, що й без streaming) пишеться
+    одразу в output_path (обов'язковий), а замість тексту повертається "".
+    workers у цьому режимі не використовується, кеш результатів теж (книга не
+    тримається в пам'яті цілком); метадані (099) — у last_run_metadata().
+    use_cache=False — не брати й не класти результат у кеш (RESULT_CACHE_DIR).
+    """
     logs_parts: List[str] = []
     if not os.path.isfile(input_path):
         return "", f"Файл не знайдено: {input_path}"
-
-    with open(input_path, "r", encoding="utf-8") as f:
-        src = f.read()
+    if streaming and not output_path:
+        return "", "Потоковий режим потребує output_path"
 
     legend_map, narrator_tag = parse_legend_text(legend_text)
     nar_tag = narrator_tag or "#g1"
@@ -298,22 +2024,46 @@ def process_dialogs(
     if DEBUG_RULES_PRINT:
         print(f"[improved_logic] narrator_tag={nar_tag}; rules_loaded={len(rules)}")
 
-    result = src
-    if rules:
-        logs_parts.append("Застосування правил…")
-        result = apply_rules_to_text(src, rules, ctx)
-        logs_parts.append("Правила застосовано.")
+    if streaming:
+        try:
+            _process_dialogs_streaming(input_path, output_path, ctx, rules, logs_parts)
+            logs_parts.append(f"Збережено у файл: {output_path}")
+        except Exception as e:
+            logs_parts.append(f"Помилка потокової обробки '{input_path}': {e}")
+            if DEBUG_RULES_PRINT:
+                traceback.print_exc()
+        _finish_rule_profile(ctx, logs_parts)
+        _remember_metadata(ctx)
+        logs_text = "\n".join(logs_parts)
+        if ECHO_LOGS_TO_CONSOLE:
+            print("=== LOGС (improved_logic) ===")
+            print(logs_text)
+            print("=============================")
+        return "", logs_text
 
-    # Постпроцеси
-    result = _narrator_fallback(result, nar_tag)
-    if DEBUG_RULES_PRINT:
-        print("=== AFTER NARRATOR Fallback (head) ===")
-        print(result[:500])
-    result = _demote_g1_dialogs(result)
-    if DEBUG_RULES_PRINT:
-        print("=== AFTER DEMOTE G1 (head) ===")
-        print(result[:500])
-    result = _collapse_same_tags(result)
+    with open(input_path, "r", encoding="utf-8") as f:
+        src = f.read()
+
+    cache_key, hit = _cached_result(src, ctx, rules, use_cache)
+    if hit is not None:
+        result, cached_logs = hit
+        logs_parts = [cached_logs]
+    else:
+        result = src
+        if rules:
+            logs_parts.append("Застосування правил…")
+            result = _run_rules(src, rules, ctx, workers, logs_parts)
+            logs_parts.append("Правила застосовано.")
+            _finish_rule_profile(ctx, logs_parts)
+
+        # Постпроцеси: фолбек оповідача, демоція #g1 перед діалогами, згортання тегів
+        result = _postprocess(result, nar_tag)
+        if DEBUG_RULES_PRINT:
+            print("=== AFTER POSTPROCESS (head) ===")
+            print(result[:500])
+        _remember_metadata(ctx)
+        if cache_key is not None:
+            _result_cache_put(cache_key, result, "\n".join(logs_parts), ctx)
 
     if output_path:
         try:
@@ -336,6 +2086,7 @@ def process_dialogs_in_memory(
     existing_text: str,
     legend_text: str = "",
     workers: int = 1,
+    use_cache: bool = True,
 ) -> Tuple[str, str]:
     legend_map, narrator_tag = parse_legend_text(legend_text)
     nar_tag = narrator_tag or "#g1"
@@ -344,15 +2095,75 @@ def process_dialogs_in_memory(
     rules, load_logs = load_rules(RULES_DIR)
     logs_parts: List[str] = [load_logs]
 
+    cache_key, hit = _cached_result(existing_text, ctx, rules, use_cache)
+    if hit is not None:
+        result, cached_logs = hit
+        logs_parts = [cached_logs]
+    else:
+        result = existing_text
+        if rules:
+            logs_parts.append("Застосування правил…")
+            result = _run_rules(existing_text, rules, ctx, workers, logs_parts)
+            logs_parts.append("Правила застосовано.")
+            _finish_rule_profile(ctx, logs_parts)
+
+        result = _postprocess(result, nar_tag)
+        _remember_metadata(ctx)
+        if cache_key is not None:
+            _result_cache_put(cache_key, result, "\n".join(logs_parts), ctx)
+
+    logs_text = "\n".join(logs_parts)
+    if ECHO_LOGS_TO_CONSOLE:
+        print("=== LOGС (improved_logic) ===")
+        print(logs_text)
+        print("=============================")
+
+    return result, logs_text
+
+
+def process_dialogs_incremental(
+    existing_text: str,
+    legend_text: str = "",
+    state: Optional[IncrementalState] = None,
+    use_cache: bool = True,
+) -> Tuple[str, str, IncrementalState]:
+    """Як process_dialogs_in_memory, але повторно обробляє лише змінені регіони.
+
+    Текст ділиться на регіони (_split_regions), правила йдуть етапами
+    (_plan_stages): локальні — по регіонах, спільні метадані (049–052) і
+    правила з apply.local = False — по всій книзі, тож результат збігається
+    з process_dialogs_in_memory. Регіон, чий ключ етапу (вміст + вхід етапу)
+    уже був у попередньому запуску з тим самим state, береться з кешу, а за
+    BLOCK_MEMO — ще й з пам'яті блоків на диску (попередні запуски/видання).
+    Постпроцеси (фолбек оповідача тощо) завжди йдуть по всьому тексту.
+    Збіг у кеші результатів повертається одразу, state при цьому не змінюється.
+    """
+    state = state or IncrementalState()
+    legend_map, narrator_tag = parse_legend_text(legend_text)
+    nar_tag = narrator_tag or "#g1"
+    ctx = ProcessingContext(legend=legend_map, narrator_tag=nar_tag)
+
+    rules, load_logs = load_rules(RULES_DIR)
+    logs_parts: List[str] = [load_logs]
+
+    cache_key, hit = _cached_result(existing_text, ctx, rules, use_cache)
+    if hit is not None:
+        if ECHO_LOGS_TO_CONSOLE:
+            print("=== LOGС (improved_logic) ===")
+            print(hit[1])
+            print("=============================")
+        return hit[0], hit[1], state
+
     result = existing_text
     if rules:
-        logs_parts.append("Застосування правил…")
-        result = apply_rules_to_text(existing_text, rules, ctx)
-        logs_parts.append("Правила застосовано.")
+        result = _apply_rules_regions(existing_text, rules, ctx, logs_parts, state=state,
+                                      use_memo=use_cache and BLOCK_MEMO)
+        _finish_rule_profile(ctx, logs_parts)
 
-    result = _narrator_fallback(result, nar_tag)
-    result = _demote_g1_dialogs(result)
-    result = _collapse_same_tags(result)
+    result = _postprocess(result, nar_tag)
+    _remember_metadata(ctx)
+    if cache_key is not None:
+        _result_cache_put(cache_key, result, "\n".join(logs_parts), ctx)
 
     logs_text = "\n".join(logs_parts)
     if ECHO_LOGS_TO_CONSOLE:
@@ -360,13 +2171,47 @@ def process_dialogs_in_memory(
         print(logs_text)
         print("=============================")
 
-    return result, logs_text
+    return result, logs_text, state
 
 
-if __name__ == "__main__":
-    default_in = os.path.join(os.path.dirname(__file__), "Dialog_test.txt")
-    if os.path.exists(default_in):
-        txt, lg = process_dialogs(default_in, legend_text="")
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    ap = argparse.ArgumentParser(description="Розстановка #gN-тегів у книзі правилами з ./rules")
+    ap.add_argument("input", nargs="?", default=None,
+                    help="вхідний .txt (за замовчуванням Dialog_test.txt поруч)")
+    ap.add_argument("--legend", default=None, help="файл легенди (#gN - Ім'я)")
+    ap.add_argument("-o", "--output", default=None, help="куди записати результат")
+    ap.add_argument("--workers", type=int, default=1, help="процесів для паралельного режиму")
+    ap.add_argument("--streaming", action="store_true", help="потоковий режим (потрібен -o)")
+    ap.add_argument("--incremental", action="store_true",
+                    help="обробка регіонами з пам'яттю блоків (виправлені видання тієї ж книги)")
+    ap.add_argument("--no-cache", action="store_true", help="не брати/не класти результат у кеш результатів")
+    args = ap.parse_args(argv)
+
+    legend_text = ""
+    if args.legend:
+        with open(args.legend, "r", encoding="utf-8") as f:
+            legend_text = f.read()
+    args.input = args.input or os.path.join(os.path.dirname(__file__), "Dialog_test.txt")
+    if not os.path.exists(args.input):
+        print(f"Файл не знайдено: {args.input}")
+        return 1
+    if args.incremental:
+        with open(args.input, "r", encoding="utf-8") as f:
+            txt, _, _ = process_dialogs_incremental(f.read(), legend_text=legend_text, use_cache=not args.no_cache)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write(txt)
+    else:
+        txt, _ = process_dialogs(args.input, legend_text=legend_text, workers=args.workers,
+                                 output_path=args.output, streaming=args.streaming,
+                                 use_cache=not args.no_cache)
+    if not args.output:
         print("=== RESULT (head) ===")
         print(txt[:1200])
         print("…")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+line_features.py — ознаки рядка, які раніше кожне правило рахувало власними регулярками.
+
+• LineFeatures: is_dialog, дієслово мовлення (форма, лема, рід), рід займенника,
+  маркери 1-ї особи, кандидати у звертання (#gN імен перед комою/окликом)
+• FeatureIndex.of(body) — ознаки тіла рядка, пораховані один раз на унікальний текст і лише
+  коли правило про нього спитало (перетегування #gN тіло не змінює → кеш дійсний до кінця конвеєра)
+• FeatureIndex.table(lines) — ледача колонкова таблиця на весь документ (+ gid, scene):
+  колонка рахується при першому зверненні до неї
+
+Шаблони (дієслова мовлення, займенники роду, маркери 1-ї особи) визначені тут один раз;
+правила 073, 073b, 074, 074d, 079 імпортують їх звідси. is_dialog — як DocLine.is_dialog /
+IS_DIALOG_BODY (079). У конвеєрі доступно як ProcessingContext.features.
+"""
+from __future__ import annotations
+
+import re
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+NBSP = "\u00A0"
+DASHES = r"\-\u2012\u2013\u2014\u2015"
+TAG_RE = re.compile(r"^(\s*)#g(\d+|\?)\s*:\s*(.*)$", re.DOTALL)
+DIALOG_RE = re.compile(rf"^\s*(?:[{DASHES}]|[«\"„“”'’])")
+
+_LAT2CYR = str.maketrans("aceopxyiACEOPXYI", "асеорхуіАСЕОРХУІ")
+
+# Дієслова мовлення: M/F вирівняні попарно (лема — чоловіча форма), N — теперішній час
+VERBS_M = "сказав|відповів|спитав|запитав|крикнув|вигукнув|прошепотів|буркнув|мовив|промовив|пояснив|гукнув|відказав"
+VERBS_F = "сказала|відповіла|спитала|запитала|крикнула|вигукнула|прошепотіла|буркнула|промовила|пояснила|гукнула|відказала"
+VERBS_N = "каже|говорить|питає|запитує|кричить|вигукує|шепоче|бурчить|мовить|промовляє|пояснює|гукає|відказує|додає|зазначає|просить|велить|нагадує"
+VERB_ANY = re.compile(rf"\b(?:{VERBS_M}|{VERBS_F}|{VERBS_N})\b", re.IGNORECASE)
+
+_LEMMA: Dict[str, str] = {v: v for v in VERBS_M.split("|") + VERBS_N.split("|")}
+_LEMMA.update(zip(VERBS_F.split("|"), ("сказав", "відповів", "спитав", "запитав", "крикнув", "вигукнув",
+                                       "прошепотів", "буркнув", "промовив", "пояснив", "гукнув", "відказав")))
+
+P_M = r"(?:він|йому|ним|ньому|нього|цей|цього|цьому|цим|той|того|тому|тим)"
+P_F = r"(?:вона|її|їй|неї|нею|ця|цієї|цій|цією|цю|та)"
+PRON_M = re.compile(rf"\b{P_M}\b", re.IGNORECASE)
+PRON_F = re.compile(rf"\b{P_F}\b", re.IGNORECASE)
+
+I_PRON = re.compile(r"\b(я|мені|мене|мною|мій|моє|мої|в мені|у мені)\b", re.IGNORECASE)
+I_VERB = re.compile(
+    r"\b(кажу|говорю|відповідаю|питаю|прошу|дякую|зізнаюся|шепочу|бурмочу|вигукую|кричу|показую|звертаюся|стримуюсь|охаю|хочу|сплю)\b",
+    re.IGNORECASE,
+)
+
+
+def verb_gender(verb: Optional[str]) -> Optional[str]:
+    t = (verb or "").lower()
+    if re.fullmatch(VERBS_F, t):
+        return "F"
+    if re.fullmatch(VERBS_M, t):
+        return "M"
+    return None
+
+
+class LineFeatures(NamedTuple):
+    is_dialog: bool                 # тіло починається з тире/лапок
+    verb: Optional[str]             # перше дієслово мовлення (після лат→кир), як у тексті
+    verb_lemma: Optional[str]       # чоловіча форма минулого часу / сама форма теперішнього
+    verb_gender: Optional[str]      # "M" / "F" / None
+    pron_gender: Optional[str]      # "F", якщо є вона/її/…, інакше "M" для він/його/…
+    first_person: bool              # я/мені/…/кажу/хочу/…
+    vocatives: Tuple[str, ...]      # #gN імен, за якими йде кома чи оклик
+
+
+FEATURE_COLUMNS = ("gid", "scene") + LineFeatures._fields
+
+
+class FeatureIndex:
+    """Кеш ознак за текстом тіла рядка; names — name_matcher.NameIndex (для звертань)."""
+
+    def __init__(self, names: Any = None):
+        self.names = names
+        self._cache: Dict[str, LineFeatures] = {}
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {"names": self.names, "_cache": {}}  # кеш відтворюється на місці, у pickle не йде
+
+    def of(self, body: str) -> LineFeatures:
+        feats = self._cache.get(body)
+        if feats is None:
+            feats = self._cache[body] = self._compute(body)
+        return feats
+
+    def _compute(self, body: str) -> LineFeatures:
+        spaced = body.replace(NBSP, " ")
+        low = spaced.lower()
+        m = VERB_ANY.search(body.translate(_LAT2CYR).strip())
+        verb = m.group(0) if m else None
+        if PRON_F.search(body.lower()):
+            pron = "F"
+        elif PRON_M.search(body.lower()):
+            pron = "M"
+        else:
+            pron = None
+        vocs: List[str] = []
+        if self.names is not None:
+            for hit in self.names.hits(body):
+                if body[hit.end:].lstrip(" " + NBSP)[:1] in (",", "!"):
+                    vocs.extend(g for g in hit.gids if g not in vocs)
+        return LineFeatures(
+            is_dialog=bool(DIALOG_RE.match(spaced)),
+            verb=verb,
+            verb_lemma=_LEMMA.get(verb.lower()) if verb else None,
+            verb_gender=verb_gender(verb),
+            pron_gender=pron,
+            first_person=bool(I_PRON.search(low) or I_VERB.search(low)),
+            vocatives=tuple(vocs),
+        )
+
+    def table(self, lines: Iterable[str], scene_by_line: Optional[Dict[int, int]] = None) -> "FeatureTable":
+        """Колонкова таблиця документа: {назва колонки: [значення для кожного рядка]} (ледача)."""
+        return FeatureTable(self, lines, scene_by_line)
+
+
+class FeatureTable(Mapping):
+    """Колонкова таблиця ознак: table[колонка][i], table.row(i).
+
+    Знімок рядків документа на момент створення; колонка рахується при першому
+    зверненні (ознаки — через FeatureIndex.of, тож спільний кеш із правилами).
+    gid — "1"/"?"/"12" для рядків з тегом, None — без тегу; ознаки рахуються по тілу.
+    """
+
+    def __init__(self, index: FeatureIndex, lines: Iterable[str], scene_by_line: Optional[Dict[int, int]] = None):
+        self.index = index
+        self.lines = [raw.rstrip("\r\n") for raw in lines]
+        self.scene_by_line = dict(scene_by_line or {})
+        self._split: Optional[List[Tuple[Optional[str], str]]] = None
+        self._cols: Dict[str, List[Any]] = {}
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {"index": self.index, "lines": self.lines, "scene_by_line": self.scene_by_line,
+                "_split": None, "_cols": {}}
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, FeatureTable):
+            return self.lines == other.lines and self.scene_by_line == other.scene_by_line
+        return Mapping.__eq__(self, other)
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __len__(self) -> int:
+        return len(FEATURE_COLUMNS)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(FEATURE_COLUMNS)
+
+    def __getitem__(self, name: str) -> List[Any]:
+        col = self._cols.get(name)
+        if col is None:
+            if name == "gid":
+                col = [gid for gid, _ in self._tagged()]
+            elif name == "scene":
+                col = [self.scene_by_line.get(i) for i in range(len(self.lines))]
+            elif name in LineFeatures._fields:
+                k = LineFeatures._fields.index(name)
+                col = [self.index.of(body)[k] for _, body in self._tagged()]
+            else:
+                raise KeyError(name)
+            self._cols[name] = col
+        return col
+
+    def row(self, i: int) -> Dict[str, Any]:
+        """Усі колонки одного рядка (ознаки — лише цього тіла)."""
+        gid, body = self._tagged()[i]
+        return dict(zip(FEATURE_COLUMNS, (gid, self.scene_by_line.get(i)) + tuple(self.index.of(body))))
+
+    def _tagged(self) -> List[Tuple[Optional[str], str]]:
+        if self._split is None:
+            self._split = []
+            for core in self.lines:
+                m = TAG_RE.match(core)
+                self._split.append((m.group(2), m.group(3)) if m else (None, core))
+        return self._split
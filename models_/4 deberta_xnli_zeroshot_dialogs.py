@@ -1,59 +1,21 @@
-# deberta_xnli_zeroshot_dialogs.py
-#GPT: Zero-shot NLI з MoritzLaurer/mDeBERTa-v3-base-mnli-xnli для рядків діалогу
+# -*- coding: utf-8 -*-
+"""
+4 deberta_xnli_zeroshot_dialogs.py — zero-shot NLI MoritzLaurer/mDeBERTa-v3-base-mnli-xnli.
 
-# Встанови: pip install -U transformers torch
-import torch  #GPT
-from transformers import pipeline  #GPT
+Обгортка над zeroshot_speaker_models (MODEL_REGISTRY["mdeberta-xnli"]): той самий конвеєр
+(легенда, запити, кандидати, правила, кеш ембеддингів), що й у GUI та zeroshot_service.
+Параметри CLI — ті самі; передані явно перекривають типові з цього файлу.
 
-# -------- Налаштування -------- #GPT
-MODEL_ID = "MoritzLaurer/mDeBERTa-v3-base-mnli-xnli"
-TOP_K = 3
-AS_PERCENT = True
-DECIMALS = 1
+  python "models_/4 deberta_xnli_zeroshot_dialogs.py" --in книга.txt --out out.txt [--legend L.txt] [--log log.tsv] [--only_unknown]
+"""
+import os
+import sys
 
-device = 0 if torch.cuda.is_available() else -1
-clf = pipeline("zero-shot-classification", model=MODEL_ID, device=device)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# -------- Легенда (людинозрозумілі ярлики) -------- #GPT
-LEGEND = {
-    "#g1": "Оповідач (чоловік, наратив)",
-    "#g2": "Лоло (хлопчик, дитина, герой)",
-    "#g3": "Таша (жінка, мати Лоло)",
-    "#g4": "Дідо (старий чоловік, дід)",
-    "#g5": "Правнучка (дівчинка, онучка)",
-}
-CANDIDATE_LABELS = list(LEGEND.values())
-TEXT2TAG = {v: k for k, v in LEGEND.items()}
+from zeroshot_speaker_models import main  # noqa: E402
 
-def fmt(scores):
-    return [round(s * 100 if AS_PERCENT else s, DECIMALS) for s in scores]  #GPT
+DEFAULT_ARGS = ["--model", "mdeberta-xnli"]
 
-# -------- Твій багаторядковий приклад -------- #GPT
-input_block = """- Діду, а ти справді вмирати зібрався?
-- Так, cонечко.
-Смішна вона, моя правнучка. Вісім років. Який чудовий вік! Дивиться з цікавістю, і розмова про мою неминучу смерть її не лякає. Навіщо я з нею говорю? Чи люблю я її, так як любив колись онучок? Тліє щось у серці. Не горить…
-– А тобі не страшно?
-- У цьому житті добре було, а з Аллахом ще краще буде!
-– Це з Богом?
-– З Ним, онучка…
-- А чому ти сказав "з Аллахом"?
-– У Бога багато імен, і всі вони чудові…"""
-lines = [ln for ln in input_block.splitlines() if ln.strip()]
-
-print(f"Device: {'cuda' if device == 0 else 'cpu'}")
-for i, t in enumerate(lines, 1):
-    out = clf(
-        t,
-        candidate_labels=CANDIDATE_LABELS,
-        multi_label=True,
-        hypothesis_template="Це висловлювання належить категорії: {}."
-    )
-    labels = out["labels"][:TOP_K]
-    scores = out["scores"][:TOP_K]
-    tags = [TEXT2TAG[L] for L in labels]
-    names = [LEGEND[tag].split('(')[0].strip() for tag in tags]
-
-    print(f"{i:02d}. {t}")
-    print("   Ймовірні теги:", [f"{tag} ({name})" for tag, name in zip(tags, names)])
-    print("   Ймовірності:", fmt(scores), ("% " if AS_PERCENT else ""))
-    print("-" * 50)
+if __name__ == "__main__":
+    main(DEFAULT_ARGS + sys.argv[1:])
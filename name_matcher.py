@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+name_matcher.py — спільний пошук імен/аліасів легенди в рядках (Aho–Corasick).
+
+• fold(): посимвольна нормалізація — нижній регістр, без наголосів/діакритики,
+  латинські «двійники» → кирилиця (a→а, c→с, i→і, …); довжина рядка не змінюється
+• gen_name_forms(): прості відмінкові форми імені (як у zeroshot_speaker_models)
+• NameMatcher: один автомат на набір форм — усі входження за один прохід рядка
+• NameIndex: автомат для легенди (аліас → #gN) + кеш автоматів для власних наборів
+  імен правил (matcher_for); у конвеєрі доступний як ProcessingContext.names
+
+Правила, що мають власні регулярки з межами слова/пунктуацією, беруть з автомата
+лише кандидатів (present/any_in) і перевіряють їх своєю регуляркою — результат той
+самий, що й при перебиранні всіх аліасів, але рядок сканується один раз.
+"""
+from __future__ import annotations
+
+import re
+import unicodedata
+from collections import deque
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional, Tuple
+
+# латинські літери, які в українських текстах трапляються замість кириличних
+_LAT2CYR = dict(zip("aceopxyi", "асеорхуі"))
+# однолітерні еквіваленти, які re.IGNORECASE вважає рівними, а casefold() — ні
+_EXTRA_FOLD = {"ı": "і"}
+
+
+class _FoldTable(dict):
+    """Таблиця для str.translate, що заповнюється на льоту (символ → один символ)."""
+
+    def __missing__(self, code: int) -> str:
+        ch = chr(code)
+        base = "".join(c for c in unicodedata.normalize("NFD", ch) if not unicodedata.combining(c)) or ch
+        low = base.casefold()
+        if len(low) != 1:
+            low = base.lower() if len(base.lower()) == 1 else ch
+        low = _LAT2CYR.get(low, low)
+        low = _EXTRA_FOLD.get(low, low)
+        self[code] = low
+        return low
+
+
+_FOLD = _FoldTable()
+
+
+def fold(s: str) -> str:
+    """Посимвольна нормалізація для пошуку імен; len(fold(s)) == len(s)."""
+    return s.translate(_FOLD)
+
+
+def gen_name_forms(name: str) -> List[str]:
+    """Мінімальні відмінкові форми імені (називний, родовий, кличний, орудний…)."""
+    base = name.strip()
+    forms = {base, base.replace("’", "'"), base.lower(), base.lower().replace("’", "'")}
+    if base.endswith(("а", "я")):
+        stem = base[:-1]
+        for suf in ("и", "і", "ю", "єю", "е", "є", "ою"):
+            forms.add(stem + suf); forms.add((stem + suf).lower())
+    else:
+        for suf in ("а", "у", "ом", "ові", "е", "ю", "і"):
+            forms.add(base + suf); forms.add((base + suf).lower())
+    return list(forms)
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+class NameMatcher:
+    """Автомат Aho–Corasick над fold()-формами.
+
+    forms — ітерабельне рядків або Mapping форма → значення (наприклад, #gN).
+    Форми з однаковим fold() дають той самий вузол; порядок форм зберігається
+    (present() повертає їх у порядку побудови).
+    """
+
+    def __init__(self, forms: Iterable[str] | Mapping[str, Any]):
+        values = forms if isinstance(forms, Mapping) else None
+        self.forms: List[str] = []
+        self.values: List[Any] = []
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]
+        seen = set()
+        for form in forms:
+            if not form or form in seen:
+                continue
+            seen.add(form)
+            pid = len(self.forms)
+            self.forms.append(form)
+            self.values.append(values[form] if values is not None else None)
+            node = 0
+            for ch in fold(form):
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                node = nxt
+            self._out[node] += (pid,)
+        self._build_links()
+
+    def _build_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                cand = self._goto[f].get(ch, 0)
+                self._fail[nxt] = cand if cand != nxt else 0
+                self._out[nxt] += self._out[self._fail[nxt]]
+
+    def __len__(self) -> int:
+        return len(self.forms)
+
+    def _iter_raw(self, text: str):
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for i, ch in enumerate(fold(text)):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                yield i + 1, out[node]
+
+    def scan(self, text: str, whole_words: bool = False) -> List[Tuple[int, int, int]]:
+        """Усі входження: [(start, end, pattern_id)] у порядку кінця входження."""
+        hits: List[Tuple[int, int, int]] = []
+        n = len(text)
+        for end, pids in self._iter_raw(text):
+            for pid in pids:
+                start = end - len(self.forms[pid])
+                if whole_words and (
+                    (start > 0 and _is_word_char(text[start - 1])) or (end < n and _is_word_char(text[end]))
+                ):
+                    continue
+                hits.append((start, end, pid))
+        return hits
+
+    def present(self, text: str) -> List[str]:
+        """Форми, що трапляються в text як підрядок (після fold), у порядку побудови."""
+        found = set()
+        for _, pids in self._iter_raw(text):
+            found.update(pids)
+        return [self.forms[pid] for pid in sorted(found)]
+
+    def any_in(self, text: str) -> bool:
+        for _ in self._iter_raw(text):
+            return True
+        return False
+
+
+class NameHit(NamedTuple):
+    start: int
+    end: int
+    form: str
+    gids: Tuple[str, ...]
+
+
+class NameIndex:
+    """Автомат імен однієї легенди (аліас → #gN) і кеш автоматів правил.
+
+    Для кожного аліаса беруться він сам, основа (до дужок/тире) і її відмінкові
+    форми gen_name_forms(); hits() знаходить їх як цілі слова за один прохід рядка.
+    """
+
+    def __init__(self, legend: Mapping[str, str]):
+        self.legend = dict(legend)
+        self._matcher: Optional[NameMatcher] = None
+        self._sub: Dict[Tuple[str, ...], NameMatcher] = {}
+
+    @property
+    def matcher(self) -> NameMatcher:
+        if self._matcher is None:
+            gids_by_form: Dict[str, Tuple[str, ...]] = {}
+            for alias, gid in self.legend.items():
+                alias = str(alias).strip()
+                base = re.split(r"[—–(]", alias, 1)[0].strip() or alias
+                for nm in dict.fromkeys((base, alias)):
+                    if not nm or "(" in nm:
+                        continue
+                    for form in gen_name_forms(nm):
+                        key = fold(form)
+                        if str(gid) not in gids_by_form.get(key, ()):
+                            gids_by_form[key] = gids_by_form.get(key, ()) + (str(gid),)
+            self._matcher = NameMatcher(gids_by_form)
+        return self._matcher
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {"legend": self.legend, "_matcher": None, "_sub": {}}  # автомати будуються заново за легендою
+
+    def hits(self, line: str) -> List[NameHit]:
+        """Усі згадки імен легенди в рядку (цілі слова), включно з вкладеними."""
+        m = self.matcher
+        return [NameHit(s, e, m.forms[pid], m.values[pid]) for s, e, pid in m.scan(line, whole_words=True)]
+
+    def gids(self, line: str) -> List[str]:
+        """#gN, згадані в рядку, у порядку першої появи."""
+        out: List[str] = []
+        for hit in self.hits(line):
+            for gid in hit.gids:
+                if gid not in out:
+                    out.append(gid)
+        return out
+
+    def matcher_for(self, names: Iterable[str]) -> NameMatcher:
+        """Автомат для власного набору імен правила (кешується, поки не зміниться легенда)."""
+        key = tuple(names)
+        m = self._sub.get(key)
+        if m is None:
+            m = self._sub[key] = NameMatcher(key)
+        return m
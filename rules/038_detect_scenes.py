@@ -13,14 +13,14 @@
   • Кінець прологу → ставить межу (мітка "Кінець прологу"), але не змінює попередню сцену
 
 Нічого в тексті не змінює. Працює ДО правил, що потребують поточної сцени (напр. 053_*).
+Працює на спільній моделі рядків (SCOPE="lines"): індекс сцени також пишеться у line.scene.
 """
 
 import re
 
-PHASE, PRIORITY, SCOPE, NAME = 38, 0, "fulltext", "detect_scenes"  # запускаємо до 041/050+
-
-# Рядок з тегом #gN:
-TAG_ANY = re.compile(r"^\s*#g(\d+|\?)\s*:\s*(.*)$")
+PHASE, PRIORITY, SCOPE, NAME = 38, 0, "lines", "detect_scenes"  # запускаємо до 041/050+
+READS = ("text",)
+WRITES = ("meta.scenes", "meta.scene", "meta.scene_index_by_line", "meta.scene_spans", "meta.scene_boundaries", "lines.scene")
 
 # Прості заголовки без тегів (#g) — лише сам рядок
 PLAIN_SCENE_RX = re.compile(
@@ -57,17 +57,16 @@ def _label_from_match(m):
         return f"{head.strip().capitalize()} {num.strip()}"
     return None
 
-def apply(text: str, ctx):
-    lines = text.splitlines(keepends=True)
-
+def apply(doc, ctx):
     scenes = []                  # [{"label":..., "line": idx}, ...]
     scene_index_by_line = {}     # line_idx -> index in scenes
     scene_spans = []             # [{"label":..., "start": i, "end": j}, ...]
     boundary_lines = []          # індекси рядків-«розрізів» (Кінець прологу)
     current_idx = None
 
-    for i, raw in enumerate(lines):
-        line = raw.rstrip("\n")
+    for i, ln in enumerate(doc):
+        line = ln.core
+        ln.scene = None
 
         # 1) plain заголовок без тегів
         m_plain = PLAIN_SCENE_RX.match(line)
@@ -75,22 +74,19 @@ def apply(text: str, ctx):
             label = _label_from_match(m_plain)
             scenes.append({"label": label, "line": i})
             current_idx = len(scenes) - 1
-            scene_index_by_line[i] = current_idx
+            scene_index_by_line[i] = ln.scene = current_idx
             continue
 
         # 2) #g1: заголовок
-        m_tag = TAG_ANY.match(line)
-        if m_tag:
-            gid, body = m_tag.groups()
-            if gid == "1":
-                # #g1: Пролог / Глава N ...
-                m_g1 = G1_SCENE_RX.match(body.strip())
-                if m_g1:
-                    label = _label_from_match(m_g1)
-                    scenes.append({"label": label, "line": i})
-                    current_idx = len(scenes) - 1
-                    scene_index_by_line[i] = current_idx
-                    continue
+        if ln.gid == "1":
+            # #g1: Пролог / Глава N ...
+            m_g1 = G1_SCENE_RX.match(ln.body.strip())
+            if m_g1:
+                label = _label_from_match(m_g1)
+                scenes.append({"label": label, "line": i})
+                current_idx = len(scenes) - 1
+                scene_index_by_line[i] = ln.scene = current_idx
+                continue
 
         # 3) кінець прологу — маркер межі: не створюємо сцену, а лише запам'ятовуємо "розріз"
         if END_PROLOGUE_RX.match(line):
@@ -99,7 +95,7 @@ def apply(text: str, ctx):
 
         # маркуємо приналежність поточній сцені (якщо вже є)
         if current_idx is not None:
-            scene_index_by_line[i] = current_idx
+            scene_index_by_line[i] = ln.scene = current_idx
 
     # Побудова spans (start/end) — кінець включно, з урахуванням "розрізів" boundary_lines
     if scenes:
@@ -107,7 +103,7 @@ def apply(text: str, ctx):
         base_spans = []
         for idx, item in enumerate(scenes):
             start = item["line"]
-            end = (scenes[idx + 1]["line"] - 1) if idx + 1 < len(scenes) else (len(lines) - 1)
+            end = (scenes[idx + 1]["line"] - 1) if idx + 1 < len(scenes) else (len(doc) - 1)
             base_spans.append({"label": item["label"], "start": start, "end": end})
         # Розрізаємо базові інтервали на boundary_lines, не змінюючи label
         cuts = sorted(set(boundary_lines))
@@ -144,6 +140,7 @@ def apply(text: str, ctx):
     except Exception:
         pass
 
-    return text
+    return doc
 
 apply.phase, apply.priority, apply.scope, apply.name = PHASE, PRIORITY, SCOPE, NAME
+apply.reads, apply.writes = READS, WRITES
@@ -19,6 +19,10 @@ PHASE, PRIORITY, SCOPE, NAME = 41, 0, "fulltext", "normalize_dialog_punct"  #GPT
 NBSP = "\u00A0"
 ZW_REGEX = re.compile(r"[\u200B-\u200D\uFEFF]")  # zero-width chars
 ELLIPSIS = "\u2026"
+DOTS_RX = re.compile(r"\.{3,}")
+MULTISPACE_RX = re.compile(r"[ \t]{2,}")
+TRAILING_WS_RX = re.compile(r"[ \t]+$")
+WS_RUN_RX = re.compile(r"\s+")
 
 # Початок репліки після тега: #gN:  — тіло в групі 3
 TAG_ANY = re.compile(r"^(\s*)#g(\d+|\?)\s*:\s*(.*)$", re.DOTALL)
@@ -55,13 +59,13 @@ def _normalize_body(s: str) -> str:
     s = s.translate(QUOTES_MAP)
 
     # Три крапки → …; послідовності >=3 крапок теж
-    s = re.sub(r"\.{3,}", ELLIPSIS, s)
+    s = DOTS_RX.sub(ELLIPSIS, s)
 
     # Стиснути багато пробілів (включно з табами) до одного
-    s = re.sub(r"[ \t]{2,}", " ", s)
+    s = MULTISPACE_RX.sub(" ", s)
 
     # Хвостові пробіли
-    s = re.sub(r"[ \t]+$", "", s)
+    s = TRAILING_WS_RX.sub("", s)
 
     return s
 
@@ -74,7 +78,7 @@ def _is_separator_line(core: str) -> bool:
     if core.strip() == "":
         return True
     # Прибрати повторювані пробіли для стійкіших збігів
-    c = re.sub(r"\s+", " ", core.strip())
+    c = WS_RUN_RX.sub(" ", core.strip())
     return bool(SEPARATOR_RX.match(c))
 
 def apply(text, ctx):
@@ -10,6 +10,8 @@
 import re
 
 PHASE, PRIORITY, SCOPE, NAME = 49, 0, "fulltext", "build_aliases_fallback_from_raw_lines"
+READS = ("legend", "meta.legend", "meta.legend_text", "meta.hints")
+WRITES = ("meta.legend", "meta.hints")
 
 # латиниця, схожа на кирилицю
 _LAT2CYR = str.maketrans("aceopxyiACEOPXYI", "асеорхуіАСЕОРХУІ")
@@ -125,3 +127,4 @@ def apply(text, ctx):
     return text
 
 apply.phase, apply.priority, apply.scope, apply.name = PHASE, PRIORITY, SCOPE, NAME
+apply.reads, apply.writes = READS, WRITES
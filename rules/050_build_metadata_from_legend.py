@@ -20,6 +20,8 @@
 import re
 
 PHASE, PRIORITY, SCOPE, NAME = 50, 0, "fulltext", "build_metadata_from_legend"
+READS = ("text", "meta.legend_text", "meta.legend", "meta.hints", "meta.relations")
+WRITES = ("meta.legend", "meta.hints", "meta.relations")
 
 LINE = re.compile(r"^\s*#g(?P<num>\d+)\s*-\s*(?P<body>.+?)\s*$")
 PAREN = re.compile(r"\((?P<attrs>.*?)\)\s*$")
@@ -139,3 +141,4 @@ def apply(text, ctx):
     return text
 
 apply.phase, apply.priority, apply.scope, apply.name = PHASE, PRIORITY, SCOPE, NAME
+apply.reads, apply.writes = READS, WRITES
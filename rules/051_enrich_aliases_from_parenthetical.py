@@ -17,6 +17,8 @@
 import re
 
 PHASE, PRIORITY, SCOPE, NAME = 51, 0, "fulltext", "enrich_aliases_from_parenthetical"
+READS = ("meta.legend",)
+WRITES = ("meta.legend",)
 
 # латиниця, схожа на кирилицю (lookalikes)
 _LAT2CYR = str.maketrans("aceopxyiACEOPXYI", "асеорхуіАСЕОРХУІ")
@@ -130,3 +132,4 @@ def apply(text: str, ctx):
     return text
 
 apply.phase, apply.priority, apply.scope, apply.name = PHASE, PRIORITY, SCOPE, NAME
+apply.reads, apply.writes = READS, WRITES
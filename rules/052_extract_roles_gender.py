@@ -14,6 +14,8 @@
 import re
 
 PHASE, PRIORITY, SCOPE, NAME = 52, 0, "fulltext", "extract_roles_gender"  #GPT
+READS = ("legend", "meta.legend", "meta.legend_text", "meta.hints")
+WRITES = ("meta.roles_gender",)
 
 # латиниця-схожа-на-кирилицю
 _LAT2CYR = str.maketrans("aceopxyiACEOPXYI", "асеорхуіАСЕОРХУІ")
@@ -168,3 +170,4 @@ def apply(text: str, ctx):
     return text
 
 apply.phase, apply.priority, apply.scope, apply.name = PHASE, PRIORITY, SCOPE, NAME  #GPT
+apply.reads, apply.writes = READS, WRITES
@@ -1,6 +1,8 @@
 # 052b_set_first_person_hint.py — встановлює hints.first_person_gid з легенди/ролей
 # -*- coding: utf-8 -*-
 PHASE, PRIORITY, SCOPE, NAME = 52, 1, "fulltext", "set_first_person_hint"
+READS = ("meta.roles_gender", "meta.hints")
+WRITES = ("meta.hints",)
 
 def apply(text, ctx):
     meta = getattr(ctx, "metadata", {}) or {}
@@ -25,3 +27,4 @@ def apply(text, ctx):
     return text
 
 apply.phase, apply.priority, apply.scope, apply.name = PHASE, PRIORITY, SCOPE, NAME
+apply.reads, apply.writes = READS, WRITES
@@ -3,8 +3,13 @@
 import re
 
 PHASE, PRIORITY, SCOPE, NAME = 53, 0, "fulltext", "universal_scene_time_location_constraints"
+READS = ("text", "legend", "meta.legend", "meta.legend_text", "meta.roles_gender", "meta.constraints", "meta.scene")
+WRITES = ("text", "meta.constraints", "meta.scene")
 
 TAG_ANY = re.compile(r"^(\s*)#g(\d+|\?)\s*:\s*(.*)$", re.DOTALL)
+PROLOGUE_RX = re.compile(r"^\s*(пролог|епілог)\.?\s*$", re.IGNORECASE)
+CHAPTER_RX = re.compile(r"^\s*(глава|розділ|частина)\s+(?:\d+|[IVXLCDM]+)\.?\s*$", re.IGNORECASE)
+CHAPTER_NUM_RX = re.compile(r"(?:\d+|[IVXLCDM]+)", re.IGNORECASE)
 _LAT2CYR = str.maketrans("aceopxyiACEOPXYI", "асеорхуіАСЕОРХУІ")
 def _nrm(s: str) -> str: return (s or "").translate(_LAT2CYR).strip()
 
@@ -90,10 +95,10 @@ def _build_constraints(ctx):
 def _label_from_text(txt: str):
     if not txt: return None
     t = txt.strip()
-    m = re.match(r"^\s*(пролог|епілог)\.?\s*$", t, flags=re.IGNORECASE)
+    m = PROLOGUE_RX.match(t)
     if m: return m.group(1).strip().capitalize()
-    m = re.match(r"^\s*(глава|розділ|частина)\s+(?:\d+|[IVXLCDM]+)\.?\s*$", t, flags=re.IGNORECASE)
-    if m: return f"{m.group(1).strip().capitalize()} " + re.findall(r"(?:\d+|[IVXLCDM]+)", t, flags=re.IGNORECASE)[0]
+    m = CHAPTER_RX.match(t)
+    if m: return f"{m.group(1).strip().capitalize()} " + CHAPTER_NUM_RX.findall(t)[0]
     return None
 
 def _detect_scene(line: str):
@@ -150,3 +155,4 @@ def apply(text: str, ctx):
     return "".join(out)
 
 apply.phase, apply.priority, apply.scope, apply.name = PHASE, PRIORITY, SCOPE, NAME
+apply.reads, apply.writes = READS, WRITES
@@ -0,0 +1,25 @@
+# 053b_line_features.py — таблиця ознак рядків (діалог, дієслово мовлення, рід, 1-ша особа, звертання)
+# -*- coding: utf-8 -*-
+PHASE, PRIORITY, SCOPE, NAME = 53, 5, "lines", "line_features"  # після нормалізації (040–045) і легенди (049–052b)
+READS = ("text", "meta.legend", "meta.scene_index_by_line")
+WRITES = ("meta.line_features",)
+
+def apply(doc, ctx):
+    # Таблиця ледача (line_features.FeatureTable): тут лише знімок рядків, колонки рахуються
+    # при першому зверненні аналізу/ML; 074/079 беруть ознаки з того ж ctx.features лише для своїх рядків
+    features = getattr(ctx, "features", None)
+    if features is None:
+        return doc
+    meta = getattr(ctx, "metadata", {}) or {}
+    table = features.table((ln.raw for ln in doc), meta.get("scene_index_by_line"))
+    meta["line_features"] = table
+    setattr(ctx, "metadata", meta)
+
+    try:
+        ctx.logs.append(f"[053b line_features] lines:{len(table.lines)}")
+    except Exception:
+        pass
+    return doc
+
+apply.phase, apply.priority, apply.scope, apply.name = PHASE, PRIORITY, SCOPE, NAME
+apply.reads, apply.writes = READS, WRITES
@@ -20,6 +20,7 @@ PAT = re.compile(
     r"\s*[" + re.escape(DASH) + r"]\s*(?P<tail>.+?)\s*(?:[" + re.escape(DASH) + r"]|$)",
     re.DOTALL
 )
+FP_VERB_RX = re.compile(r"\b" + FP_VERBS + r"\b", re.IGNORECASE)
 
 def _first_gid(ctx):
     return (getattr(ctx, "metadata", {}) or {}).get("hints", {}).get("first_person_gid")
@@ -49,7 +50,7 @@ def apply(text: str, ctx):
         if not mm: continue
         tail = (mm.group("tail") or "").strip()
 
-        if not re.search(r"\b" + FP_VERBS + r"\b", tail, flags=re.IGNORECASE):
+        if not FP_VERB_RX.search(tail):
             continue
 
         # перетеглюємо на first_person_gid (до pair-lock)
@@ -2,18 +2,17 @@
 # -*- coding: utf-8 -*-
 
 import re
+
+from line_features import VERBS_F, VERBS_M, VERBS_N  # родові + нейтральні (теп. час), спільні з ознаками рядків
+
 PHASE, PRIORITY, SCOPE, NAME = 73, 8, "fulltext", "leadin_sayer_gender_checked"
 
-# Родові
-VERBS_M = "сказав|відповів|спитав|запитав|крикнув|вигукнув|прошепотів|буркнув|мовив|промовив|пояснив|гукнув|відказав"
-VERBS_F = "сказала|відповіла|спитала|запитала|крикнула|вигукнула|прошепотіла|буркнула|промовила|пояснила|гукнула|відказала"
-# Нейтральні (теп. час)
-VERBS_N = "каже|говорить|питає|запитує|кричить|вигукує|шепоче|бурчить|мовить|промовляє|пояснює|гукає|відказує|додає|зазначає|просить|велить|нагадує"
 VERBS_ANY = rf"(?:{VERBS_M}|{VERBS_F}|{VERBS_N})"
 
 TAG_ANY = re.compile(r"^(\s*)#g(\d+|\?)\s*:\s*(.*)$", re.DOTALL)
 _LAT2CYR = str.maketrans("aceopxyiACEOPXYI", "асеорхуіАСЕОРХУІ")
 PREV_LOOKBACK = 2  # скільки рядків назад дивитись
+PREFACE_SPLIT = re.compile(r"[—\-«\"„“”'’:]\s*")  # префейс репліки — до першого тире/лапок/двокрапки
 
 # Узагальнений «галас натовпу» перед реплікою → не атрибутуємо конкретному мовцю (#GPT)
 GROUP_NOISE = re.compile(
@@ -58,9 +57,9 @@ def _make_leadin_pattern(name_rx):
     return re.compile(rf"^\s*{name_rx.pattern}\s+.{{0,180}}?\b(?P<verb>{VERBS_ANY})\b.*?$",
                       re.IGNORECASE | re.DOTALL)
 
-def _match_leadin(text, name_rx, amap, rg):
+def _match_leadin(text, leadin_rx, amap, rg):
     if not text: return None, None, None
-    mm = _make_leadin_pattern(name_rx).search(_nrm(text))
+    mm = leadin_rx.search(_nrm(text))
     if not mm: return None, None, None
     name_txt = _nrm(mm.group("name")); verb_txt = _nrm(mm.group("verb"))
     gid_cand = amap.get(name_txt.casefold())
@@ -86,6 +85,7 @@ def apply(text: str, ctx):
     rg = _roles_gender(ctx)
     amap = _legend_alias_map(ctx)
     name_rx = _compile_name_regex(list(amap.keys()))
+    leadin_rx = _make_leadin_pattern(name_rx)  # один раз на прогін, не на кожен рядок
 
     lines = text.splitlines(keepends=True)
     resolved_prev = resolved_inline = 0
@@ -110,7 +110,7 @@ def apply(text: str, ctx):
             if GROUP_NOISE.search(prev):
                 done = True
                 break
-            gid_cand, verb_txt, _ = _match_leadin(prev, name_rx, amap, rg)
+            gid_cand, verb_txt, _ = _match_leadin(prev, leadin_rx, amap, rg)
             if gid_cand:
                 lines[i] = f"{indent}{gid_cand}: {body}"
                 resolved_prev += 1
@@ -120,11 +120,11 @@ def apply(text: str, ctx):
             continue
 
         # 2) lead-in у цьому ж рядку (префейс до першого «—/лапок/двокрапки»)
-        preface = re.split(r"[—\-«\"„“”'’:]\s*", (body or ""), maxsplit=1)[0]
+        preface = PREFACE_SPLIT.split((body or ""), maxsplit=1)[0]
         # Якщо префейс виглядає як «інші/усі/вони … кричать:» — не атрибутуємо (#GPT)
         if GROUP_NOISE.search(preface):
             continue
-        gid_cand, verb_txt, _ = _match_leadin(preface, name_rx, amap, rg)
+        gid_cand, verb_txt, _ = _match_leadin(preface, leadin_rx, amap, rg)
         if gid_cand:
             lines[i] = f"{indent}{gid_cand}: {body}"
             resolved_inline += 1
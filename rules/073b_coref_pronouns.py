@@ -18,6 +18,11 @@
 
 import re
 
+try:
+    from context_index import SweepIndex
+except ImportError:  # без спільного модуля — скан назад на CONTEXT_BACK рядків, як раніше
+    SweepIndex = None
+
 PHASE, PRIORITY, SCOPE, NAME = 73, 10, "fulltext", "coref_pronouns"  #GPT
 
 NBSP = "\u00A0"
@@ -31,11 +36,8 @@ P_F = r"(?:вона|її|їй|неї|нею|цій|цією|цієї|цю|ця)"
 PRON_M = re.compile(rf"\b{P_M}\b", re.IGNORECASE)
 PRON_F = re.compile(rf"\b{P_F}\b", re.IGNORECASE)
 
-# Дієслова мовлення (родові + нейтральні)
-VERBS_M = "сказав|відповів|спитав|запитав|крикнув|вигукнув|прошепотів|буркнув|мовив|промовив|пояснив|гукнув|відказав"
-VERBS_F = "сказала|відповіла|спитала|запитала|крикнула|вигукнула|прошепотіла|буркнула|промовила|пояснила|гукнула|відказала"
-VERBS_N = "каже|говорить|питає|запитує|кричить|вигукує|шепоче|бурчить|мовить|промовляє|пояснює|гукає|відказує|додає|зазначає|просить|велить|нагадує"
-VERB_ANY = re.compile(rf"\b(?:{VERBS_M}|{VERBS_F}|{VERBS_N})\b", re.IGNORECASE)
+# Дієслова мовлення (родові + нейтральні) — спільні з line_features
+from line_features import VERB_ANY, VERBS_F, VERBS_M, VERBS_N
 
 # Патерн «… — він/вона/та .»
 END_PRON = re.compile(rf"{PRON_M.pattern}|{PRON_F.pattern}|\bта\b", re.IGNORECASE)
@@ -105,6 +107,27 @@ def _nearest_prev_any(lines, i, want_gender, rg):
             return cand
     return None
 
+def _trail_push(trail, ln, j, rg, block_by_line):
+    """Додати рядок j (уже остаточний) до індексу: мовець, його рід, блок діалогу."""
+    m = TAG_ANY.match(ln)
+    cand = None
+    if m and m.group(2) not in ("?", "1"):
+        cand = f"#g{m.group(2)}"
+    trail.push(cand, keys=(_gender_of(cand, rg),) if cand else (), block=block_by_line.get(j))
+
+def _trail_same_block(trail, i, want_gender, block_by_line):
+    """Те саме, що _nearest_prev_same_block, за O(1) з префіксного індексу."""
+    start = trail.block_run_start(block_by_line.get(i))
+    if start is None:
+        return None
+    j, cand = trail.last_with(want_gender)
+    return cand if j is not None and j >= max(start, i - CONTEXT_BACK) else None
+
+def _trail_any(trail, i, want_gender):
+    """Те саме, що _nearest_prev_any, за O(1) з префіксного індексу."""
+    j, cand = trail.last_with(want_gender)
+    return cand if j is not None and j >= i - CONTEXT_BACK else None
+
 def apply(text: str, ctx):
     rg = _roles_gender(ctx)
     if not rg:
@@ -114,7 +137,19 @@ def apply(text: str, ctx):
     lines = text.splitlines(keepends=True)
     resolved_tail = resolved_verb = resolved_generic = 0
 
+    # Рядки вище i вже остаточні (змінюється лише поточний) → найближчий мовець
+    # потрібного роду береться з індексу, а не скануванням назад від кожного #g?.
+    trail = SweepIndex() if SweepIndex is not None else None
+    if trail is not None:
+        same_block = lambda i, want: _trail_same_block(trail, i, want, block_by_line)
+        any_prev = lambda i, want: _trail_any(trail, i, want)
+    else:
+        same_block = lambda i, want: _nearest_prev_same_block(lines, i, want, rg, block_by_line)
+        any_prev = lambda i, want: _nearest_prev_any(lines, i, want, rg)
+
     for i, ln in enumerate(lines):
+        if trail is not None and i:
+            _trail_push(trail, lines[i - 1], i - 1, rg, block_by_line)
         m = TAG_ANY.match(ln)
         if not m:
             continue
@@ -129,8 +164,7 @@ def apply(text: str, ctx):
 
         # 1) «— … — вона/він.» без дієслова → сильний сигнал
         if INLINE_TAIL.search(body or ""):
-            cand = _nearest_prev_same_block(lines, i, want, rg, block_by_line) or \
-                   _nearest_prev_any(lines, i, want, rg)
+            cand = same_block(i, want) or any_prev(i, want)
             if cand:
                 lines[i] = f"{indent}{cand}: {body}"
                 resolved_tail += 1
@@ -138,15 +172,14 @@ def apply(text: str, ctx):
 
         # 2) Є займенник + дієслово мовлення у рядку (ймовірна атрибуція)
         if _has_verb_near_pronoun(body or "") or _is_dialog_body(body):
-            cand = _nearest_prev_same_block(lines, i, want, rg, block_by_line) or \
-                   _nearest_prev_any(lines, i, want, rg)
+            cand = same_block(i, want) or any_prev(i, want)
             if cand:
                 lines[i] = f"{indent}{cand}: {body}"
                 resolved_verb += 1
                 continue
 
         # 3) Генеральний fallback у межах блоку
-        cand = _nearest_prev_same_block(lines, i, want, rg, block_by_line)
+        cand = same_block(i, want)
         if cand:
             lines[i] = f"{indent}{cand}: {body}"
             resolved_generic += 1
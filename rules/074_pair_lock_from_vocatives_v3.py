@@ -11,6 +11,8 @@
 """
 import re, unicodedata
 
+from line_features import I_PRON, I_VERB  # маркери 1-ї особи — спільні з ознаками рядків (ctx.features)
+
 PHASE, PRIORITY, SCOPE, NAME = 74, 6, "fulltext", "pair_lock_from_vocatives_v3"
 
 NBSP = "\u00A0"
@@ -19,6 +21,7 @@ DASH = r"\-\u2012\u2013\u2014\u2015"
 ELLIPSIS = "\u2026"
 DIALOG = re.compile(rf"^\s*(?:[{DASH}]|[«\"„“”'’])")
 TAG_ANY = re.compile(r"^(\s*)#g(\d+|\?)\s*:\s*(.*)$")
+NARRATOR_HEAD = re.compile(r"^\s*#g1\s*:\s*")
 
 LEADIN = re.compile(
     r"(?:сказ(ав|ала|али)|відпов(ів|іла|іли)|крик(нув|нула|нули)|мовив|промовила|звернувся|шепотів)\s+([A-ZА-ЯЇІЄҐ][\w’'\-]+)"
@@ -26,11 +29,6 @@ LEADIN = re.compile(
     re.IGNORECASE
 )
 
-I_PRON = re.compile(r"\b(я|мені|мене|мною|мій|моє|мої|в мені|у мені)\b", re.IGNORECASE)
-I_VERB = re.compile(
-    r"\b(кажу|говорю|відповідаю|питаю|прошу|дякую|зізнаюся|шепочу|бурмочу|вигукую|кричу|показую|звертаюся|стримуюсь|охаю|хочу|сплю)\b",
-    re.IGNORECASE,
-)
 WORD = re.compile(r"[A-ZА-ЯЇІЄҐ][\w’'\-]+")
 
 def _nfd_strip(s: str) -> str:
@@ -49,19 +47,24 @@ def _alias_map(ctx):
                 amap.setdefault(_norm(cand), str(gid))
     return amap
 
-def _addressees(body: str, amap: dict):
+def _addressees(body: str, amap: dict, matcher=None, patterns=None):
     low = _norm(body)
     hits = []
-    for name, gid in amap.items():
+    # matcher (ctx.names.matcher_for) лишає тільки аліаси, що є в рядку, — регулярки лише для них
+    names = matcher.present(low) if matcher is not None else amap
+    # patterns (ctx.patterns) — банк регулярок: шаблони для імені компілюються раз на процес
+    rx = patterns.compile if patterns is not None else re.compile
+    for name in names:
+        gid = amap[name]
         if len(name) < 2:
             continue
         # Підставляємо ELLIPSIS напряму у вираз без використання невизначеної змінної
         # «ell» у форматі. Символ трикрапки \u2026 входить до класу символів поруч із
         # крапкою. Безпечніше явно вказати його в регулярному виразі.
-        start_pat = re.compile(
+        start_pat = rx(
             rf"^(?:[{DASH}]\s*)?(?:[«\"„“”'’])?\s*{re.escape(name)}(?=[ ,!?:;\.\u2026]|$)"
         )
-        any_pat = re.compile(
+        any_pat = rx(
             rf"\b{re.escape(name)}\b(?=[ ,!?:;\.\u2026]|$)"
         )
         if start_pat.search(low) or any_pat.search(low):
@@ -77,14 +80,36 @@ def _dialog_gid_of_line(line: str):
     if not DIALOG.match(body_norm): return None, None, None
     return indent, f"#g{gid}", body
 
-def _last_speaker(lines, i):
-    for k in range(i - 1, -1, -1):
-        ind, gid, body = _dialog_gid_of_line(lines[k])
-        if gid and gid not in ("#g?", "#g1"):
-            return gid
-    return None
-
-def _guess_pair(lines, i, amap):
+class _Behind:
+    """Що видно назад від рядка i: останній явний спікер репліки й останні теги.
+
+    Рядки до i вже остаточні (правило переписує лише рядки від i далі), тож їх
+    досить переглянути раз, а не йти назад до початку книги від кожного #g?.
+    """
+
+    def __init__(self, lines):
+        self.lines, self.pos = lines, 0
+        self.speaker = None              # останній явний спікер репліки (не #g?/#g1)
+        self.last = self.other = None    # останній тег (не #g?/#g1) і останній, відмінний від нього
+
+    def at(self, i):
+        while self.pos < i:
+            line = self.lines[self.pos]
+            self.pos += 1
+            ind, gid, body = _dialog_gid_of_line(line)
+            if gid and gid not in ("#g?", "#g1"):
+                self.speaker = gid
+            m = TAG_ANY.match(line.rstrip("\r\n"))
+            if m:
+                g = f"#g{m.group(2)}"
+                if g not in ("#g?", "#g1") and g != self.last:
+                    self.last, self.other = g, self.last
+        return self
+
+def _last_speaker(behind, i):
+    return behind.at(i).speaker
+
+def _guess_pair(lines, i, amap, matcher=None, patterns=None):
     counter = {}
     def bump(g, w=1):
         if g and g != "#g1":
@@ -96,7 +121,7 @@ def _guess_pair(lines, i, amap):
         if gid:
             if gid != "#g?":
                 bump(gid, w=2)        # явний спікер = сильний сигнал
-            for g in _addressees(body, amap):
+            for g in _addressees(body, amap, matcher, patterns):
                 bump(g, w=1)
             continue
         s = lines[k]
@@ -114,17 +139,12 @@ def _guess_pair(lines, i, amap):
         if len(pair) == 2: break
     return tuple(pair) if len(pair) == 2 else None
 
-def _fallback_pair_with_prev(lines, i, prev):
+def _fallback_pair_with_prev(behind, i, prev):
     if not prev:
         return None
-    for k in range(i - 1, -1, -1):
-        m = TAG_ANY.match(lines[k].rstrip("\r\n"))
-        if not m:
-            continue
-        gid = f"#g{m.group(2)}"
-        if gid not in ("#g?", "#g1") and gid != prev:
-            return (prev, gid)
-    return None
+    behind.at(i)
+    gid = behind.last if behind.last != prev else behind.other
+    return (prev, gid) if gid else None
 
 def _split_eol(s: str):
     core = s.rstrip("\r\n")
@@ -134,7 +154,18 @@ def apply(text, ctx):
     lines = text.splitlines(keepends=True)
     meta  = getattr(ctx, "metadata", {}) or {}
     amap  = _alias_map(ctx)
+    names = getattr(ctx, "names", None)  # спільний автомат імен (improved_logic)
+    matcher = names.matcher_for(amap) if names is not None else None
+    patterns = getattr(ctx, "patterns", None)
+    features = getattr(ctx, "features", None)  # спільні ознаки рядків (1-ша особа тощо)
+
+    def _first_person(body):
+        if features is not None:
+            return features.of(body).first_person
+        low = body.replace(NBSP, " ").lower()
+        return bool(I_PRON.search(low) or I_VERB.search(low))
     first_person_gid = (meta.get('hints') or {}).get('first_person_gid')  # може бути None
+    behind = _Behind(lines)
 
     i = 0
     while i < len(lines):
@@ -148,18 +179,16 @@ def apply(text, ctx):
             i += 1; continue
 
         # 0) зібрати пару (враховуючи останнього явного + вокативи/лід-іни)
-        pair = _guess_pair(lines, i, amap)
-        vocs = _addressees(body, amap)
-        prev = _last_speaker(lines, i)
+        pair = _guess_pair(lines, i, amap, matcher, patterns)
+        vocs = _addressees(body, amap, matcher, patterns)
+        prev = _last_speaker(behind, i)
         if not pair and len(vocs) == 1 and prev and prev != vocs[0]:
             pair = (prev, vocs[0])
         if not pair:
-            pair = _fallback_pair_with_prev(lines, i, prev)
-
-        low = body.replace(NBSP, " ").lower()
+            pair = _fallback_pair_with_prev(behind, i, prev)
 
         # 1) якщо пари НІ — дозволяємо 1-шу особу (лише коли hint заданий)
-        if not pair and first_person_gid and (I_PRON.search(low) or I_VERB.search(low)):
+        if not pair and first_person_gid and _first_person(body):
             lines[i] = f"{ind}{first_person_gid}: {body}"
             i += 1; continue
 
@@ -180,14 +209,13 @@ def apply(text, ctx):
                 if not core2.strip():
                     j += 1; continue
                 # наратив #g1 — пропускаємо
-                if re.match(r"^\s*#g1\s*:\s*", core2):
+                if NARRATOR_HEAD.match(core2):
                     j += 1; continue
                 break  # інший текст → кінець блоку
             ind2, gid2_raw, b2 = m2.groups()
             g2 = f"#g{gid2_raw}"
 
-            low2 = b2.replace(NBSP, " ").lower()
-            vocs2 = _addressees(b2, amap)
+            vocs2 = _addressees(b2, amap, matcher, patterns)
 
             # Vocative → спікер = «не адресат», якщо адресат ∈ pair
             only = [v for v in vocs2 if v in pair]
@@ -198,7 +226,7 @@ def apply(text, ctx):
                 j += 1; continue
 
             # 1-ша особа усередині пари → тільки якщо hint заданий і входить у пару
-            if first_person_gid and (I_PRON.search(low2) or I_VERB.search(low2)) and first_person_gid in pair:
+            if first_person_gid and _first_person(b2) and first_person_gid in pair:
                 lines[j] = f"{ind2}{first_person_gid}: {b2}{eol2}"
                 expect = pair[1] if first_person_gid == pair[0] else pair[0]
                 j += 1; continue
@@ -222,3 +250,4 @@ def apply(text, ctx):
     return "".join(lines)
 
 apply.phase, apply.priority, apply.scope, apply.name = PHASE, PRIORITY, SCOPE, NAME
+apply.local = False  # пошук спікера назад через усю книгу, блок пари — вперед через наратив
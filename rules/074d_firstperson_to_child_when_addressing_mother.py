@@ -2,6 +2,8 @@
 """1-ша особа + звертання до матері (#g3 з легенди) → спікер first_person_gid (#g2 за замовч.)."""
 import re
 
+from line_features import I_PRON  # займенники 1-ї особи — спільні з 074 і ознаками рядків
+
 PHASE, PRIORITY, SCOPE, NAME = 74, 5, "fulltext", "firstperson_to_child_when_addressing_mother"
 
 NBSP = "\u00A0"
@@ -9,7 +11,6 @@ DASH = r"\-\u2012\u2013\u2014\u2015"
 DIALOG = re.compile(rf"^\s*(?:[{DASH}]|[«\"„“”'’])")
 TAG_ANY = re.compile(r"^(\s*)#g(\d+|\?)\s*:\s*(.*)$", re.DOTALL)
 
-I_PRON = re.compile(r"\b(я|мені|мене|мною|мій|моє|мої|в мені|у мені)\b", re.IGNORECASE)
 I_VERB = re.compile(r"\b(кажу|говорю|відповідаю|питаю|прошу|дякую|зізнаюся|шепочу|бурмочу|вигукую|кричу|показую|звертаюся|стримуюсь|охаю)\b", re.IGNORECASE)
 
 TRIM = ".,:;!?»«”“’'—–-()[]{}"
@@ -25,11 +26,12 @@ def _alias_map(ctx):
         amap[base.lower()] = str(gid)
     return amap
 
-def _addresses_mother(text: str, amap: dict) -> bool:
+def _addresses_mother(text: str, amap: dict, patterns=None) -> bool:
     low = _norm(text)
+    rx = patterns.compile if patterns is not None else re.compile  # ctx.patterns — банк регулярок
     for name, gid in amap.items():
         if gid == "#g3":
-            if re.search(rf"(?:^|[\s«\"'—–-]){re.escape(name)}\s*[,!?:]", low):
+            if rx(rf"(?:^|[\s«\"'—–-]){re.escape(name)}\s*[,!?:]").search(low):
                 return True
     return False
 
@@ -38,6 +40,7 @@ def apply(text, ctx):
     meta  = getattr(ctx, "metadata", {}) or {}
     first_person_gid = (meta.get('hints') or {}).get('first_person_gid', '#g2')
     amap  = _alias_map(ctx)
+    patterns = getattr(ctx, "patterns", None)
 
     for i, ln in enumerate(lines):
         m = TAG_ANY.match(ln)
@@ -54,7 +57,7 @@ def apply(text, ctx):
             continue
 
         low = body_norm.lower()
-        if (I_PRON.search(low) or I_VERB.search(low)) and _addresses_mother(body_norm, amap):
+        if (I_PRON.search(low) or I_VERB.search(low)) and _addresses_mother(body_norm, amap, patterns):
             lines[i] = f"{indent}{first_person_gid}: {body}"
 
     return "".join(lines)
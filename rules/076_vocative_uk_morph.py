@@ -18,6 +18,8 @@ name = "vocative_uk_morph"
 
 TAG = re.compile(r"^(\s*)#g(\d+|\?)\s*:\s*(.*)$", re.DOTALL)
 IS_DIALOG = re.compile(r"^\s*(?:[-–—]|[«\"„“”'’])")
+VOCATIVE_WORD = re.compile(r"\b([A-ZА-ЯЇІЄҐ][\w’'\-]+)\s*[,!:—]")  # слово + пунктуація кличної форми
+ALIAS_SPLIT = re.compile(r"[/\\;|]")
 TRIM = ".,:;!?»«”“’'—–-()[]{}"
 
 # --- нормалізація/ключі ---
@@ -78,7 +80,7 @@ def _aliases_from_legend(ctx) -> Dict[str, Set[str]]:
             if not c:
                 continue
             # токени по словах
-            for tok in re.split(r"[/\\;|]", c):
+            for tok in ALIAS_SPLIT.split(c):
                 tok = tok.strip()
                 if not tok:
                     continue
@@ -93,22 +95,24 @@ def _gid2names(amap: Dict[str, Set[str]]) -> Dict[str, Set[str]]:
             g2n.setdefault(gid, set()).add(alias)
     return g2n
 
-def _find_vocative_gid(text: str, amap: Dict[str, Set[str]]) -> Optional[str]:
+def _find_vocative_gid(text: str, amap: Dict[str, Set[str]], matcher=None, patterns=None) -> Optional[str]:
     """Шукає у перших ~90 символів звертання; віддає #gN якщо однозначно."""
     s = _strip_acc(text).lstrip()
     win = s[:90]
     # спершу: слово + пунктуація як маркер кличної форми
-    m = re.search(r"\b([A-ZА-ЯЇІЄҐ][\w’'\-]+)\s*[,!:—]", win)
+    m = VOCATIVE_WORD.search(win)
     if m:
         cand = _key(m.group(1))
         gids = amap.get(cand)
         if gids and len(gids) == 1:
             return next(iter(gids))
     # запасний: пошук будь-якого з alias усередині вікна (по спаданню довжини)
-    tokens = sorted(amap.keys(), key=len, reverse=True)
+    # matcher (ctx.names.matcher_for) одним проходом відсіює аліаси, яких у вікні немає
+    tokens = sorted(matcher.present(win) if matcher is not None else amap.keys(), key=len, reverse=True)
     hits: Set[str] = set()
+    rx = patterns.compile if patterns is not None else re.compile  # ctx.patterns — банк регулярок
     for tk in tokens:
-        if re.search(rf"\b{re.escape(tk)}\b", win, flags=re.IGNORECASE):
+        if rx(rf"\b{re.escape(tk)}\b", re.IGNORECASE).search(win):
             for g in amap[tk]:
                 hits.add(g)
     if len(hits) == 1:
@@ -119,6 +123,9 @@ def apply(text: str, ctx) -> str:
     lines = text.splitlines(keepends=True)
     amap = _aliases_from_legend(ctx)
     g2n = _gid2names(amap)
+    names = getattr(ctx, "names", None)
+    matcher = names.matcher_for(amap) if names is not None else None
+    patterns = getattr(ctx, "patterns", None)
     narrator = getattr(ctx, "narrator_tag", "#g1")
 
     # Розпарсимо рядки з тегами для доступу до сусідів
@@ -155,7 +162,7 @@ def apply(text: str, ctx) -> str:
         tag = it["tag"]; rest = it["rest"]
         if not it["is_dialog"]: continue
 
-        gid_voc = _find_vocative_gid(rest, amap)
+        gid_voc = _find_vocative_gid(rest, amap, matcher, patterns)
         if not gid_voc:
             continue
 
@@ -188,3 +195,4 @@ def apply(text: str, ctx) -> str:
     return "".join(out)
 
 apply.phase, apply.priority, apply.scope, apply.name = phase, priority, scope, name
+apply.local = False  # вікно ±5 реплік не зупиняється на межі регіону
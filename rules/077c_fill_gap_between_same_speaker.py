@@ -2,6 +2,11 @@
 # -*- coding: utf-8 -*-
 import re
 
+try:
+    from context_index import ForwardIndex, SweepIndex
+except ImportError:  # без спільного модуля — скани назад/вперед, як раніше
+    ForwardIndex = SweepIndex = None
+
 PHASE, PRIORITY, SCOPE, NAME = 77, 2, "fulltext", "fill_gap_between_same_speaker"
 
 NBSP = "\u00A0"
@@ -85,11 +90,33 @@ def _recent_other(lines, i, cur_gid, back=20):
         j -= 1; cnt += 1
     return None
 
+def _trail_item(ln: str):
+    """(мовець або None, «пропускний» рядок) — ті самі категорії, що в _prev_known/_next_known."""
+    if not ln.strip():
+        return None, True
+    m = TAG.match(ln)
+    if not m:
+        return None, True
+    gid = m.group(2)
+    if gid == "1":
+        return None, True
+    if gid != "?" and _is_dialog_line(ln):
+        return f"#g{gid}", False
+    return None, False
+
 def apply(text: str, ctx):
     lines = text.splitlines(keepends=True)
     fixed = 0
 
+    # Префіксні індекси замість сканів від кожного #g?: назад — по вже остаточних рядках
+    # (правило змінює лише поточний рядок), вперед — по знімку ще не оброблених.
+    trail = SweepIndex() if SweepIndex is not None else None
+    ahead = ForwardIndex(map(_trail_item, lines)) if ForwardIndex is not None else None
+
     for i, ln in enumerate(lines):
+        if trail is not None and i:
+            speaker, skip = _trail_item(lines[i - 1])
+            trail.push(speaker, skip=skip)
         m = TAG.match(ln)
         if not m: 
             continue
@@ -103,15 +130,28 @@ def apply(text: str, ctx):
             continue
 
         # шаблон «#gX …   #g? …   #gX …» (допускаємо 1–2 порожні / #g1 між)
-        left_gid, _ = _prev_known(lines, i, max_skip=2)
-        right_gid,_ = _next_known(lines, i, max_skip=2)
+        if trail is not None:
+            j, left_gid = trail.last_speaker()
+            if j is None or trail.skipped_since(j) > 2:
+                left_gid = None
+            j, right_gid = ahead.next_speaker(i)
+            if j is None or ahead.skipped_between(i, j) > 2:
+                right_gid = None
+        else:
+            left_gid, _ = _prev_known(lines, i, max_skip=2)
+            right_gid,_ = _next_known(lines, i, max_skip=2)
         if not left_gid or not right_gid:
             continue
         if left_gid != right_gid:
             continue  # не «сендвіч» одного і того ж
 
         # кого підставляти? шукаємо «іншого» з недавнього контексту
-        other = _recent_other(lines, i, left_gid, back=20)
+        if trail is not None:
+            j, other = trail.last_other(left_gid)
+            if j is None or j < i - 20:
+                other = None
+        else:
+            other = _recent_other(lines, i, left_gid, back=20)
         if not other:
             continue
 
@@ -19,6 +19,9 @@
 import re
 from collections import defaultdict
 
+# дієслова мовлення й займенники роду — спільні з line_features (ознаки рядків)
+from line_features import PRON_F, PRON_M, VERB_ANY, verb_gender as _verb_gender
+
 PHASE, PRIORITY, SCOPE, NAME = 79, 0, "fulltext", "validate_consensus"  #GPT
 
 # ---------------- Basics ----------------
@@ -63,19 +66,11 @@ def _inline_patterns(name_rx):
     return p_main, p_comma
 
 # ---------------- Lead-in «Ім'я … каже/сказала:» ----------------
-VERBS_M = "сказав|відповів|спитав|запитав|крикнув|вигукнув|прошепотів|буркнув|мовив|промовив|пояснив|гукнув|відказав"
-VERBS_F = "сказала|відповіла|спитала|запитала|крикнула|вигукнула|прошепотіла|буркнула|промовила|пояснила|гукнула|відказала"
-VERBS_N = "каже|говорить|питає|запитує|кричить|вигукує|шепоче|бурчить|мовить|промовляє|пояснює|гукає|відказує|додає|зазначає|просить|велить|нагадує"
-VERB_ANY = re.compile(rf"\b(?:{VERBS_M}|{VERBS_F}|{VERBS_N})\b", re.IGNORECASE)
-def _verb_gender(tok):
-    t = (tok or "").lower()
-    if re.fullmatch(VERBS_F, t): return "F"
-    if re.fullmatch(VERBS_M, t): return "M"
-    return None
 
-def _leadin_match(text, name_rx):
+def _leadin_match(text, name_rx, matcher=None):
     """Повертає (name, verb) або (None,None) з попереднього наративу."""
     if not text: return None, None
+    if matcher is not None and not matcher.any_in(_nrm(text)): return None, None
     m_name = name_rx.search(_nrm(text))
     m_verb = VERB_ANY.search(_nrm(text))
     if m_name and m_verb:
@@ -83,10 +78,11 @@ def _leadin_match(text, name_rx):
     return None, None
 
 # ---------------- Pronoun coref ----------------
-P_M = r"(?:він|йому|ним|ньому|нього|цей|цього|цьому|цим|той|того|тому|тим)"
-P_F = r"(?:вона|її|їй|неї|нею|ця|цієї|цій|цією|цю|та)"
-PRON_M = re.compile(rf"\b{P_M}\b", re.IGNORECASE)
-PRON_F = re.compile(rf"\b{P_F}\b", re.IGNORECASE)
+def _body_verb_gender(body, features=None):
+    if features is not None:
+        return features.of(body).verb_gender
+    m = VERB_ANY.search(_nrm(body))
+    return _verb_gender(m.group(0)) if m else None
 
 def _want_gender_from_pron(text):
     low = (text or "").lower()
@@ -150,8 +146,13 @@ def apply(text, ctx):
     rg = _roles_gender(ctx)
     block_by = _block_by_line(ctx)
 
-    name_rx = _name_rx(_cand_names(amap, rg))
+    cands = _cand_names(amap, rg)
+    name_rx = _name_rx(cands)
     p_inline, p_inline2 = _inline_patterns(name_rx)
+    # спільний автомат імен: рядки без жодного кандидата регулярками імен не скануємо
+    names = getattr(ctx, "names", None)
+    matcher = names.matcher_for(sorted(cands)) if (names is not None and cands) else None
+    features = getattr(ctx, "features", None)  # спільні ознаки рядків: дієслово мовлення, рід займенника
 
     lines = text.splitlines(keepends=True)
     switched = demoted = kept = conflicts = 0
@@ -173,7 +174,7 @@ def apply(text, ctx):
         # 0) Жорстка сцена-заборона
         if _is_forbidden(assigned, i, meta):
             # спробуємо знайти best по консенсусу; якщо нема — демотувати
-            best_gid, best_w, votes = _consensus_for_line(i, lines, body, name_rx, p_inline, p_inline2, amap, rg, block_by)
+            best_gid, best_w, votes = _consensus_for_line(i, lines, body, name_rx, p_inline, p_inline2, amap, rg, block_by, matcher, features)
             if best_gid and not _is_forbidden(best_gid, i, meta):
                 lines[i] = f"{indent}{best_gid}: {body}"
                 switched += 1
@@ -185,27 +186,25 @@ def apply(text, ctx):
             continue
 
         # 1) М'яка валідація консенсусом
-        best_gid, best_w, votes = _consensus_for_line(i, lines, body, name_rx, p_inline, p_inline2, amap, rg, block_by)
+        best_gid, best_w, votes = _consensus_for_line(i, lines, body, name_rx, p_inline, p_inline2, amap, rg, block_by, matcher, features)
 
         # 2) Перевірка роду дієслова (якщо є) проти assigned і best
-        verb_match = VERB_ANY.search(_nrm(body))
-        if verb_match:
-            vgen = _verb_gender(verb_match.group(0))
-            if vgen:
-                as_gen = (rg.get(assigned) or {}).get("gender")
-                if as_gen and as_gen != vgen:
-                    # assigned суперечить дієслову; якщо best погоджується — перемкнемо
-                    best_gen = (rg.get(best_gid) or {}).get("gender") if best_gid else None
-                    if best_gid and best_gen == vgen and not _is_forbidden(best_gid, i, meta):
-                        lines[i] = f"{indent}{best_gid}: {body}"
-                        switched += 1
-                        audit.append((i, assigned, best_gid, "verb_gender_conflict->best"))
-                        continue
-                    else:
-                        lines[i] = f"{indent}#g?: {body}"
-                        demoted += 1
-                        audit.append((i, assigned, "#g?", "verb_gender_conflict->demote"))
-                        continue
+        vgen = _body_verb_gender(body, features)
+        if vgen:
+            as_gen = (rg.get(assigned) or {}).get("gender")
+            if as_gen and as_gen != vgen:
+                # assigned суперечить дієслову; якщо best погоджується — перемкнемо
+                best_gen = (rg.get(best_gid) or {}).get("gender") if best_gid else None
+                if best_gid and best_gen == vgen and not _is_forbidden(best_gid, i, meta):
+                    lines[i] = f"{indent}{best_gid}: {body}"
+                    switched += 1
+                    audit.append((i, assigned, best_gid, "verb_gender_conflict->best"))
+                    continue
+                else:
+                    lines[i] = f"{indent}#g?: {body}"
+                    demoted += 1
+                    audit.append((i, assigned, "#g?", "verb_gender_conflict->demote"))
+                    continue
 
         # 3) Якщо є альтернативний консенсус і його вага явно вища — перемкнути
         cur_w = votes.get(assigned, 0)
@@ -217,9 +216,10 @@ def apply(text, ctx):
             kept += 1
 
     # Зберегти аудит у метадані
-    meta.setdefault("validation_audit", [])
-    for rec in audit:
-        meta["validation_audit"].append({"line": rec[0], "from": rec[1], "to": rec[2], "reason": rec[3]})
+    # новий список, а не append: у режимах регіонів метадані книги спільні й лише для читання
+    meta["validation_audit"] = list(meta.get("validation_audit", [])) + [
+        {"line": rec[0], "from": rec[1], "to": rec[2], "reason": rec[3]} for rec in audit
+    ]
     setattr(ctx, "metadata", meta)
 
     try:
@@ -230,13 +230,15 @@ def apply(text, ctx):
     return "".join(lines)
 
 # ---------------- Helpers: consensus per line ----------------
-def _consensus_for_line(i, lines, body, name_rx, p_inline, p_inline2, amap, rg, block_by):
+def _consensus_for_line(i, lines, body, name_rx, p_inline, p_inline2, amap, rg, block_by, matcher=None, features=None):
     votes = defaultdict(int)
 
     bnorm = _nrm(body)
 
     # A) Inline «… . — Ім'я, …»
-    mm = p_inline.search(bnorm) or p_inline2.search(bnorm)
+    mm = None
+    if matcher is None or matcher.any_in(bnorm):
+        mm = p_inline.search(bnorm) or p_inline2.search(bnorm)
     if mm:
         name = _nrm(mm.group("name"))
         gid = _map_name_to_gid(name, amap, rg)
@@ -248,7 +250,7 @@ def _consensus_for_line(i, lines, body, name_rx, p_inline, p_inline2, amap, rg,
         mprev = TAG.match(lines[j])
         if mprev:  # натрапили на #g-рядок — зупиняємось (це вже не префейс)
             break
-        name, verb = _leadin_match(lines[j], name_rx)
+        name, verb = _leadin_match(lines[j], name_rx, matcher)
         if name and verb:
             gid = _map_name_to_gid(name, amap, rg)
             vgen = _verb_gender(verb)
@@ -262,7 +264,7 @@ def _consensus_for_line(i, lines, body, name_rx, p_inline, p_inline2, amap, rg,
                 break
 
     # C) Займенники «він/вона» в самому рядку
-    want = _want_gender_from_pron(body)
+    want = features.of(body).pron_gender if features is not None else _want_gender_from_pron(body)
     if want:
         gid_prev = _nearest_prev_same_gender(lines, i, want, rg, block_by)
         if gid_prev:
@@ -8,6 +8,9 @@ import re
 
 PHASE, PRIORITY, SCOPE, NAME = 81, 0, "fulltext", "merge_split_dialogs"
 
+TAGGED = re.compile(r'^(\s*)(#g\d+)\s*:\s*(.*)$')
+NARRATOR = re.compile(r'^(\s*)#g1\s*:\s*(.*)$')
+
 def apply(text, ctx):
     lines = text.splitlines(keepends=True)
     out = []
@@ -18,9 +21,9 @@ def apply(text, ctx):
         
         # Шукаємо патерн: діалог → атрибуція → діалог (той самий тег)
         if i + 2 < len(lines):
-            m1 = re.match(r'^(\s*)(#g\d+)\s*:\s*(.*)$', lines[i])
-            m2 = re.match(r'^(\s*)#g1\s*:\s*(.*)$', lines[i+1])
-            m3 = re.match(r'^(\s*)(#g\d+)\s*:\s*(.*)$', lines[i+2])
+            m1 = TAGGED.match(lines[i])
+            m2 = NARRATOR.match(lines[i+1])
+            m3 = TAGGED.match(lines[i+2])
             
             if (m1 and m2 and m3 and 
                 m1.group(2) == m3.group(2) and  # однакові теги
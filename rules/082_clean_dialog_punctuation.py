@@ -11,6 +11,13 @@ import re
 
 PHASE, PRIORITY, SCOPE, NAME = 82, 0, "fulltext", "clean_dialog_punctuation"
 
+TAGGED = re.compile(r'^(\s*)(#g\d+|\?)\s*:\s*(.*)$')
+SPACE_BEFORE_CLOSE = re.compile(r'\s+([»”"])')
+SPACE_AFTER_OPEN = re.compile(r'([«"“])\s+')
+LEAD_JUNK = re.compile(r'^[,\—\–\-\s]+')
+TAIL_JUNK = re.compile(r'[,\—\–\-\s]+$')
+WS_RUN = re.compile(r'\s+')
+
 def apply(text: str, ctx):
     lines = text.splitlines(keepends=True)
     out = []
@@ -19,7 +26,7 @@ def apply(text: str, ctx):
         eol = "\n" if ln.endswith("\n") else ("\r\n" if ln.endswith("\r\n") else "")
         
         # Перевіряємо, чи це рядок з тегом
-        m = re.match(r'^(\s*)(#g\d+|\?)\s*:\s*(.*)$', ln)
+        m = TAGGED.match(ln)
         if not m:
             out.append(ln)
             continue
@@ -32,16 +39,16 @@ def apply(text: str, ctx):
             continue
         
         # Прибираємо пробіли перед закриваючими лапками
-        body = re.sub(r'\s+([»”"])', r'\1', body)
+        body = SPACE_BEFORE_CLOSE.sub(r'\1', body)
         
         # Прибираємо пробіли після відкриваючих лапок
-        body = re.sub(r'([«"“])\s+', r'\1', body)
+        body = SPACE_AFTER_OPEN.sub(r'\1', body)
         
         # Для #g1 (оповідач)
         if tag == "#g1":
             # Прибираємо зайві символи на початку та в кінці
-            body = re.sub(r'^[,\—\–\-\s]+', '', body)
-            body = re.sub(r'[,\—\–\-\s]+$', '', body)
+            body = LEAD_JUNK.sub('', body)
+            body = TAIL_JUNK.sub('', body)
             body = body.strip()
             
             if not body:
@@ -56,7 +63,7 @@ def apply(text: str, ctx):
         # Для діалогів
         else:
             # Прибираємо зайві пробіли всередині
-            body = re.sub(r'\s+', ' ', body)
+            body = WS_RUN.sub(' ', body)
             
             # Додаємо крапку, якщо немає
             if body and body[-1] not in '.!?…':
@@ -16,6 +16,11 @@ import re
 
 PHASE, PRIORITY, SCOPE, NAME = 84, 0, "fulltext", "merge_dialog_lines"
 
+TAGGED = re.compile(r'^(\s*)(#g\d+|\?)\s*:\s*(.*)$')
+NARRATOR = re.compile(r'^(\s*)#g1\s*:\s*(.*)$')
+LEAD_JUNK = re.compile(r'^[,\—\–\-\s]+')
+TAIL_JUNK = re.compile(r'[,\—\–\-\s.]+$')
+
 def apply(text: str, ctx):
     lines = text.splitlines(keepends=True)
     out = []
@@ -26,9 +31,9 @@ def apply(text: str, ctx):
         
         # Шукаємо патерн: #gN + діалог → #g1 + атрибуція → #gN + діалог
         if i + 2 < len(lines):
-            m1 = re.match(r'^(\s*)(#g\d+|\?)\s*:\s*(.*)$', lines[i])
-            m2 = re.match(r'^(\s*)#g1\s*:\s*(.*)$', lines[i+1])
-            m3 = re.match(r'^(\s*)(#g\d+|\?)\s*:\s*(.*)$', lines[i+2])
+            m1 = TAGGED.match(lines[i])
+            m2 = NARRATOR.match(lines[i+1])
+            m3 = TAGGED.match(lines[i+2])
             
             if m1 and m2 and m3:
                 dialog1 = m1.group(3).strip()
@@ -52,8 +57,8 @@ def apply(text: str, ctx):
                     out.append(f"{m1.group(1)}{m1.group(2)}: {merged_dialog}\n")
                     
                     # Додаємо атрибуцію (очищену)
-                    attr_clean = re.sub(r'[,\—\–\-\s.]+$', '', attr)
-                    attr_clean = re.sub(r'^[,\—\–\-\s]+', '', attr_clean)
+                    attr_clean = TAIL_JUNK.sub('', attr)
+                    attr_clean = LEAD_JUNK.sub('', attr_clean)
                     if attr_clean:
                         out.append(f"{m2.group(1)}#g1: {attr_clean}\n")
                     
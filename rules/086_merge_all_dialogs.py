@@ -9,6 +9,11 @@ import re
 
 PHASE, PRIORITY, SCOPE, NAME = 86, 0, "fulltext", "merge_all_dialogs"
 
+TAGGED = re.compile(r'^(\s*)(#g\d+|\?)\s*:\s*(.*)$')
+TAGGED_OR_G1 = re.compile(r'^(\s*)(#g\d+|\?|g1)\s*:\s*(.*)$')
+LEAD_JUNK = re.compile(r'^[,\—\–\-\s]+')
+TAIL_JUNK = re.compile(r'[,\—\–\-\s.]+$')
+
 def apply(text: str, ctx):
     lines = text.splitlines(keepends=True)
     out = []
@@ -17,7 +22,7 @@ def apply(text: str, ctx):
     while i < len(lines):
         # Пошук патерну: #gN + діалог → (#g1 + атрибуція)? → #gN + діалог
         current_line = lines[i]
-        m_current = re.match(r'^(\s*)(#g\d+|\?)\s*:\s*(.*)$', current_line)
+        m_current = TAGGED.match(current_line)
         
         if not m_current:
             out.append(current_line)
@@ -39,7 +44,7 @@ def apply(text: str, ctx):
         
         while j < len(lines):
             next_line = lines[j]
-            m_next = re.match(r'^(\s*)(#g\d+|\?|g1)\s*:\s*(.*)$', next_line)
+            m_next = TAGGED_OR_G1.match(next_line)
             
             if not m_next:
                 break
@@ -56,7 +61,7 @@ def apply(text: str, ctx):
             # Якщо наступний рядок - #g1 з атрибуцією
             if next_tag == "#g1" and j + 1 < len(lines):
                 # Перевіряємо рядок після #g1
-                m_after = re.match(r'^(\s*)(#g\d+|\?)\s*:\s*(.*)$', lines[j+1])
+                m_after = TAGGED.match(lines[j+1])
                 if m_after and m_after.group(2) == current_tag and \
                    any(q in m_after.group(3) for q in ['«', '"', '“']):
                     # Пропускаємо #g1 і додаємо наступний діалог
@@ -87,8 +92,8 @@ def apply(text: str, ctx):
                     # Якщо є атрибуція, додаємо її окремо
                     if attribution:
                         # Очищаємо атрибуцію
-                        attribution_clean = re.sub(r'^[,\—\–\-\s]+', '', attribution)
-                        attribution_clean = re.sub(r'[,\—\–\-\s.]+$', '', attribution_clean)
+                        attribution_clean = LEAD_JUNK.sub('', attribution)
+                        attribution_clean = TAIL_JUNK.sub('', attribution_clean)
                         if attribution_clean:
                             out.append(f"{next_indent}#g1: {attribution_clean}\n")
                     
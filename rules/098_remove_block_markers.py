@@ -3,25 +3,18 @@
 
 import re
 
-PHASE, PRIORITY, SCOPE, NAME = 98, 0, "fulltext", "remove_block_markers"  # найпізніше
+PHASE, PRIORITY, SCOPE, NAME = 98, 0, "lines", "remove_block_markers"  # найпізніше
 
 MARK = "[[DIALOG_BOUNDARY]]"
 RX = re.compile(rf"^\s*#g1\s*:\s*{re.escape(MARK)}\s*$")
 
-def apply(text: str, ctx):
-    out = []
-    removed = 0
-    for ln in text.splitlines(keepends=True):
-        core = ln.rstrip("\n")
-        if RX.match(core):
-            removed += 1
-            continue
-        out.append(ln)
+def apply(doc, ctx):
+    removed = doc.remove_where(lambda ln: bool(RX.match(ln.core)))
 
     try:
         ctx.logs.append(f"[098 rm_block_markers] removed:{removed}")
     except Exception:
         pass
-    return "".join(out)
+    return doc
 
 apply.phase, apply.priority, apply.scope, apply.name = PHASE, PRIORITY, SCOPE, NAME
@@ -11,17 +11,15 @@
         - Інлайн у тексті (будь-де в рядку):
             ⟦#gN⟧   |   {gold:#gN}   |   // GOLD: #gN   |   # GOLD #gN
 Лог: один рядок з агрегатами. Деталізований звіт кладеться у ctx.metadata["metrics"].
+merge(parts) зводить звіти кількох регіонів книги в один (режими регіонів improved_logic).
 """
 
 import re
 from collections import defaultdict, Counter
 
-PHASE, PRIORITY, SCOPE, NAME = 99, 0, "fulltext", "metrics_report"  # запускати найпізніше
-
-NBSP = "\u00A0"
-TAG = re.compile(r"^(\s*)#g(\d+|\?)\s*:\s*(.*)$", re.DOTALL)
-DASHES = r"\-\u2012\u2013\u2014\u2015"
-IS_DIALOG_BODY = re.compile(rf"^\s*(?:[{DASHES}]|[«\"„“”'’])")
+PHASE, PRIORITY, SCOPE, NAME = 99, 0, "lines", "metrics_report"  # запускати найпізніше
+READS = ("text", "meta.scene_spans", "meta.scene", "meta.gold_labels_by_line")
+WRITES = ("meta.metrics",)
 
 # Інлайн-«gold» маркери
 GOLD_PATTERNS = [
@@ -39,14 +37,10 @@ def _scene_of_line(i, meta):
             return sp["label"]
     return meta.get("scene")
 
-def _is_dialog_line(line: str) -> bool:
-    m = TAG.match(line)
-    if not m: return False
-    gid, body = m.group(2), m.group(3)
-    if gid == "1": return False
-    return bool(IS_DIALOG_BODY.match((body or "").replace(NBSP, " ").lstrip()))
+def _is_dialog_line(ln) -> bool:
+    return ln.gid is not None and ln.gid != "1" and ln.is_dialog
 
-def _collect_gold(text: str, meta):
+def _collect_gold(doc, meta):
     # 1) з метаданих
     gold = {}
     md_gold = meta.get("gold_labels_by_line") or {}
@@ -58,9 +52,9 @@ def _collect_gold(text: str, meta):
         except Exception:
             continue
     # 2) з інлайн-маркерів у тексті
-    for i, raw in enumerate(text.splitlines(keepends=False)):
+    for i, ln in enumerate(doc):
         for rx in GOLD_PATTERNS:
-            m = rx.search(raw)
+            m = rx.search(ln.core)
             if m:
                 gold[i] = m.group(1)
                 break
@@ -95,62 +89,83 @@ def _macro_prf(per_gid):
         "f1":        sum(v["f1"]        for v in vals)/n,
     }
 
-def apply(text: str, ctx):
+def _build_report(n_dialog, n_assigned, n_unknown, by_scene_total, by_scene_assigned, by_scene_unknown,
+                  n_gold, correct, conf, tp, fp, fn):
+    """Звіт meta["metrics"] з лічильників (спільне для apply і merge)."""
+    cov_total = (n_assigned / n_dialog) if n_dialog else None
+    unk_rate  = (n_unknown  / n_dialog) if n_dialog else None
+
+    coverage_by_scene = {}
+    for s in sorted(by_scene_total.keys()):
+        tot = by_scene_total[s]
+        asc = by_scene_assigned[s]
+        unk = by_scene_unknown[s]
+        coverage_by_scene[s] = {
+            "dialog_total": tot,
+            "assigned": asc,
+            "unknown": unk,
+            "coverage": (asc/tot) if tot else None,
+            "unknown_rate": (unk/tot) if tot else None,
+        }
+
+    acc = (correct / n_gold) if n_gold else None
+    per_gid = _per_gid_prf(tp, fp, fn)
+    micro = _micro_prf(tp, fp, fn) if n_gold else {"precision": None, "recall": None, "f1": None}
+    macro = _macro_prf(per_gid) if n_gold else {"precision": None, "recall": None, "f1": None}
+
+    return {
+        "coverage": {
+            "dialog_total": n_dialog,
+            "assigned": n_assigned,
+            "unknown": n_unknown,
+            "coverage": cov_total,
+            "unknown_rate": unk_rate,
+            "by_scene": coverage_by_scene,
+        },
+        "accuracy": {
+            "gold_lines": n_gold,
+            "correct": correct,
+            "accuracy": acc,
+            "micro": micro,
+            "macro": macro,
+            "per_gid": per_gid,
+            "confusion": {f"{k[0]}->{k[1]}": v for k, v in conf.items()},
+        },
+    }
+
+def apply(doc, ctx):
     meta = _meta(ctx)
-    lines = text.splitlines(keepends=True)
 
     # --- Покриття загалом та по сценах ---
-    dialog_idx = []
-    assigned_idx = []
-    unknown_idx = []
+    n_dialog = n_assigned = n_unknown = 0
 
     by_scene_total = Counter()
     by_scene_assigned = Counter()
     by_scene_unknown = Counter()
 
-    for i, ln in enumerate(lines):
+    for i, ln in enumerate(doc):
         if not _is_dialog_line(ln): 
             continue
-        dialog_idx.append(i)
-        m = TAG.match(ln)
-        gid = m.group(2)
+        n_dialog += 1
+        gid = ln.gid
         scene = _scene_of_line(i, meta) or "(без сцени)"
         by_scene_total[scene] += 1
         if gid == "?":
-            unknown_idx.append(i)
+            n_unknown += 1
             by_scene_unknown[scene] += 1
         else:
-            assigned_idx.append(i)
+            n_assigned += 1
             by_scene_assigned[scene] += 1
 
-    cov_total = (len(assigned_idx) / len(dialog_idx)) if dialog_idx else None
-    unk_rate  = (len(unknown_idx)  / len(dialog_idx)) if dialog_idx else None
-
-    coverage_by_scene = {}
-    for s in sorted(by_scene_total.keys()):
-        tot = by_scene_total[s]
-        asc = by_scene_assigned[s]
-        unk = by_scene_unknown[s]
-        coverage_by_scene[s] = {
-            "dialog_total": tot,
-            "assigned": asc,
-            "unknown": unk,
-            "coverage": (asc/tot) if tot else None,
-            "unknown_rate": (unk/tot) if tot else None,
-        }
-
     # --- Точність (якщо є gold) ---
-    gold = _collect_gold(text, meta)
-    gold_dialog_lines = [i for i in gold.keys() if i < len(lines) and _is_dialog_line(lines[i])]
+    gold = _collect_gold(doc, meta)
+    gold_dialog_lines = [i for i in gold.keys() if 0 <= i < len(doc) and _is_dialog_line(doc[i])]
     correct = 0
     conf = defaultdict(int)  # (pred,gold) → count
     tp = Counter(); fp = Counter(); fn = Counter()
 
     for i in gold_dialog_lines:
-        m = TAG.match(lines[i]); 
-        if not m: 
-            continue
-        pred_gid = f"#g{m.group(2)}"
+        pred_gid = doc[i].tag
         gold_gid = gold[i]
         conf[(pred_gid, gold_gid)] += 1
         if pred_gid == gold_gid:
@@ -163,36 +178,17 @@ def apply(text: str, ctx):
             if gold_gid not in {"#g1"}:
                 fn[gold_gid] += 1
 
-    acc = (correct / len(gold_dialog_lines)) if gold_dialog_lines else None
-    per_gid = _per_gid_prf(tp, fp, fn)
-    micro = _micro_prf(tp, fp, fn) if gold_dialog_lines else {"precision": None, "recall": None, "f1": None}
-    macro = _macro_prf(per_gid) if gold_dialog_lines else {"precision": None, "recall": None, "f1": None}
-
     # --- Пакуємо у метадані ---
-    report = {
-        "coverage": {
-            "dialog_total": len(dialog_idx),
-            "assigned": len(assigned_idx),
-            "unknown": len(unknown_idx),
-            "coverage": cov_total,
-            "unknown_rate": unk_rate,
-            "by_scene": coverage_by_scene,
-        },
-        "accuracy": {
-            "gold_lines": len(gold_dialog_lines),
-            "correct": correct,
-            "accuracy": acc,
-            "micro": micro,
-            "macro": macro,
-            "per_gid": per_gid,
-            "confusion": {f"{k[0]}->{k[1]}": v for k, v in conf.items()},
-        },
-    }
+    report = _build_report(n_dialog, n_assigned, n_unknown, by_scene_total, by_scene_assigned, by_scene_unknown,
+                           len(gold_dialog_lines), correct, conf, tp, fp, fn)
     meta["metrics"] = report
     setattr(ctx, "metadata", meta)
 
     # --- Лог (коротко) ---
     try:
+        cov_total = report["coverage"]["coverage"]
+        unk_rate = report["coverage"]["unknown_rate"]
+        acc = report["accuracy"]["accuracy"]
         cov_pct = f"{(cov_total*100):.1f}%" if cov_total is not None else "n/a"
         unk_pct = f"{(unk_rate*100):.1f}%" if unk_rate is not None else "n/a"
         acc_pct = f"{(acc*100):.1f}%" if acc is not None else "n/a"
@@ -202,6 +198,31 @@ def apply(text: str, ctx):
     except Exception:
         pass
 
-    return text
+    return doc
+
+def merge(parts):
+    """[{"metrics": звіт регіону}, ...] → {"metrics": звіт книги} — як apply по всьому тексту."""
+    n_dialog = n_assigned = n_unknown = n_gold = correct = 0
+    by_scene_total = Counter(); by_scene_assigned = Counter(); by_scene_unknown = Counter()
+    conf = Counter(); tp = Counter(); fp = Counter(); fn = Counter()
+    for part in parts:
+        rep = part.get("metrics")
+        if not rep:
+            continue
+        cov, acc = rep["coverage"], rep["accuracy"]
+        n_dialog += cov["dialog_total"]; n_assigned += cov["assigned"]; n_unknown += cov["unknown"]
+        for s, row in cov["by_scene"].items():
+            by_scene_total[s] += row["dialog_total"]
+            by_scene_assigned[s] += row["assigned"]
+            by_scene_unknown[s] += row["unknown"]
+        n_gold += acc["gold_lines"]; correct += acc["correct"]
+        for k, v in acc["confusion"].items():
+            pred, gold = k.split("->", 1)
+            conf[(pred, gold)] += v
+        for g, row in acc["per_gid"].items():
+            tp[g] += row["tp"]; fp[g] += row["fp"]; fn[g] += row["fn"]
+    return {"metrics": _build_report(n_dialog, n_assigned, n_unknown, by_scene_total, by_scene_assigned,
+                                     by_scene_unknown, n_gold, correct, conf, +tp, +fp, +fn)}
 
 apply.phase, apply.priority, apply.scope, apply.name = PHASE, PRIORITY, SCOPE, NAME  #GPT
+apply.reads, apply.writes = READS, WRITES
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""Спільні фікстури тестів: improved_logic без консолі й кешів, маленька книга з легендою."""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA = os.path.join(ROOT, "tests", "data")
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import improved_logic  # noqa: E402
+
+
+def read_data(name: str) -> str:
+    with open(os.path.join(DATA, name), encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.fixture
+def il(monkeypatch, tmp_path):
+    """improved_logic без друку в консоль; кеш результатів вимкнено, пам'ять блоків — у tmp_path."""
+    monkeypatch.setattr(improved_logic, "DEBUG_RULES_PRINT", False)
+    monkeypatch.setattr(improved_logic, "ECHO_LOGS_TO_CONSOLE", False)
+    monkeypatch.setattr(improved_logic, "RESULT_CACHE", False)
+    monkeypatch.setattr(improved_logic, "BLOCK_MEMO", False)
+    monkeypatch.setattr(improved_logic, "BLOCK_MEMO_PATH", str(tmp_path / "blocks.sqlite"))
+    return improved_logic
+
+
+@pytest.fixture(scope="session")
+def book() -> str:
+    """Три розділи по ~60 рядків: кілька регіонів, звертання через межі абзаців (074/076)."""
+    return read_data("book.txt")
+
+
+@pytest.fixture(scope="session")
+def legend() -> str:
+    return read_data("legend.txt")
+
+
+@pytest.fixture
+def whole(il, book, legend) -> str:
+    """Еталон — звичайний прогін по всьому тексту в одному процесі."""
+    return il.process_dialogs_in_memory(book, legend, use_cache=False)[0]
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""Ледача таблиця ознак рядків (line_features.FeatureTable)."""
+import pickle
+
+from line_features import FEATURE_COLUMNS, FeatureIndex
+from name_matcher import NameIndex
+
+LINES = [
+    "#g1: Софія подивилася на брата.\n",
+    "#g?: — Марко, ти чуєш мене?\n",
+    "#g3: — Я не знаю, — відповів він.\n",
+    "\n",
+    "— Добре, — сказала вона.\n",
+]
+
+
+def _index() -> FeatureIndex:
+    return FeatureIndex(NameIndex({"Марко": "#g3", "Софія": "#g2"}))
+
+
+def test_columns_are_computed_on_demand():
+    index = _index()
+    table = index.table(LINES, {0: 0, 1: 0, 2: 0, 4: 1})
+    assert len(index) == 0  # створення таблиці ознак не рахує
+    assert table["gid"] == ["1", "?", "3", None, None]
+    assert table["scene"] == [0, 0, 0, None, 1]
+    assert len(index) == 0
+    assert table["verb_gender"] == [None, None, "M", None, "F"]
+    assert table["vocatives"][1] == ("#g3",)
+    assert table.row(2)["first_person"] is True
+    assert list(table) == list(FEATURE_COLUMNS)
+
+
+def test_pickle_keeps_lines_and_legend_not_caches():
+    index = _index()
+    table = index.table(LINES)
+    eager = {name: list(table[name]) for name in FEATURE_COLUMNS}
+    copy = pickle.loads(pickle.dumps(table))
+    assert copy == table
+    assert len(copy.index) == 0 and copy.index.names._matcher is None
+    assert {name: copy[name] for name in FEATURE_COLUMNS} == eager
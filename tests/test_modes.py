@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""Режими регіонів (інкрементальний, паралельний, потоковий, пам'ять блоків) дають той самий вихід, що й прогін по всьому тексту."""
+import re
+
+
+def _edit(book: str) -> str:
+    """Виправлене видання: змінено один рядок першого розділу."""
+    edited = book.replace("— Я не знаю, — відповів Софія.", "— Я справді не знаю, — відповів Софія.", 1)
+    assert edited != book
+    return edited
+
+
+def test_book_has_several_regions(il, book):
+    rules, _ = il.load_rules(il.RULES_DIR)
+    assert len(il._split_regions(book, rules)) > 1
+
+
+def test_non_local_rules_see_whole_book(il, book, legend):
+    """Якби 074/076 йшли по регіонах, вихід відрізнявся б — фікстура справді це перевіряє."""
+    legend_map, nar_tag = il.parse_legend_text(legend)
+    rules, _ = il.load_rules(il.RULES_DIR)
+    assert any(not r["local"] for r in rules)
+
+    def run(rules):
+        ctx = il.ProcessingContext(legend=legend_map, narrator_tag=nar_tag or "#g1")
+        return il._apply_rules_regions(book, rules, ctx, [])
+
+    reference = il.apply_rules_to_text(book, rules, il.ProcessingContext(legend=legend_map, narrator_tag=nar_tag or "#g1"))
+    assert run(rules) == reference
+    assert run([dict(r, local=True) for r in rules]) != reference
+
+
+def test_incremental_matches_whole_text(il, book, legend, whole):
+    result, _, state = il.process_dialogs_incremental(book, legend, use_cache=False)
+    assert result == whole
+    assert state.regions
+
+
+def test_incremental_after_edit_matches_whole_text(il, book, legend):
+    _, _, state = il.process_dialogs_incremental(book, legend, use_cache=False)
+    edited = _edit(book)
+    result, logs, _ = il.process_dialogs_incremental(edited, legend, state=state, use_cache=False)
+    assert result == il.process_dialogs_in_memory(edited, legend, use_cache=False)[0]
+    assert "перераховано" in logs
+
+
+def test_split_like_follows_line_count_change(il):
+    parts = ["Розділ 1\n\nЯ сказав.\n«Так».\n\n", "Розділ 2\n\nВін мовчав.\n"]
+    shapes = [il._shape(p) for p in parts]
+    merged = "Розділ 1\n\nЯ сказав. «Так».\n\nРозділ 2\n\nВін мовчав.\n"
+    assert il._split_like(merged, shapes) == ["Розділ 1\n\nЯ сказав. «Так».\n\n", "Розділ 2\n\nВін мовчав.\n"]
+    assert il._split_like("Розділ 1\n\nінше\n", shapes) is None
+
+
+def test_parallel_matches_whole_text(il, monkeypatch, book, legend, whole):
+    monkeypatch.setattr(il, "PARALLEL_MIN_CHARS", 0)
+    result, logs = il.process_dialogs_in_memory(book, legend, workers=2, use_cache=False)
+    assert "Паралельний режим: регіонів" in logs
+    assert "Паралельний режим недоступний" not in logs
+    assert result == whole
+
+
+def test_parallel_metrics_match_whole_text(il, monkeypatch, book, legend):
+    """099 зводить звіти регіонів (merge) у той самий звіт, що й по всьому тексту."""
+    il.process_dialogs_in_memory(book, legend, use_cache=False)
+    expected = il.last_run_metadata().get("metrics")
+    monkeypatch.setattr(il, "PARALLEL_MIN_CHARS", 0)
+    il.process_dialogs_in_memory(book, legend, workers=2, use_cache=False)
+    assert expected and il.last_run_metadata().get("metrics") == expected
+
+
+def test_streaming_matches_whole_text(il, monkeypatch, tmp_path, book, legend, whole):
+    monkeypatch.setattr(il, "STREAM_READ_CHARS", 512)  # книга читається багатьма шматками
+    src, out = tmp_path / "book.txt", tmp_path / "out.txt"
+    src.write_text(book, encoding="utf-8")
+    result, logs = il.process_dialogs(str(src), legend, output_path=str(out), streaming=True)
+    assert result == ""
+    assert "Потоковий режим: сцен" in logs
+    assert "межі регіонів не знайдено" not in logs
+    assert out.read_text(encoding="utf-8") == whole
+    assert not list(tmp_path.glob("*.part"))  # тимчасові файли регіонів прибрано
+
+
+def test_block_memo_matches_whole_text(il, monkeypatch, book, legend):
+    """Нове видання з новим state: незмінені регіони беруться з пам'яті блоків першого прогону."""
+    monkeypatch.setattr(il, "BLOCK_MEMO", True)
+    il.process_dialogs_incremental(book, legend)
+    edited = _edit(book)
+    result, logs, _ = il.process_dialogs_incremental(edited, legend)
+    assert result == il.process_dialogs_in_memory(edited, legend, use_cache=False)[0]
+    memo = int(re.search(r"з пам'яті блоків (\d+)", logs).group(1))
+    assert memo > 0
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""Злитий постпроцес (_iter_postprocess) дає те саме, що три окремі проходи."""
+import os
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Крайні випадки: повтори тегів, #g1 перед діалогом (через порожні рядки, \u2028, \x0b), кінець файлу
+EDGE_CASES = {
+    "same-tag-runs": "#g2: Текст.\n#g2: Ще.\n#G2: Ще раз.\n\n#g2: Після порожнього.\n"
+                     "#g?: Невідомо.\n#g?: Знову.\n#g3: — Діалог.\n#g3: — Діалог.\n#g3: Оповідь.\n"
+                     "Без тегу.\n#g3: Оповідь.\n",
+    "g1-dialogs": "#g1: — Репліка.\n#g1:   «Лапки»\n#g1:\n— Через рядок.\n#g1: \u2028— Після роздільника.\n"
+                  "#g1:\x0b\n«Після \\x0b»\n#g1: Оповідь.\nОповідь без тегу.\nЩе оповідь.\n— Діалог без тегу.\n",
+    "g1-dialog-at-eof": "Оповідь.\n#g1:\n\n",
+}
+SAMPLES = ("Dialog_test.txt", "Dialog_dialogues.txt")  # зразки поруч із кодом
+
+
+def _variants(text):
+    """Той самий текст з LF і CRLF, з кінцевим \\n і без нього."""
+    text = text.replace("\r\n", "\n")
+    yield "lf", text
+    yield "crlf", text.replace("\n", "\r\n")
+    yield "no-eol", text.rstrip("\n")
+    yield "crlf-no-eol", text.rstrip("\n").replace("\n", "\r\n")
+
+
+def _chain(il, text, narrator_tag):
+    return il._collapse_same_tags(il._demote_g1_dialogs(il._narrator_fallback(text, narrator_tag)))
+
+
+def _assert_fused_matches_chain(il, text, narrator_tag="#g1"):
+    for variant, body in _variants(text):
+        fused = il._postprocess(body, narrator_tag)
+        assert fused.splitlines(keepends=True) == _chain(il, body, narrator_tag).splitlines(keepends=True), variant
+
+
+@pytest.mark.parametrize("name", sorted(EDGE_CASES))
+@pytest.mark.parametrize("narrator_tag", ["#g1", "#g7"])
+def test_edge_cases(il, name, narrator_tag):
+    _assert_fused_matches_chain(il, EDGE_CASES[name], narrator_tag)
+
+
+@pytest.mark.parametrize("name", SAMPLES)
+def test_samples(il, name):
+    with open(os.path.join(ROOT, name), encoding="utf-8") as f:
+        _assert_fused_matches_chain(il, f.read())
+
+
+def test_rule_output(il, book, legend):
+    """Вхід постпроцесу в конвеєрі — текст після правил."""
+    legend_map, nar_tag = il.parse_legend_text(legend)
+    rules, _ = il.load_rules(il.RULES_DIR)
+    tagged = il.apply_rules_to_text(book, rules, il.ProcessingContext(legend=legend_map, narrator_tag=nar_tag or "#g1"))
+    assert tagged != book
+    _assert_fused_matches_chain(il, tagged, nar_tag or "#g1")
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""zeroshot_service: зупинка лише з токеном, який записав сервер при старті."""
+import os
+import stat
+import threading
+
+import pytest
+
+import zeroshot_service as zss
+
+
+@pytest.fixture
+def server(monkeypatch, tmp_path):
+    """Сервіс без моделі (ping/shutdown її не потребують) на вільному порту 127.0.0.1."""
+    monkeypatch.setattr(zss, "TOKEN_DIR", str(tmp_path / "tokens"))
+    srv = zss._TCPService(("127.0.0.1", 0), zss._Handler)
+    addr = "127.0.0.1:%d" % srv.server_address[1]
+    srv.model_name = "test"
+    srv.token = zss._write_token(addr)
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield addr, thread
+    srv.shutdown()
+    srv.server_close()
+
+
+def test_token_file_is_owner_only(server):
+    addr, _ = server
+    assert len(zss.read_token(addr)) == 64
+    if os.name == "posix":
+        assert stat.S_IMODE(os.stat(zss.token_path(addr)).st_mode) == 0o600
+
+
+def test_shutdown_requires_token(server):
+    addr, thread = server
+    for msg in ({"op": "shutdown"}, {"op": "shutdown", "token": "0" * 64}):
+        resp = zss.request(msg, addr, timeout=5.0)
+        assert not resp["ok"]
+    assert zss.service_available(addr, timeout=2.0)
+
+    assert zss.shutdown(addr)["ok"]
+    thread.join(timeout=5.0)
+    assert not thread.is_alive()
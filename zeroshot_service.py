@@ -0,0 +1,429 @@
+# -*- coding: utf-8 -*-
+"""
+zeroshot_service.py — довгоживучий сервіс призначення мовців (zeroshot_speaker_models)
+
+• Модель завантажується один раз при старті сервісу й лишається «теплою».
+• Завдання приходять через локальний сокет: TCP на 127.0.0.1 (Windows/Linux)
+  або Unix-сокет, якщо адреса — шлях до файлу і система підтримує AF_UNIX.
+• Протокол: кожне повідомлення — 4 байти довжини (big-endian) + JSON у UTF-8.
+    {"op": "ping"}                                   → {"ok": true, "model": …}
+    {"op": "process", "text": …, "legend": …, "options": {…}}
+                                                     → {"ok": true, "text": …, "log": …, "summary": {…}}
+    {"op": "shutdown", "token": …}                   → {"ok": true}
+  legend — текст легенди (JSON або «#gN - Ім'я (аліаси)»), options — параметри CLI
+  zeroshot_speaker_models (threshold, ctx_lines, only_unknown, …).
+• Зупинка — лише з токеном, який --serve при старті пише у файл, доступний тільки
+  власникові (TOKEN_DIR, права 0600); клієнт (--shutdown, shutdown()) читає його звідти.
+• Запити до трансформера від паралельних завдань збираються у спільні батчі
+  (BatchingEmbedder), тож кілька книжок одночасно ділять один forward pass.
+• GUI та CLI — тонкі клієнти: process_file() має ту саму сигнатуру, що й
+  zeroshot_speaker_models.process_file().
+
+Приклади:
+  python zeroshot_service.py --serve                       # запустити сервіс
+  python zeroshot_service.py --serve --backend onnx-int8   # трансформер в ONNX Runtime, int8 (CPU)
+  python zeroshot_service.py --in book.txt --out book.txt --legend legend.json
+  python zeroshot_service.py --ping
+  python zeroshot_service.py --shutdown
+"""
+import os
+import sys
+import hmac
+import json
+import time
+import queue
+import secrets
+import socket
+import struct
+import argparse
+import tempfile
+import threading
+import socketserver
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_ADDR = os.environ.get("ZSF_SERVICE_ADDR", "127.0.0.1:47651")
+BATCH_WINDOW = 0.02       # скільки чекати на запити інших завдань перед forward pass, с
+MAX_FRAME = 256 * 1024 * 1024
+TOKEN_DIR = os.environ.get("ZSF_SERVICE_TOKEN_DIR",
+                           os.path.join(os.path.expanduser("~"), ".zeroshot_service"))  # токени зупинки
+
+# ------------------------- Протокол -------------------------
+
+def send_msg(sock: socket.socket, obj: Dict) -> None:
+    data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    sock.sendall(struct.pack(">I", len(data)) + data)
+
+def _recv_exact(sock: socket.socket, n: int) -> Optional[bytes]:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            return None
+        buf += chunk
+    return bytes(buf)
+
+def recv_msg(sock: socket.socket) -> Optional[Dict]:
+    head = _recv_exact(sock, 4)
+    if head is None:
+        return None
+    (n,) = struct.unpack(">I", head)
+    if n > MAX_FRAME:
+        raise ValueError(f"Завеликий кадр: {n} байт")
+    data = _recv_exact(sock, n)
+    if data is None:
+        return None
+    return json.loads(data.decode("utf-8"))
+
+def _parse_addr(addr: Optional[str]):
+    """'host:port' → (AF_INET, (host, port)); шлях → (AF_UNIX, path)."""
+    addr = addr or DEFAULT_ADDR
+    host, sep, port = addr.rpartition(":")
+    if sep and port.isdigit() and os.sep not in addr:
+        return socket.AF_INET, (host or "127.0.0.1", int(port))
+    if not hasattr(socket, "AF_UNIX"):
+        raise OSError("Unix-сокети недоступні на цій системі — вкажіть host:port")
+    return socket.AF_UNIX, addr
+
+def token_path(addr: Optional[str] = None) -> str:
+    """Файл токена зупинки для адреси сервісу (один сервіс на адресу)."""
+    slug = "".join(c if c.isalnum() or c in "-." else "_" for c in (addr or DEFAULT_ADDR))
+    return os.path.join(TOKEN_DIR, slug + ".token")
+
+def _write_token(addr: Optional[str]) -> str:
+    """Новий токен → файл із правами 0600 у каталозі 0700 (на Windows — профіль користувача)."""
+    token = secrets.token_hex(32)
+    os.makedirs(TOKEN_DIR, mode=0o700, exist_ok=True)
+    path = token_path(addr)
+    if os.path.exists(path):
+        os.unlink(path)  # O_EXCL нижче: файл створюється заново, з нашими правами
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w", encoding="ascii") as f:
+        f.write(token)
+    return token
+
+def read_token(addr: Optional[str] = None) -> str:
+    with open(token_path(addr), "r", encoding="ascii") as f:
+        return f.read().strip()
+
+# ------------------------- Спільні батчі -------------------------
+
+class BatchingEmbedder:
+    """
+    Обгортка над ембеддером для кількох потоків: виклики encode() з паралельних
+    завдань ставляться в чергу, збираються впродовж BATCH_WINDOW і кодуються
+    одним викликом внутрішнього ембеддера (окремо для кожної пари max_length/max_tokens).
+    Внутрішній ембеддер (і його дисковий кеш) бачить лише один потік.
+    """
+
+    def __init__(self, inner, window: float = BATCH_WINDOW):
+        self.inner = inner
+        self.model_name = getattr(inner, "model_name", "model")
+        self.cache_name = getattr(inner, "cache_name", self.model_name)
+        self.window = window
+        self._q: "queue.Queue[Dict]" = queue.Queue()
+        self._lock = threading.Lock()
+        threading.Thread(target=self._loop, name="zsf-batcher", daemon=True).start()
+
+    def encode(self, texts: List[str], batch_size: int = 16, max_length: int = 256,
+               max_tokens: Optional[int] = None):
+        return self._submit(texts, batch_size, max_length, max_tokens, uncached=False)
+
+    def encode_uncached(self, texts: List[str], batch_size: int = 16, max_length: int = 256,
+                        max_tokens: Optional[int] = None):
+        """Той самий спільний батч, але повз дисковий кеш внутрішнього ембеддера (CachedEmbedder)."""
+        return self._submit(texts, batch_size, max_length, max_tokens, uncached=True)
+
+    def _encoder(self, uncached: bool):
+        return getattr(self.inner, "encode_uncached", self.inner.encode) if uncached else self.inner.encode
+
+    def _submit(self, texts: List[str], batch_size: int, max_length: int, max_tokens: Optional[int],
+                uncached: bool):
+        job = {"texts": list(texts), "batch_size": batch_size, "max_length": max_length,
+               "max_tokens": max_tokens, "uncached": uncached,
+               "done": threading.Event(), "out": None, "error": None}
+        if not job["texts"]:
+            with self._lock:
+                return self.inner.encode(job["texts"], batch_size=batch_size, max_length=max_length)
+        self._q.put(job)
+        job["done"].wait()
+        if job["error"] is not None:
+            raise job["error"]
+        return job["out"]
+
+    def flush(self) -> None:
+        if hasattr(self.inner, "flush"):
+            with self._lock:
+                self.inner.flush()
+
+    def _loop(self) -> None:
+        while True:
+            jobs = [self._q.get()]
+            deadline = time.monotonic() + self.window
+            while True:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                try:
+                    jobs.append(self._q.get(timeout=left))
+                except queue.Empty:
+                    break
+            groups: Dict[Tuple[int, Optional[int], bool], List[Dict]] = {}
+            for job in jobs:
+                groups.setdefault((job["max_length"], job["max_tokens"], job["uncached"]), []).append(job)
+            for (max_length, max_tokens, uncached), group in groups.items():
+                texts = [t for job in group for t in job["texts"]]
+                try:
+                    with self._lock:
+                        embs = self._encoder(uncached)(texts, batch_size=max(j["batch_size"] for j in group),
+                                                       max_length=max_length, max_tokens=max_tokens)
+                    pos = 0
+                    for job in group:
+                        n = len(job["texts"])
+                        job["out"] = embs[pos:pos + n]
+                        pos += n
+                except Exception as e:
+                    for job in group:
+                        job["error"] = e
+                if len(group) > 1:
+                    print(f"[ML_service] спільний батч: завдань={len(group)}, текстів={len(texts)}")
+                for job in group:
+                    job["done"].set()
+
+# ------------------------- Сервер -------------------------
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                msg = recv_msg(self.request)
+            except Exception as e:
+                send_msg(self.request, {"ok": False, "error": f"Некоректне повідомлення: {e}"})
+                return
+            if msg is None:
+                return
+            op = msg.get("op")
+            if op == "ping":
+                send_msg(self.request, {"ok": True, "model": self.server.model_name})
+            elif op == "process":
+                send_msg(self.request, self.server.process_job(msg))
+            elif op == "shutdown":
+                if not hmac.compare_digest(str(msg.get("token") or ""), self.server.token):
+                    send_msg(self.request, {"ok": False, "error": "Невірний токен зупинки"})
+                    return
+                send_msg(self.request, {"ok": True})
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                return
+            else:
+                send_msg(self.request, {"ok": False, "error": f"Невідома операція: {op!r}"})
+
+
+class _ServiceMixin:
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def setup_model(self, model_name: str, cache_dir: Optional[str], backend: str = "torch"):
+        import zeroshot_speaker_models as zsf
+        self.zsf = zsf
+        self.model_name = model_name
+        self.cache_dir = cache_dir
+        self.backend = backend
+        self.embedder = None
+        if zsf.USE_HF:
+            t0 = time.perf_counter()
+            emb = zsf.get_embedder(model_name, cache_dir, backend)
+            # NLI-модель (score_matrix) не кодує тексти — спільні батчі їй не потрібні
+            self.embedder = emb if hasattr(emb, "score_matrix") else BatchingEmbedder(emb)
+            print(f"[ML_service] Модель {model_name} ({backend}) готова за {time.perf_counter() - t0:.1f} с")
+        else:
+            print("[ML_service] torch/transformers недоступні — працює TF-IDF fallback")
+
+    def process_job(self, msg: Dict) -> Dict:
+        zsf = self.zsf
+        options = dict(msg.get("options") or {})
+        tmp: List[str] = []
+        try:
+            def _tmp(text: str, suffix: str) -> str:
+                fd, path = tempfile.mkstemp(suffix=suffix)
+                with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+                    f.write(text)
+                tmp.append(path)
+                return path
+            in_path = _tmp(msg.get("text") or "", ".txt")
+            argv = ["--in", in_path, "--out", in_path, "--log", _tmp("", ".tsv")]
+            legend = msg.get("legend")
+            if legend:
+                if not isinstance(legend, str):
+                    legend = json.dumps(legend, ensure_ascii=False)
+                argv += ["--legend", _tmp(legend, ".json" if legend.lstrip().startswith("{") else ".txt")]
+            if options.pop("only_unknown", True):
+                argv.append("--only_unknown")
+            args = zsf.parse_args(argv)
+            for k, v in options.items():
+                if not hasattr(args, k) or k in ("inp", "out", "legend", "log", "model", "emb_cache",
+                                                   "backend", "onnx_dir", "second_model"):
+                    return {"ok": False, "error": f"Недопустимий параметр {k!r}"}
+                setattr(args, k, v)
+            args.model, args.backend = self.model_name, self.backend
+            t0 = time.perf_counter()
+            if isinstance(self.embedder, BatchingEmbedder):
+                summary = zsf.run(args, embedder=self.embedder)
+            else:
+                # NLI і TF-IDF fallback не йдуть через спільні батчі — прогони по одному
+                with zsf._RUN_LOCK:
+                    summary = zsf.run(args, embedder=self.embedder)
+            summary["seconds"] = round(time.perf_counter() - t0, 3)
+            with open(in_path, "r", encoding="utf-8", newline="") as f:
+                out_text = f.read()
+            with open(args.log, "r", encoding="utf-8") as f:
+                log_text = f.read()
+            summary.update(out=None, log=None)
+            return {"ok": True, "text": out_text, "log": log_text, "summary": summary}
+        except Exception as e:
+            return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        finally:
+            for path in tmp:
+                try:
+                    os.unlink(path)
+                except Exception:
+                    pass
+
+
+class _TCPService(_ServiceMixin, socketserver.ThreadingTCPServer):
+    pass
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+    class _UnixService(_ServiceMixin, socketserver.ThreadingUnixStreamServer):
+        pass
+else:
+    _UnixService = None
+
+
+def serve(addr: Optional[str] = None, model_name: str = "youscan/ukr-roberta-base",
+          cache_dir: Optional[str] = None, backend: str = "torch") -> None:
+    family, address = _parse_addr(addr)
+    if family == socket.AF_INET:
+        server = _TCPService(address, _Handler)
+    else:
+        if os.path.exists(address):
+            os.unlink(address)
+        server = _UnixService(address, _Handler)
+    try:
+        server.setup_model(model_name, cache_dir, backend)
+        server.token = _write_token(addr)
+    except BaseException:
+        server.server_close()
+        raise
+    print(f"[ML_service] Слухаю {addr or DEFAULT_ADDR}; токен зупинки -> {token_path(addr)}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        try:
+            if read_token(addr) == server.token:  # інший сервіс на цій адресі міг уже записати свій
+                os.unlink(token_path(addr))
+        except OSError:
+            pass
+        if server.embedder is not None:
+            server.embedder.flush()
+        server.server_close()
+        if family != socket.AF_INET:
+            try:
+                os.unlink(address)
+            except Exception:
+                pass
+        print("[ML_service] Зупинено")
+
+# ------------------------- Клієнт -------------------------
+
+def request(msg: Dict, addr: Optional[str] = None, timeout: Optional[float] = None) -> Dict:
+    family, address = _parse_addr(addr)
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(address)
+        send_msg(sock, msg)
+        resp = recv_msg(sock)
+    if resp is None:
+        raise ConnectionError("Сервіс закрив з'єднання без відповіді")
+    return resp
+
+def shutdown(addr: Optional[str] = None, timeout: Optional[float] = 5.0) -> Dict:
+    """Зупинити сервіс; токен береться з файлу, який записав --serve (той самий користувач)."""
+    return request({"op": "shutdown", "token": read_token(addr)}, addr, timeout=timeout)
+
+def service_available(addr: Optional[str] = None, timeout: float = 0.3) -> bool:
+    try:
+        return bool(request({"op": "ping"}, addr, timeout=timeout).get("ok"))
+    except Exception:
+        return False
+
+def process_file(input_path: str, legend_path: Optional[str] = None, output_path: Optional[str] = None,
+                 only_unknown: bool = True, log_path: Optional[str] = None,
+                 addr: Optional[str] = None, **options) -> Dict:
+    """Тонкий клієнт із сигнатурою zeroshot_speaker_models.process_file()."""
+    with open(input_path, "r", encoding="utf-8", newline="") as f:
+        text = f.read()
+    legend = None
+    if legend_path and os.path.exists(legend_path):
+        with open(legend_path, "r", encoding="utf-8") as f:
+            legend = f.read()
+    resp = request({"op": "process", "text": text, "legend": legend,
+                    "options": dict(options, only_unknown=only_unknown)}, addr)
+    if not resp.get("ok"):
+        raise RuntimeError(resp.get("error") or "помилка сервісу")
+    with open(output_path or input_path, "w", encoding="utf-8", newline="") as f:
+        f.write(resp.get("text") or "")
+    if log_path:
+        with open(log_path, "w", encoding="utf-8") as f:
+            f.write(resp.get("log") or "")
+    return resp.get("summary") or {}
+
+# --------------------------- CLI ---------------------------
+
+def main():
+    p = argparse.ArgumentParser(description="Сервіс призначення мовців (zeroshot_speaker_models)")
+    p.add_argument("--addr", default=None, help=f"host:port або шлях Unix-сокета (типово {DEFAULT_ADDR})")
+    p.add_argument("--serve", action="store_true", help="Запустити сервіс")
+    p.add_argument("--model", default="youscan/ukr-roberta-base",
+                   help="Псевдонім з MODEL_REGISTRY або HF модель (для --serve)")
+    p.add_argument("--emb_cache", default=None, help="Каталог кешу ембеддингів (для --serve)")
+    p.add_argument("--backend", default="torch", choices=("torch", "torch-int8", "onnx", "onnx-int8"),
+                   help="Бекенд ембеддингів (для --serve)")
+    p.add_argument("--ping", action="store_true", help="Перевірити, чи працює сервіс")
+    p.add_argument("--shutdown", action="store_true", help="Зупинити сервіс")
+    p.add_argument("--in", dest="inp", help="Вхідний текст із #g-тегами")
+    p.add_argument("--out", dest="out", help="Вихідний файл (типово — перезаписати вхідний)")
+    p.add_argument("--legend", default=None, help="JSON або TXT легенда")
+    p.add_argument("--log", default=None, help="TSV лог прогнозів")
+    p.add_argument("--all", action="store_true", help="Обробляти не лише #g?")
+    args = p.parse_args()
+
+    if args.serve:
+        if args.emb_cache is None:
+            import zeroshot_speaker_models as zsf
+            args.emb_cache = zsf.DEFAULT_EMB_CACHE_DIR
+        serve(args.addr, args.model, args.emb_cache, args.backend)
+        return 0
+    if args.ping:
+        ok = service_available(args.addr, timeout=2.0)
+        print("[ML_service] працює" if ok else "[ML_service] недоступний")
+        return 0 if ok else 1
+    if args.shutdown:
+        try:
+            resp = shutdown(args.addr)
+        except FileNotFoundError:
+            print(f"[ML_service] Немає токена зупинки ({token_path(args.addr)}) — сервіс не запущено цим користувачем")
+            return 1
+        print(resp)
+        return 0 if resp.get("ok") else 1
+    if not args.inp:
+        p.error("потрібно --serve, --ping, --shutdown або --in")
+    summary = process_file(args.inp, args.legend, args.out, only_unknown=not args.all,
+                           log_path=args.log, addr=args.addr)
+    print(f"[ML_service] Готово. Записано -> {args.out or args.inp}")
+    print(f"[ML_service] Невідомих мовців: {summary.get('total_unknown')}, замінено: {summary.get('changed')}"
+          f", {summary.get('seconds')} с")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,9 +4,15 @@
 import os
 import re
 import json
+import time
+import hashlib
 import argparse
+import tempfile
+import threading
 from typing import List, Dict, Tuple, Optional
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
+
+from name_matcher import gen_name_forms
 
 """
 This script originally relied on the PyTorch and HuggingFace
@@ -32,7 +38,7 @@ basic numpy operations, both of which are available in this runtime.
 # Try to import heavy ML dependencies. Fall back to TF‑IDF if unavailable.
 try:
     import torch  # type: ignore
-    from transformers import AutoTokenizer, AutoModel  # type: ignore
+    from transformers import AutoTokenizer, AutoModel, AutoConfig  # type: ignore
     USE_HF = True
 except Exception:
     USE_HF = False
@@ -60,17 +66,29 @@ def dprint(*args, **kwargs):
 
 # ------------------------- CLI -------------------------
 
-def parse_args():
+DEFAULT_EMB_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "emb_cache")
+EMB_CACHE_MAX_ROWS = 100_000      # векторів на пару (модель, max_length); понад це найстаріші видаляються
+EMB_CACHE_MAX_SEGMENTS = 16       # понад стільки файлів-сегментів кеш зливається в один
+VERBALIZER_MEM_MAX = 256          # матриць персонажів у пам'яті процесу на пару (модель, max_length), LRU
+# Експортовані ONNX-моделі лежать поруч із кешем HuggingFace
+DEFAULT_ONNX_DIR = os.path.join(
+    os.environ.get("HF_HOME") or os.path.join(os.path.expanduser("~"), ".cache", "huggingface"), "onnx")
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+PARITY_SAMPLE = 64  # скільки текстів порівнювати з fp32 у --parity_check
+
+def parse_args(argv: Optional[List[str]] = None):
     p = argparse.ArgumentParser()
     p.add_argument("--in", dest="inp", required=True, help="Вхідний текст із #g-тегами")
     p.add_argument("--out", dest="out", required=True, help="Вихідний файл з підстановками")
     p.add_argument("--legend", dest="legend", default=None, help="JSON або TXT легенда")
     p.add_argument("--log", dest="log", default=None, help="TSV лог прогнозів")
-    p.add_argument("--threshold", type=float, default=0.25, help="Мін. cosine для присвоєння")
+    p.add_argument("--threshold", type=float, default=None,
+                   help="Мін. cosine для присвоєння (за замовч. — поріг моделі з MODEL_REGISTRY, інакше 0.25)")
     p.add_argument("--min_margin", type=float, default=0.01, help="Мін. різниця Top1-Top2")
     p.add_argument("--ctx_lines", type=int, default=11, help="Вікно контексту ±N рядків")
     p.add_argument("--topk", type=int, default=5, help="Скільки топ-кандидатів логувати")
-    p.add_argument("--model", default="youscan/ukr-roberta-base", help="HF модель ембеддингів")
+    p.add_argument("--model", default="youscan/ukr-roberta-base",
+                   help="Псевдонім з MODEL_REGISTRY (" + ", ".join(MODEL_REGISTRY) + ") або HF модель ембеддингів")
     p.add_argument("--only_unknown", action="store_true", help="Обробляти лише #g?")
     p.add_argument("--force_when_single", action="store_true", help="Якщо кандидат один — присвоїти завжди")
     p.add_argument("--no_gender_filter", action="store_true", help="Вимкнути фільтр за родом")
@@ -78,9 +96,26 @@ def parse_args():
     # Нові параметри керування точністю/швидкістю
     p.add_argument("--lexical_boost", type=float, default=0.35, help="Буст для лексичних збігів")
     p.add_argument("--num_threads", type=int, default=None, help="Кількість потоків для PyTorch")
+    p.add_argument("--backend", choices=BACKENDS, default="torch",
+                   help="Бекенд ембеддингів: torch (fp32), torch-int8, onnx, onnx-int8 (ONNX Runtime, CPU)")
+    p.add_argument("--onnx_dir", default=DEFAULT_ONNX_DIR, help="Каталог експортованих ONNX-моделей")
+    p.add_argument("--parity_check", action="store_true",
+                   help="Порівняти вектори бекенду з fp32 torch (cosine) і вивести відхилення")
+    # Каскад/ансамбль двох моделей: передобробка й кандидати спільні, скори зливаються
+    p.add_argument("--second_model", default=None,
+                   help="Друга (точніша) модель з MODEL_REGISTRY або HF id для каскаду/ансамблю")
+    p.add_argument("--ensemble", choices=("cascade", "full"), default="cascade",
+                   help="cascade — друга модель лише для рядків з малим відривом top1–top2; full — для всіх")
+    p.add_argument("--ensemble_weight", type=float, default=0.5, help="Вага другої моделі у злитті скорів")
+    p.add_argument("--escalate_margin", type=float, default=None,
+                   help="Відрив top1–top2, нижче якого рядок іде до другої моделі (за замовч. --min_margin)")
     p.add_argument("--max_length", type=int, default=256, help="Макс. токенів для encode")
+    p.add_argument("--batch_tokens", type=int, default=None,
+                   help="Бюджет токенів на батч encode (з паддингом); за замовч. batch_size*max_length")
     p.add_argument("--log_query_len", type=int, default=400, help="Обрізання запиту у лог")
-    args = p.parse_args()
+    p.add_argument("--emb_cache", default=DEFAULT_EMB_CACHE_DIR, help="Каталог дискового кешу ембеддингів")
+    p.add_argument("--no_emb_cache", action="store_true", help="Не використовувати кеш ембеддингів")
+    args = p.parse_args(argv)
     dprint("[DEBUG] parse_args:", vars(args))
     return args
 
@@ -270,19 +305,8 @@ def _has_speech_verb(txt: str) -> bool:
     # dprint("[DEBUG] _has_speech_verb:", res)
     return res
 
-def _gen_name_forms(name: str) -> List[str]:
-    base = name.strip()
-    forms = {base, base.replace("’", "'"), base.lower(), base.lower().replace("’", "'")}
-    if base.endswith(("а", "я")):
-        stem = base[:-1]
-        for suf in ("и","і","ю","єю","е","є","ою"):
-            forms.add(stem + suf); forms.add((stem + suf).lower())
-    else:
-        for suf in ("а","у","ом","ові","е","ю","і"):
-            forms.add(base + suf); forms.add((base + suf).lower())
-    out = list(forms)
-    # dprint(f"[DEBUG] _gen_name_forms('{name}'): {len(out)} forms")
-    return out
+# Відмінкові форми імен — спільні з конвеєром правил (name_matcher.NameIndex)
+_gen_name_forms = gen_name_forms
 
 def build_name_forms_map(legend: Dict[str, Dict]) -> Dict[str, str]:
     inv = {}
@@ -340,38 +364,50 @@ def gender_hint(line: str) -> Optional[str]:
     if "жіночий голос" in t: return "F"
     return None
 
-def collect_context_candidates(idx: int, lines: List[str], ctx: int, name_forms_inv: Dict[str, str]) -> List[str]:
+# Згадки імен по рядках: кожен рядок токенізується один раз на документ (run() будує таблицю
+# і передає її явно — спільного між потоками кешу немає), а вікна ±ctx рядків лише збирають
+# готові списки (раніше — повторне сканування вікна на кожен запит)
+
+def line_mentions(lines: List[str], name_forms_inv: Dict[str, str]) -> List[List[str]]:
+    """[рядок] → gid кожного токена-форми імені в порядку появи (з повторами)."""
+    table: List[List[str]] = []
+    for ln in lines:
+        m = TAG_ANY.match(ln)
+        text = (m.group(3) if m else ln) or ""
+        # Враховуємо й слова, що починаються з малих літер (щоб ловити аліаси на кшталт "правнучка")
+        table.append([g for g in (name_forms_inv.get(tok.lower()) for tok in _WORD_RX.findall(text)) if g])
+    return table
+
+
+def collect_context_candidates(idx: int, lines: List[str], ctx: int, name_forms_inv: Dict[str, str],
+                               mentions: Optional[List[List[str]]] = None) -> List[str]:
     lo, hi = max(0, idx - ctx), min(len(lines), idx + ctx + 1)
     found = []
-    # Враховуємо й слова, що починаються з малих літер (щоб ловити аліаси на кшталт "правнучка")
-    rx_tok = re.compile(r"[A-Za-zА-Яа-яЇїІіЄєҐґ][\w’']+")
+    if mentions is None:
+        mentions = line_mentions(lines, name_forms_inv)
     for j in range(lo, hi):
-        m = TAG_ANY.match(lines[j])
-        text = (m.group(3) if m else lines[j]) or ""
-        for tok in rx_tok.findall(text):
-            gid = name_forms_inv.get(tok.lower())
-            if gid and gid not in found:
+        for gid in mentions[j]:
+            if gid not in found:
                 found.append(gid)
     dprint(f"[DEBUG] collect_context_candidates idx={idx}:", found[:10])
     return found
 
-def count_context_mentions(idx: int, lines: List[str], ctx: int, name_forms_inv: Dict[str, str]) -> Dict[str, float]:
+def count_context_mentions(idx: int, lines: List[str], ctx: int, name_forms_inv: Dict[str, str],
+                           mentions: Optional[List[List[str]]] = None) -> Dict[str, float]:
     """Повертає вагований лічильник згадок кожного gid у ±ctx рядках (включно з поточним)."""
     lo, hi = max(0, idx - ctx), min(len(lines), idx + ctx + 1)
-    # Так само дозволяємо слова, що починаються з малих літер
-    rx_tok = re.compile(r"[A-Za-zА-Яа-яЇїІіЄєҐґ][\w’']+")
+    if mentions is None:
+        mentions = line_mentions(lines, name_forms_inv)
     counts: Dict[str, float] = {}
     for j in range(lo, hi):
-        m = TAG_ANY.match(lines[j])
-        text = (m.group(3) if m else lines[j]) or ""
-        for tok in rx_tok.findall(text):
-            gid = name_forms_inv.get(tok.lower())
-            if gid:
-                weight = 1.0 / (1 + abs(j - idx))
-                counts[gid] = counts.get(gid, 0.0) + weight
+        for gid in mentions[j]:
+            weight = 1.0 / (1 + abs(j - idx))
+            counts[gid] = counts.get(gid, 0.0) + weight
     # dprint(f"[DEBUG] count_context_mentions idx={idx}:", list(counts.items())[:5])
     return counts
 
+_WORD_RX = re.compile(r"[A-Za-zА-Яа-яЇїІіЄєҐґ][\w’']+")
+
 _VERB_NAME_RX = re.compile(
     r"^\s*[—\-–]?\s*(сказав|сказала|відповів|відповіла|запитав|запитала|спитав|спитала|промовив|промовила|вигукнув|вигукнула|прошепотів|прошепотіла)\s+([A-ZА-ЯЇІЄҐ][\w’']+(?:\s+[A-ZА-ЯЇІЄҐ][\w’']+)?)",
     re.IGNORECASE
@@ -417,8 +453,63 @@ def replace_line_gid(lines: List[str], idx: int, new_gid: str):
     lines[idx] = f"{indent}{new_gid}: {body}{eol}"
     dprint(f"[DEBUG] replace_line_gid idx={idx} -> {new_gid}")
 
+# --------------------- Реєстр моделей ----------------------
+# Один конвеєр (читання, легенда, запити, кандидати, правила) для всіх моделей:
+# зміна моделі = інший енкодер із реєстру, а не інший скрипт.
+#   kind "hf-mean" — HFEmbedder/OnnxEmbedder (mean-pooling трансформера, бекенди torch/int8/onnx)
+#   kind "st"      — sentence-transformers (нормовані ембеддинги)
+#   kind "nli"     — zero-shot NLI: одразу матриця ймовірностей «репліка ↔ мовець» [Q,G]
+# query_prefix/passage_prefix — префікси запиту/вербалізатора (E5: "query: "/"passage: ").
+
+MODEL_REGISTRY: Dict[str, Dict] = {}
+
+def register_model(alias: str, model_id: str, kind: str = "hf-mean", threshold: float = 0.25,
+                   query_prefix: str = "", passage_prefix: str = "", **options) -> None:
+    MODEL_REGISTRY[alias] = {"model": model_id, "kind": kind, "threshold": threshold,
+                             "query_prefix": query_prefix, "passage_prefix": passage_prefix,
+                             "options": options}
+
+def resolve_model(name: str) -> Dict:
+    """Опис моделі за псевдонімом або HF id; невідомий id — mean-pooling трансформер."""
+    spec = MODEL_REGISTRY.get(name)
+    if spec is None:
+        spec = next((r for r in MODEL_REGISTRY.values() if r["model"] == name), None)
+    if spec is None:
+        spec = {"model": name, "kind": "hf-mean", "threshold": 0.25,
+                "query_prefix": "", "passage_prefix": "", "options": {}}
+    return spec
+
+register_model("ukr-roberta", "youscan/ukr-roberta-base")
+register_model("labse", "sentence-transformers/LaBSE", "st", threshold=0.35)
+register_model("minilm", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2", "st", threshold=0.30)
+register_model("mpnet", "sentence-transformers/paraphrase-multilingual-mpnet-base-v2", "st", threshold=0.40)
+register_model("e5-large", "intfloat/multilingual-e5-large", "st", threshold=0.45,
+               query_prefix="query: ", passage_prefix="passage: ")
+register_model("xlmr-xnli", "joeddav/xlm-roberta-large-xnli", "nli", threshold=0.5, use_fast=False)
+register_model("mdeberta-xnli", "MoritzLaurer/mDeBERTa-v3-base-mnli-xnli", "nli", threshold=0.5)
+
 # --------------------- Embeddings (RoBERTa) ----------------------
 
+def length_buckets(lengths: List[int], max_tokens: int) -> List[List[int]]:
+    """
+    Індекси текстів, відсортовані за довжиною (у токенах) і нарізані на батчі так,
+    щоб (найдовший у батчі) × (розмір батчу) ≤ max_tokens — тобто з паддингом.
+    Короткі репліки йдуть великими батчами, довгі контексти — малими; паддинг
+    мінімальний, бо в батчі тексти близької довжини.
+    """
+    order = sorted(range(len(lengths)), key=lambda k: lengths[k])
+    batches: List[List[int]] = []
+    cur: List[int] = []
+    for k in order:
+        longest = max(1, lengths[k])  # відсортовано → поточний найдовший у батчі
+        if cur and longest * (len(cur) + 1) > max_tokens:
+            batches.append(cur)
+            cur = []
+        cur.append(k)
+    if cur:
+        batches.append(cur)
+    return batches
+
 if USE_HF:
     class HFEmbedder:
         """
@@ -428,40 +519,185 @@ if USE_HF:
         the non‑HF branch below.
         """
 
-        def __init__(self, model_name: str):
-            self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        def __init__(self, model_name: str, backend: str = "torch"):
+            self.model_name = model_name
+            self.backend = backend
+            # вектори int8/onnx трохи відрізняються від fp32 → окремий дисковий кеш
+            self.cache_name = model_name if backend == "torch" else f"{model_name}@{backend}"
+            # динамічна int8-квантизація PyTorch працює лише на CPU
+            self.device = "cuda" if torch.cuda.is_available() and backend == "torch" else "cpu"
             # Load tokenizer and model lazily to avoid OOM when unused
             self.tok = AutoTokenizer.from_pretrained(model_name)
             self.model = AutoModel.from_pretrained(model_name).to(self.device)
             self.model.eval()
-            dprint(f"[DEBUG] HFEmbedder: model={model_name} device={self.device}")
+            self.hidden_size = self.model.config.hidden_size
+            if backend == "torch-int8":
+                self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+            dprint(f"[DEBUG] HFEmbedder: model={model_name} backend={backend} device={self.device}")
+
+        def _forward(self, enc) -> torch.Tensor:
+            return self.model(**enc).last_hidden_state  # [B,T,H]
 
         @torch.inference_mode()
-        def encode(self, texts: List[str], batch_size: int = 16, max_length: int = 256) -> torch.Tensor:
+        def encode(self, texts: List[str], batch_size: int = 16, max_length: int = 256,
+                   max_tokens: Optional[int] = None) -> torch.Tensor:
             """
             Encode a list of texts into normalized mean‑pooled embeddings.
             Each embedding is a vector of dimension equal to the hidden
             size of the underlying transformer model. The result is a
-            PyTorch tensor on CPU.
+            PyTorch tensor on CPU, rows in the order of `texts`.
+
+            Texts are grouped by token length (length_buckets) so that a
+            batch holds at most `max_tokens` tokens including padding
+            (default: batch_size * max_length — the old worst case).
+            Padding is masked out of the mean, so the vectors are the same
+            as with fixed batches up to float rounding.
             """
             if not texts:
                 # Return an empty tensor with the correct feature dimension
-                return torch.zeros((0, self.model.config.hidden_size))
-            outs = []
-            for i in range(0, len(texts), batch_size):
-                chunk = texts[i:i + batch_size]
+                return torch.zeros((0, self.hidden_size))
+            budget = max_tokens or batch_size * max_length
+            lengths = [len(ids) for ids in self.tok(list(texts), truncation=True, max_length=max_length)["input_ids"]]
+            embs = torch.zeros((len(texts), self.hidden_size))
+            buckets = length_buckets(lengths, budget)
+            for idx in buckets:
+                chunk = [texts[k] for k in idx]
                 enc = self.tok(chunk, padding=True, truncation=True,
                                max_length=max_length, return_tensors="pt").to(self.device)
-                out = self.model(**enc).last_hidden_state  # [B,T,H]
+                out = self._forward(enc)
                 mask = enc["attention_mask"].unsqueeze(-1)  # [B,T,1]
                 summed = (out * mask).sum(dim=1)             # [B,H]
                 counts = mask.sum(dim=1).clamp(min=1)        # [B,1]
                 mean = summed / counts
                 mean = torch.nn.functional.normalize(mean, p=2, dim=1)
-                outs.append(mean.detach().cpu())
-            embs = torch.cat(outs, dim=0)
-            dprint(f"[DEBUG] encode: batch_out shape={embs.shape}")
+                embs[idx] = mean.detach().float().cpu()     # назад у вихідний порядок
+            dprint(f"[DEBUG] encode: batch_out shape={embs.shape} batches={len(buckets)} "
+                   f"tokens={sum(lengths)} budget={budget}")
             return embs
+
+    class _LastHidden(torch.nn.Module):
+        """Обгортка для експорту: ONNX-граф приймає ids/mask і повертає лише last_hidden_state."""
+
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+
+    def export_onnx(model_name: str, onnx_dir: str, quantize: bool = False) -> str:
+        """
+        Шлях до ONNX-моделі <onnx_dir>/<model>/model.onnx (або model.int8.onnx).
+        Експорт і динамічна int8-квантизація ваг виконуються один раз; далі файл
+        береться з диска. Для оновленої моделі достатньо видалити каталог.
+        """
+        out_dir = os.path.join(onnx_dir, re.sub(r"[^\w.\-]+", "_", model_name))
+        os.makedirs(out_dir, exist_ok=True)
+        fp32_path = os.path.join(out_dir, "model.onnx")
+        int8_path = os.path.join(out_dir, "model.int8.onnx")
+        if not os.path.exists(fp32_path):
+            print(f"[ML_model] Експорт {model_name} в ONNX → {fp32_path}")
+            tok = AutoTokenizer.from_pretrained(model_name)
+            model = AutoModel.from_pretrained(model_name).eval()
+            enc = tok(["Приклад репліки для експорту."], return_tensors="pt")
+            axes = {0: "batch", 1: "seq"}
+            tmp = os.path.join(out_dir, "model.tmp.onnx")
+            with torch.no_grad():
+                torch.onnx.export(_LastHidden(model), (enc["input_ids"], enc["attention_mask"]), tmp,
+                                  input_names=["input_ids", "attention_mask"],
+                                  output_names=["last_hidden_state"],
+                                  dynamic_axes={"input_ids": axes, "attention_mask": axes,
+                                                "last_hidden_state": axes},
+                                  opset_version=14)
+            os.replace(tmp, fp32_path)
+        if not quantize:
+            return fp32_path
+        if not os.path.exists(int8_path):
+            from onnxruntime.quantization import QuantType, quantize_dynamic  # type: ignore
+            print(f"[ML_model] Int8-квантизація → {int8_path}")
+            tmp = os.path.join(out_dir, "model.int8.tmp.onnx")
+            quantize_dynamic(fp32_path, tmp, weight_type=QuantType.QInt8)
+            os.replace(tmp, int8_path)
+        return int8_path
+
+    class OnnxEmbedder(HFEmbedder):
+        """
+        HFEmbedder, у якому трансформер виконує ONNX Runtime (CPU) замість PyTorch eager.
+        Токенізація, батчі за довжиною й mean-pooling — ті самі, що в HFEmbedder.
+        """
+
+        def __init__(self, model_name: str, backend: str = "onnx", onnx_dir: Optional[str] = None):
+            import onnxruntime as ort  # type: ignore
+            self.model_name = model_name
+            self.backend = backend
+            self.cache_name = f"{model_name}@{backend}"
+            self.device = "cpu"
+            self.tok = AutoTokenizer.from_pretrained(model_name)
+            self.hidden_size = AutoConfig.from_pretrained(model_name).hidden_size
+            path = export_onnx(model_name, onnx_dir or DEFAULT_ONNX_DIR, quantize=backend == "onnx-int8")
+            so = ort.SessionOptions()
+            so.intra_op_num_threads = torch.get_num_threads()
+            self.session = ort.InferenceSession(path, so, providers=["CPUExecutionProvider"])
+            self.input_names = {i.name for i in self.session.get_inputs()}
+            dprint(f"[DEBUG] OnnxEmbedder: model={model_name} path={path}")
+
+        def _forward(self, enc) -> torch.Tensor:
+            feeds = {k: v.cpu().numpy() for k, v in enc.items() if k in self.input_names}
+            return torch.from_numpy(self.session.run(["last_hidden_state"], feeds)[0])
+
+    class STEmbedder:
+        """Енкодер sentence-transformers з інтерфейсом HFEmbedder.encode() (рядки у порядку texts)."""
+
+        def __init__(self, model_name: str, **options):
+            from sentence_transformers import SentenceTransformer  # type: ignore
+            self.model_name = self.cache_name = model_name
+            self.device = "cuda" if torch.cuda.is_available() else "cpu"
+            self.model = SentenceTransformer(model_name, device=self.device, **options)
+            self.hidden_size = self.model.get_sentence_embedding_dimension()
+            dprint(f"[DEBUG] STEmbedder: model={model_name} device={self.device}")
+
+        def encode(self, texts: List[str], batch_size: int = 16, max_length: int = 256,
+                   max_tokens: Optional[int] = None) -> torch.Tensor:
+            if not texts:
+                return torch.zeros((0, self.hidden_size))
+            # sentence-transformers сам сортує тексти за довжиною всередині encode()
+            self.model.max_seq_length = max_length
+            embs = self.model.encode(list(texts), batch_size=batch_size, convert_to_tensor=True,
+                                     normalize_embeddings=True, show_progress_bar=False)
+            return embs.detach().float().cpu()
+
+    class NLIScorer:
+        """
+        Zero-shot NLI (pipeline "zero-shot-classification"): замість ембеддингів —
+        score_matrix(запити, мітки) → [Q,G] ймовірностей гіпотези «репліку сказав <мітка>».
+        """
+
+        def __init__(self, model_name: str, use_fast: bool = True,
+                     template: str = "Цю репліку сказав персонаж: {}."):
+            from transformers import pipeline  # type: ignore
+            self.model_name = self.cache_name = model_name
+            self.template = template
+            tok = AutoTokenizer.from_pretrained(model_name, use_fast=use_fast)
+            self.clf = pipeline("zero-shot-classification", model=model_name, tokenizer=tok,
+                                device=0 if torch.cuda.is_available() else -1)
+            self._lock = threading.Lock()
+            dprint(f"[DEBUG] NLIScorer: model={model_name}")
+
+        def score_matrix(self, texts: List[str], labels: List[str], batch_size: int = 16) -> torch.Tensor:
+            uniq = list(dict.fromkeys(labels))
+            out = torch.zeros((len(texts), len(labels)))
+            if not texts or not uniq:
+                return out
+            with self._lock:
+                res = self.clf(list(texts), candidate_labels=uniq, multi_label=True,
+                               hypothesis_template=self.template, batch_size=batch_size)
+            if isinstance(res, dict):
+                res = [res]
+            cols = {lab: [j for j, l in enumerate(labels) if l == lab] for lab in uniq}
+            for r, item in enumerate(res):
+                for lab, score in zip(item["labels"], item["scores"]):
+                    out[r, cols[lab]] = float(score)
+            return out
 else:
     class HFEmbedder:
         """
@@ -473,20 +709,368 @@ else:
         callers should not rely on it. All embedding logic in fallback
         mode is handled explicitly in the main() function.
         """
-        def __init__(self, model_name: str) -> None:
+        def __init__(self, model_name: str, backend: str = "torch", onnx_dir: Optional[str] = None) -> None:
             # Do not initialise any heavy resources here
             self.model_name = model_name
+            self.backend = backend
+            self.cache_name = model_name
 
-        def encode(self, texts: List[str], batch_size: int = 16, max_length: int = 256):
+        def encode(self, texts: List[str], batch_size: int = 16, max_length: int = 256,
+                   max_tokens: Optional[int] = None):
             raise NotImplementedError(
                 "HFEmbedder.encode() should not be called in fallback mode"
             )
 
+    OnnxEmbedder = STEmbedder = NLIScorer = HFEmbedder
+
+def _make_hf_mean(model_id: str, backend: str, onnx_dir: Optional[str], **options):
+    """HFEmbedder для torch/torch-int8, OnnxEmbedder для onnx/onnx-int8 (без onnxruntime — torch)."""
+    if backend in ("onnx", "onnx-int8"):
+        try:
+            return OnnxEmbedder(model_id, backend, onnx_dir)
+        except ImportError as e:
+            print(f"[ML_model] ONNX Runtime недоступний ({e}) — бекенд torch")
+            backend = "torch"
+    return HFEmbedder(model_id, backend)
+
+ENCODER_KINDS = {
+    "hf-mean": _make_hf_mean,
+    "st": lambda model_id, backend, onnx_dir, **options: STEmbedder(model_id, **options),
+    "nli": lambda model_id, backend, onnx_dir, **options: NLIScorer(model_id, **options),
+}
+
+def make_embedder(model_name: str, backend: str = "torch", onnx_dir: Optional[str] = None):
+    """Енкодер для псевдоніма/HF id із MODEL_REGISTRY; бекенди int8/onnx — лише для kind "hf-mean"."""
+    spec = resolve_model(model_name)
+    if spec["kind"] != "hf-mean" and backend != "torch":
+        print(f"[ML_model] Бекенд {backend} не підтримується для {spec['kind']} — бекенд torch")
+    return ENCODER_KINDS[spec["kind"]](spec["model"], backend, onnx_dir, **spec["options"])
+
+# --------------------- Дисковий кеш ембеддингів ----------------------
+
+class EmbeddingCache:
+    """
+    Кеш ембеддингів однієї пари (модель, max_length) на диску, сегментами:
+      <dir>/<model>__L<max_length>.seg-<час>-<pid>.npz — keys: sha1(normalize_for_embed(text)) [n],
+                                                       vecs: float32 [n,H]
+    Ключі й вектори лежать в одному файлі, що з'являється атомарно (os.replace), тож індекс
+    не розходиться з матрицею й за одночасних записів кількох процесів. flush() дописує лише
+    новий сегмент; понад EMB_CACHE_MAX_SEGMENTS сегментів чи EMB_CACHE_MAX_ROWS векторів
+    кеш зливається в один сегмент без найстаріших векторів. Вектори сегмента читаються при
+    першому звертанні; зниклий (злитий іншим процесом) сегмент — просто промах.
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, max_length: int):
+        import numpy as np  # type: ignore
+        self.np = np
+        os.makedirs(cache_dir, exist_ok=True)
+        self.dir = cache_dir
+        self.slug = re.sub(r"[^\w.\-]+", "_", model_name) + f"__L{int(max_length)}"
+        self.index: Dict[str, Tuple[int, int]] = {}  # ключ → (сегмент, рядок); сегмент -1 — ще в пам'яті
+        self.segs: List[str] = []
+        self.seg_rows: List[int] = []
+        self.loaded: Dict[int, object] = {}
+        self.new_keys: List[str] = []
+        self.new_rows: List = []
+        for path in self._segment_paths():
+            try:
+                with np.load(path) as z:
+                    keys = z["keys"]
+                if keys.ndim != 1:
+                    raise ValueError(f"keys.ndim={keys.ndim}")
+            except Exception as e:
+                dprint("[DEBUG] EmbeddingCache: не вдалося прочитати", path, e)
+                continue
+            s = len(self.segs)
+            self.segs.append(path)
+            self.seg_rows.append(len(keys))
+            for row, k in enumerate(keys.tolist()):
+                self.index.setdefault(k, (s, row))
+        dprint(f"[DEBUG] EmbeddingCache: {self.slug} rows={len(self.index)} segments={len(self.segs)}")
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha1(normalize_for_embed(text).encode("utf-8")).hexdigest()
+
+    def _segment_paths(self) -> List[str]:
+        prefix = self.slug + ".seg-"
+        return sorted(os.path.join(self.dir, n) for n in os.listdir(self.dir)
+                      if n.startswith(prefix) and n.endswith(".npz"))
+
+    def _vecs(self, s: int):
+        vecs = self.loaded.get(s)
+        if vecs is None:
+            try:
+                with self.np.load(self.segs[s]) as z:
+                    vecs = z["vecs"]
+                if vecs.ndim != 2 or vecs.shape[0] != self.seg_rows[s]:
+                    raise ValueError(f"vecs.shape={vecs.shape}, keys={self.seg_rows[s]}")
+            except Exception as e:
+                dprint("[DEBUG] EmbeddingCache: сегмент недоступний", self.segs[s], e)
+                self.index = {k: pos for k, pos in self.index.items() if pos[0] != s}
+                return None
+            vecs = self.loaded[s] = vecs.astype(self.np.float32, copy=False)
+        return vecs
+
+    def get(self, key: str):
+        pos = self.index.get(key)
+        if pos is None:
+            return None
+        s, row = pos
+        if s < 0:
+            return self.new_rows[row]
+        vecs = self._vecs(s)
+        return None if vecs is None else vecs[row]
+
+    def add(self, key: str, vec) -> None:
+        if key in self.index:
+            return
+        self.index[key] = (-1, len(self.new_rows))
+        self.new_keys.append(key)
+        self.new_rows.append(self.np.asarray(vec, dtype=self.np.float32))
+
+    def _write(self, keys: List[str], vecs) -> str:
+        path = os.path.join(self.dir, f"{self.slug}.seg-{time.time_ns():020d}-{os.getpid()}.npz")
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            self.np.savez(f, keys=self.np.array(keys), vecs=vecs)
+        os.replace(tmp, path)
+        return path
+
+    def flush(self) -> None:
+        if not self.new_rows:
+            return
+        np = self.np
+        new = np.stack(self.new_rows).astype(np.float32)
+        s = len(self.segs)
+        self.segs.append(self._write(self.new_keys, new))
+        self.seg_rows.append(len(self.new_keys))
+        self.loaded[s] = new
+        for row, k in enumerate(self.new_keys):
+            self.index[k] = (s, row)
+        dprint(f"[DEBUG] EmbeddingCache.flush: +{len(self.new_rows)} rows → {len(self.index)}")
+        self.new_keys, self.new_rows = [], []
+        if len(self.segs) > EMB_CACHE_MAX_SEGMENTS or len(self.index) > EMB_CACHE_MAX_ROWS:
+            self._compact()
+
+    def _compact(self) -> None:
+        """Зливає сегменти в один, лишаючи EMB_CACHE_MAX_ROWS найновіших векторів."""
+        np = self.np
+        entries = sorted(self.index.items(), key=lambda kv: kv[1])[-EMB_CACHE_MAX_ROWS:]
+        rows_by_seg: Dict[int, List[Tuple[str, int]]] = defaultdict(list)
+        for k, (s, row) in entries:
+            rows_by_seg[s].append((k, row))
+        keys: List[str] = []
+        parts = []
+        for s in sorted(rows_by_seg):
+            vecs = self._vecs(s)
+            if vecs is None:
+                continue
+            keys += [k for k, _ in rows_by_seg[s]]
+            parts.append(vecs[[row for _, row in rows_by_seg[s]]])
+        old = self.segs
+        if keys:
+            mat = np.concatenate(parts, axis=0)
+            self.segs, self.seg_rows, self.loaded = [self._write(keys, mat)], [len(keys)], {0: mat}
+        else:
+            self.segs, self.seg_rows, self.loaded = [], [], {}
+        self.index = {k: (0, row) for row, k in enumerate(keys)}
+        for path in old:
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # уже злитий іншим процесом або ще відкритий (Windows)
+        dprint(f"[DEBUG] EmbeddingCache: злито {len(old)} сегментів → {len(keys)} rows")
+
+
+class VerbalizerStore:
+    """
+    Ембеддинги вербалізаторів на диску, по файлу на персонажа:
+      <dir>/verbalizers/<model>__L<max_length>/<sha1(вербалізатори)>.npy — матриця [n,H], читається через mmap
+    generate_verbalizers детермінований за записом легенди, тож той самий персонаж
+    у кожній книжці серії кодується один раз; у процесі до VERBALIZER_MEM_MAX найдавніше
+    використаних матриць лишаються в пам'яті (тензор дивиться прямо в mmap, без копії).
+    Вербалізатори кодуються повз EmbeddingCache (encode_uncached) — на диску вони лежать лише тут.
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, max_length: int):
+        import numpy as np  # type: ignore
+        self.np = np
+        slug = re.sub(r"[^\w.\-]+", "_", model_name) + f"__L{int(max_length)}"
+        self.dir = os.path.join(cache_dir, "verbalizers", slug)
+        self.mem: "OrderedDict[str, torch.Tensor]" = OrderedDict()
+        self._lock = threading.Lock()  # сервіс звертається з кількох потоків
+
+    @staticmethod
+    def key(texts: List[str]) -> str:
+        return hashlib.sha1("\n".join(texts).encode("utf-8")).hexdigest()
+
+    def get(self, texts: List[str]):
+        key = self.key(texts)
+        with self._lock:
+            emb = self.mem.get(key)
+            if emb is not None:
+                self.mem.move_to_end(key)
+        if emb is None:
+            path = os.path.join(self.dir, key + ".npy")
+            if not os.path.exists(path):
+                return None
+            try:
+                mat = self.np.load(path, mmap_mode="c")  # copy-on-write: torch.from_numpy без копії
+            except Exception as e:
+                dprint("[DEBUG] VerbalizerStore: не вдалося прочитати", path, e)
+                return None
+            if mat.ndim != 2 or mat.shape[0] != len(texts):
+                return None
+            if mat.dtype != self.np.float32:
+                mat = mat.astype(self.np.float32)
+            emb = torch.from_numpy(mat)
+            self._remember(key, emb)
+        return emb
+
+    def put(self, texts: List[str], emb) -> None:
+        key = self.key(texts)
+        self._remember(key, emb)
+        tmp = None
+        try:
+            os.makedirs(self.dir, exist_ok=True)
+            path = os.path.join(self.dir, key + ".npy")
+            # власний тимчасовий файл: два процеси з тим самим персонажем не пишуть в один
+            fd, tmp = tempfile.mkstemp(dir=self.dir, suffix=".npy")
+            with os.fdopen(fd, "wb") as f:
+                self.np.save(f, self.np.asarray(emb.numpy(), dtype=self.np.float32))
+            os.replace(tmp, path)
+        except Exception as e:
+            print(f"[ML_model] Вербалізатори не збережено: {e}")
+            if tmp is not None:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+
+    def _remember(self, key: str, emb) -> None:
+        with self._lock:
+            self.mem[key] = emb
+            self.mem.move_to_end(key)
+            while len(self.mem) > VERBALIZER_MEM_MAX:
+                self.mem.popitem(last=False)
+
+
+_VERB_STORES: Dict[Tuple[str, str, int], VerbalizerStore] = {}
+_VERB_STORES_LOCK = threading.Lock()
+
+def get_verbalizer_store(cache_dir: str, model_name: str, max_length: int) -> VerbalizerStore:
+    key = (cache_dir, model_name, int(max_length))
+    with _VERB_STORES_LOCK:
+        st = _VERB_STORES.get(key)
+        if st is None:
+            st = _VERB_STORES[key] = VerbalizerStore(cache_dir, model_name, max_length)
+    return st
+
+
+class CachedEmbedder:
+    """
+    Обгортка над HFEmbedder з тим самим encode(): вектори, що вже є у
+    EmbeddingCache, беруться з диска; трансформер бачить лише нові тексти.
+    """
+
+    def __init__(self, inner, cache_dir: str):
+        self.inner = inner
+        self.cache_dir = cache_dir
+        self.model_name = getattr(inner, "model_name", "model")
+        self.cache_name = getattr(inner, "cache_name", self.model_name)
+        self.stores: Dict[int, EmbeddingCache] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _store(self, max_length: int) -> EmbeddingCache:
+        st = self.stores.get(max_length)
+        if st is None:
+            st = self.stores[max_length] = EmbeddingCache(self.cache_dir, self.cache_name, max_length)
+        return st
+
+    def encode(self, texts: List[str], batch_size: int = 16, max_length: int = 256,
+               max_tokens: Optional[int] = None):
+        if not texts:
+            return self.inner.encode(texts, batch_size=batch_size, max_length=max_length)
+        st = self._store(max_length)
+        keys = [EmbeddingCache.key(t) for t in texts]
+        vecs = [st.get(k) for k in keys]
+        todo: Dict[str, str] = {}
+        for k, t, v in zip(keys, texts, vecs):
+            if v is None and k not in todo:
+                todo[k] = t
+        self.hits += len(texts) - len(todo)
+        self.misses += len(todo)
+        if todo:
+            fresh = self.inner.encode(list(todo.values()), batch_size=batch_size, max_length=max_length,
+                                      max_tokens=max_tokens)
+            for k, vec in zip(todo.keys(), fresh.numpy()):
+                st.add(k, vec)
+            vecs = [st.get(k) if v is None else v for k, v in zip(keys, vecs)]
+        mat = st.np.stack(vecs).astype(st.np.float32)
+        return torch.from_numpy(mat)
+
+    def encode_uncached(self, texts: List[str], batch_size: int = 16, max_length: int = 256,
+                        max_tokens: Optional[int] = None):
+        """encode() повз дисковий кеш — для текстів, які зберігає інше сховище (VerbalizerStore)."""
+        return self.inner.encode(texts, batch_size=batch_size, max_length=max_length, max_tokens=max_tokens)
+
+    def flush(self) -> None:
+        for st in self.stores.values():
+            try:
+                st.flush()
+            except Exception as e:
+                print(f"[ML_model] Кеш ембеддингів не збережено: {e}")
+
+
 def cosine(a: torch.Tensor, b: torch.Tensor) -> torch.Tensor:
     res = (a @ b.T).squeeze(0)
     # dprint("[DEBUG] cosine shape=", tuple(res.shape))
     return res  # за нормалізації це cosine
 
+# ----------------------- Теплий пул моделей -----------------------
+# Модель завантажується один раз на процес і перевикористовується всіма
+# викликами process_file() (GUI, плагіни) — повторні прогони не платять за load.
+
+_EMBEDDER_POOL: Dict[Tuple[str, str, Optional[str]], object] = {}
+_POOL_LOCK = threading.Lock()
+_RUN_LOCK = threading.Lock()      # прогони без спільних батчів (process_file, NLI/TF-IDF у сервісі) — по одному
+_THREADS_LOCK = threading.Lock()
+
+
+def _set_torch_threads(n: int) -> None:
+    with _THREADS_LOCK:
+        if torch.get_num_threads() != n:
+            torch.set_num_threads(n)
+
+def get_embedder(model_name: str, cache_dir: Optional[str] = None, backend: str = "torch",
+                 onnx_dir: Optional[str] = None):
+    """Лінивий синглтон ембеддера для (модель, бекенд); за наявності cache_dir — обгорнутий CachedEmbedder."""
+    model_name = resolve_model(model_name)["model"]  # псевдонім і HF id — одна тепла модель
+    key = (model_name, backend, cache_dir)
+    with _POOL_LOCK:
+        emb = _EMBEDDER_POOL.get(key)
+        if emb is None:
+            inner = _EMBEDDER_POOL.get((model_name, backend, None))
+            if inner is None:
+                print(f"[ML_model] Завантаження моделі {model_name} ({backend}) …")
+                inner = _EMBEDDER_POOL[(model_name, backend, None)] = make_embedder(model_name, backend, onnx_dir)
+            # NLI не дає ембеддингів → кешувати нічого
+            emb = inner if cache_dir is None or hasattr(inner, "score_matrix") else CachedEmbedder(inner, cache_dir)
+            _EMBEDDER_POOL[key] = emb
+        else:
+            dprint(f"[DEBUG] get_embedder: тепла модель {model_name}")
+    return emb
+
+def release_embedders() -> None:
+    """Звільнити усі завантажені моделі (наприклад, перед зміною моделі у GUI)."""
+    with _POOL_LOCK:
+        for emb in _EMBEDDER_POOL.values():
+            if isinstance(emb, CachedEmbedder):
+                emb.flush()
+        _EMBEDDER_POOL.clear()
+
 # --------------------- Verbalizers & aggregation ----------------------
 
 def _gendered_verbs(g: Optional[str]) -> List[str]:
@@ -526,6 +1110,14 @@ def generate_verbalizers(gid: str, rec: Dict) -> List[str]:
     dprint(f"[DEBUG] generate_verbalizers {gid}: n={len(uniq)}")
     return uniq
 
+def parity_report(embedder, reference, texts: List[str], max_length: int = 256) -> Dict[str, float]:
+    """Косинус між векторами бекенду й fp32-еталону на тих самих текстах (вектори нормовані)."""
+    a = embedder.encode(texts, max_length=max_length)
+    b = reference.encode(texts, max_length=max_length)
+    cos = (a * b).sum(dim=1)
+    return {"n": len(texts), "mean_cos": float(cos.mean()), "min_cos": float(cos.min()),
+            "max_drift": float(1.0 - cos.min())}
+
 def agg_sim(qvec: torch.Tensor, embs: torch.Tensor, topk: int) -> float:
     """Повертає max або mean(top-k) косайн подібностей qvec до множини ембедів."""
     if embs.numel() == 0:
@@ -541,18 +1133,98 @@ def agg_sim(qvec: torch.Tensor, embs: torch.Tensor, topk: int) -> float:
     # dprint("[DEBUG] agg_sim:", val)
     return val
 
+def score_queries(embedder, spec: Dict, queries: List[str], verbalizers: Dict[str, List[str]],
+                  gid_cols: List[str], gid2name: Dict[str, str], args) -> torch.Tensor:
+    """
+    Матриця [Q,G] однієї моделі: запити (вже normalize_for_embed) × мовці gid_cols.
+    Ембеддер — agg_sim з вербалізаторами (з префіксами моделі), NLI — score_matrix за іменами.
+    """
+    if hasattr(embedder, "score_matrix"):
+        # NLI: ймовірність гіпотези «репліку сказав <ім'я>» для кожної пари запит × мовець
+        return embedder.score_matrix(queries, [gid2name.get(g, g) for g in gid_cols])
+    qp, pp = spec["query_prefix"], spec["passage_prefix"]
+    store = None
+    if not args.no_emb_cache and args.emb_cache:
+        store = get_verbalizer_store(args.emb_cache, getattr(embedder, "cache_name", spec["model"]), args.max_length)
+    # вербалізатори зберігає store — EmbeddingCache (CachedEmbedder) їх не дублює
+    encode_verbs = getattr(embedder, "encode_uncached", embedder.encode) if store is not None else embedder.encode
+    verb_embs: List[torch.Tensor] = []
+    encoded = 0
+    for g in gid_cols:
+        texts = [pp + v for v in (verbalizers.get(g) or [normalize_for_embed(gid2name.get(g, g))])]
+        emb = store.get(texts) if store is not None else None
+        if emb is None:
+            encoded += 1
+            emb = encode_verbs(texts, batch_size=32, max_length=args.max_length, max_tokens=args.batch_tokens)
+            if store is not None:
+                store.put(texts, emb)
+        verb_embs.append(emb)
+    if store is not None:
+        dprint(f"[DEBUG] VerbalizerStore: з диска {len(gid_cols) - encoded}, закодовано {encoded}")
+    q_emb = embedder.encode([qp + q for q in queries], max_length=args.max_length,
+                            max_tokens=args.batch_tokens)
+    return agg_sim_matrix(q_emb, verb_embs, args.agg_topk)
+
+def agg_sim_matrix(q_emb: torch.Tensor, embs_per_gid: List[torch.Tensor], topk: int,
+                   block: int = 512) -> torch.Tensor:
+    """
+    Пакетний agg_sim: матриця [Q,G] подібностей кожного запиту до кожного кандидата.
+    Вербалізатори всіх кандидатів складаються в одну матрицю; на блок запитів —
+    один matmul, далі max або mean(top-k) у межах вербалізаторів кожного кандидата.
+    """
+    Q, G = int(q_emb.shape[0]), len(embs_per_gid)
+    out = torch.zeros((Q, G), dtype=torch.float32)
+    if Q == 0 or G == 0:
+        return out
+    lens = [int(e.shape[0]) if e.numel() else 0 for e in embs_per_gid]
+    V = torch.cat([e for e in embs_per_gid if e.numel()], dim=0).to(torch.float32)  # [M,H]
+    M, L = int(V.shape[0]), max(lens)
+    # індекси стовпців матриці схожостей для кожного кандидата; хвости → стовпець -inf
+    gather = torch.full((G, L), M, dtype=torch.long)
+    start = 0
+    for gi, n in enumerate(lens):
+        gather[gi, :n] = torch.arange(start, start + n)
+        start += n
+    k_g = torch.tensor([min(max(1, topk), n) for n in lens], dtype=torch.long)  # [G]
+    kmax = max(1, int(k_g.max()))
+    keep = torch.arange(kmax).unsqueeze(0) < k_g.unsqueeze(1)  # [G,kmax]
+    pad = torch.full((1, 1), float("-inf"))
+    for b0 in range(0, Q, block):
+        S = q_emb[b0:b0 + block].to(torch.float32) @ V.T  # [B,M]
+        S = torch.cat([S, pad.expand(S.shape[0], 1)], dim=1)
+        per_gid = S[:, gather]  # [B,G,L]
+        if topk <= 1:
+            agg = per_gid.max(dim=-1).values
+        else:
+            vals = torch.topk(per_gid, k=kmax, dim=-1).values
+            vals = torch.where(keep.unsqueeze(0), vals, torch.zeros_like(vals))
+            agg = vals.sum(dim=-1) / k_g.clamp(min=1).to(torch.float32)
+        out[b0:b0 + block] = torch.where(k_g.unsqueeze(0) > 0, agg, torch.zeros_like(agg))
+    return out
+
 # --------------------------- Main ---------------------------
 
-def main():
-    args = parse_args()
-    # У режимі HuggingFace встановлюємо кількість потоків для PyTorch.
+def run(args, embedder=None) -> Dict:
+    """
+    Повний прогін для вже розібраних аргументів; повертає короткий підсумок.
+    embedder — готовий ембеддер (напр. спільний у сервісі); інакше береться з теплого пулу.
+    """
+    # У режимі HuggingFace встановлюємо кількість потоків для PyTorch (налаштування на весь процес —
+    # паралельні прогони сервісу міняють його під _THREADS_LOCK і лише коли значення інше).
     if USE_HF:
-        torch.set_num_threads(args.num_threads or max(1, min(4, os.cpu_count() or 1)))
+        _set_torch_threads(args.num_threads or max(1, min(4, os.cpu_count() or 1)))
     # забезпечуємо наявність нових аргументів у старих скриптах
     if not hasattr(args, "novelty_penalty"):
         args.novelty_penalty = 0.08
     if not hasattr(args, "name_prefix_in_ctx"):
         args.name_prefix_in_ctx = False
+    if not hasattr(args, "backend"):
+        args.backend, args.onnx_dir, args.parity_check = "torch", DEFAULT_ONNX_DIR, False
+    if not hasattr(args, "second_model"):
+        args.second_model, args.ensemble, args.ensemble_weight, args.escalate_margin = None, "cascade", 0.5, None
+    spec = resolve_model(args.model)
+    if args.threshold is None:
+        args.threshold = spec["threshold"]
     global TAG_ANY
     # Підтримати '#g?: текст' і '#g? - текст'
     TAG_ANY = re.compile(r"^(\s*)#g(\d+|\?)\s*:?[\s]*(.*)$")
@@ -585,6 +1257,7 @@ def main():
 
     name_forms_inv = build_name_forms_map(legend)
     dprint("[DEBUG] name_forms_inv size:", len(name_forms_inv))
+    mention_table = line_mentions(lines, name_forms_inv)  # теги змінюються, тексти рядків — ні
     gid2name = build_gid_primary_name(legend)
     if not gid2name:
         fallback = seen_gids_from_text(lines)
@@ -660,162 +1333,182 @@ def main():
     if USE_HF:
         # ----------- HuggingFace / PyTorch Варіант -----------
         # Створити ембеддер, закодувати вербалізатори та запити
-        embedder = HFEmbedder(args.model)
-        verb_embs_all: Dict[str, torch.Tensor] = {}
-        for g in gid_list_all:
-            verb_embs_all[g] = embedder.encode(verbalizers[g], batch_size=32, max_length=args.max_length)
-        dprint("[DEBUG] verb_embs_all built for:", list(verb_embs_all.keys())[:10])
-
-        # Закодувати усі запити
-        q_emb = embedder.encode([normalize_for_embed(q) for q in q_texts], max_length=args.max_length)
-
-        # Визначення функції класифікації у HF режимі (залишено як у оригіналі)
-        def classify(idx: int, qvec: torch.Tensor, qtext: str, body_for_hints: str,
-                    first_seen_idx: Dict[str, int]) -> Tuple[str, Dict]:
-            dprint(f"[DEBUG] classify idx={idx} body[:60]=", (body_for_hints or "")[:60])
-            # Нормалізований текст для правил
-            body_norm = normalize_for_embed(body_for_hints)
-            # Ініціалізація діагностик для логів
-            pool_before = len(gid_list_all)
+        if embedder is None:
+            embedder = get_embedder(args.model, None if args.no_emb_cache else args.emb_cache,
+                                    args.backend, args.onnx_dir)
+        if isinstance(embedder, CachedEmbedder):
+            embedder.hits = embedder.misses = 0
+
+        # Кандидати, що можуть з'явитися лише через лексичний хіт (є у формах імен, але не у вербалізаторах)
+        extra_gids = sorted({g for g in name_forms_inv.values() if valid_gid(g) and g not in verbalizers})
+        for g in extra_gids:
+            rec = legend.get(g, {"names": [gid2name.get(g, g)], "aliases": []})
+            verbalizers[g] = generate_verbalizers(g, rec)
+        gid_cols: List[str] = list(gid_list_all) + extra_gids
+        col_of = {g: j for j, g in enumerate(gid_cols)}
+        G = len(gid_cols)
+
+        # Схожість усіх запитів з усіма кандидатами: один matmul + top-k на блок запитів
+        q_norm = [normalize_for_embed(q) for q in q_texts]
+        agg = score_queries(embedder, spec, q_norm, verbalizers, gid_cols, gid2name, args)  # [Q,G]
+        dprint("[DEBUG] agg_sim_matrix shape:", tuple(agg.shape))
+        if isinstance(embedder, CachedEmbedder):
+            embedder.flush()
+            print(f"[ML_model] Кеш ембеддингів: з кешу {embedder.hits}, закодовано {embedder.misses}")
+        if args.parity_check and args.backend != "torch" and spec["kind"] == "hf-mean":
+            sample = [normalize_for_embed(q) for q in q_texts[:PARITY_SAMPLE // 2]]
+            sample += [v for g in gid_list_all for v in verbalizers[g]][:PARITY_SAMPLE - len(sample)]
+            if sample:
+                rep = parity_report(get_embedder(args.model, None, args.backend, args.onnx_dir),
+                                    get_embedder(args.model, None, "torch"), sample, args.max_length)
+                print(f"[ML_model] Паритет {args.backend} vs fp32 на {rep['n']} текстах: "
+                      f"cos сер. {rep['mean_cos']:.5f}, мін. {rep['min_cos']:.5f}, макс. дрейф {rep['max_drift']:.5f}")
+
+        # 1) Підготовка по рядках: правила, що потребують тексту, записуються у маски та бусти
+        Q = len(q_idxs)
+        cand_mask = torch.zeros((Q, G), dtype=torch.bool)
+        boosts = torch.zeros((Q, G))
+        mentions = torch.zeros((Q, G))
+        decided: Dict[int, Tuple[str, Dict]] = {}
+        pending: List[Tuple[int, Dict]] = []
+        for qi, qidx in enumerate(q_idxs):
+            m = TAG_ANY.match(lines[qidx])
+            if args.only_unknown and (not m or m.group(2) != "?"):
+                continue
+            body_norm = normalize_for_embed(m.group(3) if m else "")
+            dprint(f"[DEBUG] classify idx={qidx} body[:60]=", (body_norm or "")[:60])
             filters_applied: List[str] = []
             # 0) Явне правило: «дієслово мовлення + Ім'я» на початку рядка
             gid_rule = explicit_speaker_by_rule(body_norm, name_forms_inv)
             if gid_rule:
-                dprint("[DEBUG] explicit rule ->", gid_rule)
-                return gid_rule, {"reason": "explicit_verb_name", "top": [(gid_rule, 1.0)], "best": 1.0, "margin": 1.0,
-                                  "cand_pool_before": pool_before, "filters_applied": ",".join(filters_applied)}
+                decided[qi] = (gid_rule, {"reason": "explicit_verb_name", "top": [(gid_rule, 1.0)], "best": 1.0,
+                                          "margin": 1.0, "cand_pool_before": len(gid_list_all),
+                                          "filters_applied": ""})
+                continue
 
-            # 1) контекстні кандидати
-            context_cands = collect_context_candidates(idx, lines, args.ctx_lines, name_forms_inv)
+            # контекстні кандидати
+            context_cands = collect_context_candidates(qidx, lines, args.ctx_lines, name_forms_inv, mention_table)
             pool_before = len(context_cands) if context_cands else len(gid_list_all)
-            cand_gids = context_cands if context_cands else list(gid_list_all)
-            # Відфільтрувати сміттєві кандидати, залишити лише #gN
-            cand_gids = [g for g in cand_gids if valid_gid(g)] or list(gid_list_all)
-            dprint("[DEBUG] cand_gids:", cand_gids[:10])
+            cand_gids = [g for g in context_cands if valid_gid(g) and g in col_of] or list(gid_cols)
 
-            # 2) звертання
+            # звертання
             addr_gid = find_addressee(body_norm, name_forms_inv)
             if addr_gid and addr_gid in cand_gids and len(cand_gids) > 1:
                 cand_gids = [g for g in cand_gids if g != addr_gid]
                 filters_applied.append("addressee")
 
-            # 3) фільтр за родом (за наявності)
+            # фільтр за родом (за наявності)
             if not args.no_gender_filter:
-                hint = gender_hint(lines[idx - 1] if idx - 1 >= 0 else "") or gender_hint(body_norm)
+                hint = gender_hint(lines[qidx - 1] if qidx - 1 >= 0 else "") or gender_hint(body_norm)
                 if hint:
-                    filtered = []
-                    for g in cand_gids:
-                        gmeta = legend.get(g, {})
-                        if gmeta.get("gender") in (hint, None):
-                            filtered.append(g)
+                    filtered = [g for g in cand_gids if legend.get(g, {}).get("gender") in (hint, None)]
                     if filtered:
                         cand_gids = filtered
                         filters_applied.append("gender")
 
+            meta = {"cand_pool_before": pool_before, "filters_applied": ",".join(filters_applied), "lexical": None}
             if not cand_gids:
-                return "#g?", {"reason": "no_candidates", "top": [], "best": 0.0, "margin": 0.0,
-                               "cand_pool_before": pool_before, "filters_applied": ",".join(filters_applied)}
-
-            # обчислення sim по множині вербалізаторів кожного кандидата
-            cand_list = list(cand_gids)
-            sims = []
-            for g in cand_list:
-                embs = verb_embs_all.get(g)
-                if embs is None or embs.numel() == 0:
-                    embs = embedder.encode([normalize_for_embed(gid2name.get(g, g))])
-                    verb_embs_all[g] = embs
-                s = agg_sim(qvec, embs, args.agg_topk)
-                sims.append(s)
-            sim = torch.tensor(sims)
-            dprint("[DEBUG] sim shape:", tuple(sim.shape))
+                decided[qi] = ("#g?", {"reason": "no_candidates", "top": [], "best": 0.0, "margin": 0.0, **meta})
+                continue
+            for g in cand_gids:
+                cand_mask[qi, col_of[g]] = True
 
-            # 4) бусти
-            boosts = torch.zeros_like(sim)
-            # 4.1 Верб мовлення в рядку → невеликий бонус
+            # бусти: верб мовлення, сусідні відомі спікери, згадки у контексті
+            row = boosts[qi]
             if _has_speech_verb(body_norm):
-                boosts += 0.03
-            # 4.2 Попередній/наступний відомий спікер поруч
-            prev_gid = prev_speaker_up_to.get(idx)
-            next_gid = prev_speaker_up_to.get(idx + 1)
-            if prev_gid and prev_gid in cand_list:
-                boosts[cand_list.index(prev_gid)] += 0.06
-            if next_gid and next_gid in cand_list:
-                boosts[cand_list.index(next_gid)] += 0.03
-            # 4.3 Згадки персонажів у поточному контексті → підсилення їх кандидатів
-            mention_counts = count_context_mentions(idx, lines, args.ctx_lines, name_forms_inv)
-            for gi, g in enumerate(cand_list):
-                weight_sum = mention_counts.get(g, 0.0)
-                if weight_sum:
-                    boosts[gi] += min(0.30, 0.04 * weight_sum)
-            # 4.4 Для явних лексичних хітів (імен/аліасів у рядку) — максимальний бонус 0.70
-            rx_word = re.compile(r"[A-Za-zА-Яа-яЇїІіЄєҐґ][\w’']+")
-            lexical_hit = None
-            addr_gid_for_hits = addr_gid
-            for tok in rx_word.findall(body_norm or ""):
+                row += 0.03
+            prev_gid = prev_speaker_up_to.get(qidx)
+            next_gid = prev_speaker_up_to.get(qidx + 1)
+            if prev_gid in col_of:
+                row[col_of[prev_gid]] += 0.06
+            if next_gid in col_of:
+                row[col_of[next_gid]] += 0.03
+            for g, weight_sum in count_context_mentions(qidx, lines, args.ctx_lines, name_forms_inv,
+                                                        mention_table).items():
+                if weight_sum and g in col_of:
+                    mentions[qi, col_of[g]] = weight_sum
+                    row[col_of[g]] += min(0.30, 0.04 * weight_sum)
+            # явні лексичні хіти (імена/аліаси у рядку) додають кандидата з фіксованим бустом
+            for tok in _WORD_RX.findall(body_norm or ""):
                 gid_hit = name_forms_inv.get(tok.lower())
-                if not gid_hit or not valid_gid(gid_hit):
+                if not gid_hit or not valid_gid(gid_hit) or gid_hit not in col_of or gid_hit == addr_gid:
                     continue
-                if addr_gid_for_hits and gid_hit == addr_gid_for_hits:
-                    continue
-                if gid_hit not in cand_list:
-                    cand_list.append(gid_hit)
-                    # ініціалізувати ембеди вербалізаторів для нового кандидата
-                    if gid_hit not in verb_embs_all:
-                        rec = legend.get(gid_hit, {"names": [gid2name.get(gid_hit, gid_hit)], "aliases": []})
-                        verbalizers[gid_hit] = generate_verbalizers(gid_hit, rec)
-                        verb_embs_all[gid_hit] = embedder.encode(verbalizers[gid_hit], batch_size=32, max_length=args.max_length)
-                    # розширити sim та boosts синхронно
-                    s_hit = agg_sim(qvec, verb_embs_all[gid_hit], args.agg_topk)
-                    sim = torch.cat([sim, torch.tensor([s_hit])], dim=0)
-                    boosts = torch.cat([boosts, torch.zeros(1, dtype=sim.dtype)], dim=0)
-                boosts[cand_list.index(gid_hit)] = float(args.lexical_boost)
-                lexical_hit = gid_hit
-            # 4.5 Штраф за "нового" мовця
+                cand_mask[qi, col_of[gid_hit]] = True
+                row[col_of[gid_hit]] = float(args.lexical_boost)
+                meta["lexical"] = gid_hit
+            pending.append((qi, meta))
+
+        # 2) Векторизоване скорування усіх рядків, що лишилися
+        if pending:
+            r = torch.tensor([qi for qi, _ in pending], dtype=torch.long)
+            mask = cand_mask[r]
+            ment = mentions[r] > 0
+            b = boosts[r]
+            # штраф за "нового" мовця
             if args.novelty_penalty > 0 and first_seen_idx:
-                any_spoken_before = any(first_seen_idx.get(g, 10**9) < idx for g in cand_list)
-                if any_spoken_before:
-                    for gi, g in enumerate(cand_list):
-                        if first_seen_idx.get(g, 10**9) >= idx:
-                            pen = args.novelty_penalty * (0.5 if mention_counts.get(g, 0) else 1.0)
-                            boosts[gi] -= pen
-
-            final = sim + boosts
-            order = torch.argsort(final, descending=True).tolist()
-            dprint("[DEBUG] final top candidates:", [(cand_list[k], float(final[k])) for k in order[:min(5, len(order))]])
-            if not order:
-                return "#g?", {"reason": "no_scores", "top": [], "best": 0.0, "margin": 0.0,
-                               "cand_pool_before": pool_before, "filters_applied": ",".join(filters_applied)}
-
-            margin = float(final[order[0]].item() - final[order[1]].item()) if len(order) > 1 else 0.0
-            best_gid = normalize_gid(cand_list[order[0]])
-            best_cos = float(final[order[0]].item())
-            topk = [(normalize_gid(cand_list[k]), float(final[k].item())) for k in order[:max(1, args.topk)]]
-
-            if lexical_hit is not None and normalize_gid(lexical_hit) == best_gid:
-                return best_gid, {"reason": "lexical_hit", "top": topk, "best": best_cos, "margin": margin,
-                                  "cand_pool_before": pool_before, "filters_applied": ",".join(filters_applied)}
-
-            if args.force_when_single and len(cand_list) == 1:
-                return best_gid, {"reason": "force_single", "top": topk, "best": best_cos, "margin": margin,
-                                  "cand_pool_before": pool_before, "filters_applied": ",".join(filters_applied)}
-            if (best_cos >= args.threshold) and (margin >= args.min_margin):
-                return best_gid, {"reason": "threshold", "top": topk, "best": best_cos, "margin": margin,
-                                  "cand_pool_before": pool_before, "filters_applied": ",".join(filters_applied)}
-            if any(mention_counts.get(g, 0) for g in cand_list) and best_cos >= (args.threshold - 0.02):
-                return best_gid, {"reason": "mention_boost", "top": topk, "best": best_cos, "margin": margin,
-                                  "cand_pool_before": pool_before, "filters_applied": ",".join(filters_applied)}
-            return "#g?", {"reason": "low_conf", "top": topk, "best": best_cos, "margin": margin,
-                           "cand_pool_before": pool_before, "filters_applied": ",".join(filters_applied)}
+                first_seen = torch.tensor([float(first_seen_idx.get(g, 10**9)) for g in gid_cols])
+                pos = torch.tensor([float(q_idxs[qi]) for qi, _ in pending]).unsqueeze(1)
+                spoken = first_seen.unsqueeze(0) < pos
+                any_before = (spoken & mask).any(dim=1, keepdim=True)
+                pen = args.novelty_penalty * (1.0 - 0.5 * ment.float())
+                b = b - pen * (any_before & mask & ~spoken).float()
+            final = (agg[r] + b).masked_fill(~mask, float("-inf"))
+            if args.second_model:
+                # Каскад: друга модель бачить лише невпевнені рядки (або всі — ensemble=full);
+                # кандидати, бусти й штрафи ті самі, зливаються лише скори моделей
+                n_c = mask.sum(dim=1)
+                if args.ensemble == "full" or G < 2:
+                    esc = n_c > 0
+                else:
+                    top2 = torch.topk(final, k=2, dim=1).values
+                    esc_margin = args.min_margin if args.escalate_margin is None else args.escalate_margin
+                    esc = (n_c > 1) & ((top2[:, 0] - top2[:, 1]) < esc_margin)
+                e = esc.nonzero(as_tuple=True)[0]
+                if len(e):
+                    spec2 = resolve_model(args.second_model)
+                    second = get_embedder(args.second_model, None if args.no_emb_cache else args.emb_cache,
+                                          args.backend if spec2["kind"] == "hf-mean" else "torch", args.onnx_dir)
+                    agg2 = score_queries(second, spec2, [q_norm[int(qi)] for qi in r[e]], verbalizers,
+                                         gid_cols, gid2name, args)
+                    if isinstance(second, CachedEmbedder):
+                        second.flush()
+                    w = float(args.ensemble_weight)
+                    fused = (1.0 - w) * agg[r[e]] + w * agg2
+                    final[e] = (fused + b[e]).masked_fill(~mask[e], float("-inf"))
+                print(f"[ML_model] Ансамбль ({args.ensemble}): {args.second_model} для {len(e)} з {len(pending)} рядків")
+            k = min(G, max(2, args.topk))
+            top_vals, top_cols = torch.topk(final, k=k, dim=1)
+            n_cand = mask.sum(dim=1).tolist()
+            any_mention = (ment & mask).any(dim=1).tolist()
+            top_vals, top_cols = top_vals.tolist(), top_cols.tolist()
+
+            for j, (qi, meta) in enumerate(pending):
+                n = min(n_cand[j], k)
+                vals, cols = top_vals[j][:n], top_cols[j][:n]
+                dprint("[DEBUG] final top candidates:", [(gid_cols[c], v) for c, v in zip(cols, vals)][:5])
+                best_cos = float(vals[0])
+                margin = float(vals[0] - vals[1]) if n_cand[j] > 1 else 0.0
+                best_gid = normalize_gid(gid_cols[cols[0]])
+                topk = [(normalize_gid(gid_cols[c]), float(v)) for c, v in zip(cols, vals)][:max(1, args.topk)]
+                lexical_hit = meta.pop("lexical")
+                info = {"top": topk, "best": best_cos, "margin": margin, **meta}
+                if lexical_hit is not None and normalize_gid(lexical_hit) == best_gid:
+                    decided[qi] = (best_gid, {"reason": "lexical_hit", **info})
+                elif args.force_when_single and n_cand[j] == 1:
+                    decided[qi] = (best_gid, {"reason": "force_single", **info})
+                elif (best_cos >= args.threshold) and (margin >= args.min_margin):
+                    decided[qi] = (best_gid, {"reason": "threshold", **info})
+                elif any_mention[j] and best_cos >= (args.threshold - 0.02):
+                    decided[qi] = (best_gid, {"reason": "mention_boost", **info})
+                else:
+                    decided[qi] = ("#g?", {"reason": "low_conf", **info})
 
-        # --- Обробка усіх #g? ---
+        # --- Застосування рішень до усіх #g? ---
         for qi, qidx in enumerate(q_idxs):
-            m = TAG_ANY.match(lines[qidx])
-            if args.only_unknown and (not m or m.group(2) != "?"):
+            if qi not in decided:
                 continue
-            body = m.group(3) if m else ""
-            qv = q_emb[qi:qi + 1]
+            decision, info = decided[qi]
             total_unknown += 1
-            decision, info = classify(qidx, qv, q_texts[qi], body, first_seen_idx)
             if decision != "#g?":
                 replace_line_gid(lines, qidx, normalize_gid(decision))
                 changed += 1
@@ -891,7 +1584,7 @@ def main():
                 return gid_rule, {"reason": "explicit_verb_name", "top": [(gid_rule, 1.0)], "best": 1.0, "margin": 1.0,
                                   "cand_pool_before": pool_before, "filters_applied": ",".join(filters_applied)}
 
-            context_cands = collect_context_candidates(idx, lines, args.ctx_lines, name_forms_inv)
+            context_cands = collect_context_candidates(idx, lines, args.ctx_lines, name_forms_inv, mention_table)
             pool_before = len(context_cands) if context_cands else len(gid_list_all)
             cand_gids = context_cands if context_cands else list(gid_list_all)
             cand_gids = [g for g in cand_gids if valid_gid(g)] or list(gid_list_all)
@@ -949,7 +1642,7 @@ def main():
                 boosts[cand_list.index(prev_gid)] += 0.06
             if next_gid and next_gid in cand_list:
                 boosts[cand_list.index(next_gid)] += 0.03
-            mention_counts = count_context_mentions(idx, lines, args.ctx_lines, name_forms_inv)
+            mention_counts = count_context_mentions(idx, lines, args.ctx_lines, name_forms_inv, mention_table)
             for gi, g in enumerate(cand_list):
                 weight_sum = mention_counts.get(g, 0.0)
                 if weight_sum:
@@ -1095,10 +1788,39 @@ def main():
                     f"{r['line']}\t{r['decision']}\t{r['best_gid']}\t{r['best_score']:.3f}\t{r['margin']:.3f}\t{top_str}\t{r['query']}\t{r.get('reason','')}\t{r.get('cand_pool_before','')}\t{r.get('cand_pool_after','')}\t{r.get('filters_applied','')}\n"
                 )
 
+    if USE_HF and hasattr(embedder, "flush"):
+        embedder.flush()  # вербалізатори, дозакодовані під час скорування
+
     print(f"[ML_model] Готово. Записано ->", args.out)
     print(f"[ML_model] Невідомих мовців: {total_unknown}, замінено: {changed}")
     if args.log:
         print("[ML_model] Log ->", args.log)
+    return {"out": args.out, "log": args.log, "total_unknown": total_unknown, "changed": changed}
+
+def process_file(input_path: str, legend_path: Optional[str] = None, output_path: Optional[str] = None,
+                 only_unknown: bool = True, log_path: Optional[str] = None, **options) -> Dict:
+    """
+    Програмний виклик без окремого процесу (GUI, плагіни).
+    options — ті самі параметри, що й у CLI (threshold=…, model=…, ctx_lines=…).
+    Модель береться з теплого пулу, тож друга й наступні обробки не завантажують її знову.
+    """
+    argv = ["--in", input_path, "--out", output_path or input_path]
+    if legend_path:
+        argv += ["--legend", legend_path]
+    if log_path:
+        argv += ["--log", log_path]
+    if only_unknown:
+        argv.append("--only_unknown")
+    args = parse_args(argv)
+    for k, v in options.items():
+        if not hasattr(args, k):
+            raise TypeError(f"process_file: невідомий параметр {k!r}")
+        setattr(args, k, v)
+    with _RUN_LOCK:
+        return run(args)
+
+def main(argv: Optional[List[str]] = None):
+    return run(parse_args(argv))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file